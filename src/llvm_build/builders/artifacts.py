@@ -0,0 +1,339 @@
+import bz2
+import fnmatch
+import gzip
+import hashlib
+import logging
+import lzma
+import os
+import shutil
+import subprocess
+import sys
+import tarfile
+from argparse import ArgumentParser, Namespace
+from collections.abc import Iterator, Sequence
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import IO
+
+from llvm_build.common.utils import LoggerMixin
+
+# First member of packages: "<sha256>  <path>" per regular file, the
+# format of sha256sum, so that `sha256sum -c` checks an extracted package
+CHECKSUM_MANIFEST_NAME = "SHA256SUMS"
+_chunkSize = 1 << 20
+
+# Magic bytes -> codec, and the commands decompressing it to stdout, those
+# using several threads first
+_codecs: list[tuple[bytes, str, list[list[str]]]] = [
+    (b"\xfd7zXZ\x00", "xz", [["xz", "-dc", "-T0"]]),
+    (b"\x28\xb5\x2f\xfd", "zstd", [["zstd", "-dc"]]),
+    (b"\x1f\x8b", "gzip", [["pigz", "-dc"], ["gzip", "-dc"]]),
+    (b"BZh", "bzip2", [["lbzip2", "-dc"], ["bzip2", "-dc"]]),
+]
+_pythonDecompressors = {"xz": lzma.open, "gzip": gzip.open, "bzip2": bz2.open}
+
+
+def _hashFile(path: Path) -> str:
+    with open(path, "rb") as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()
+
+
+def writeChecksumManifest(installDir: Path, manifestPath: Path) -> int:
+    """Hash the regular files of installDir into a manifest, several at a
+    time, and return their number"""
+    files = sorted(
+        os.path.relpath(os.path.join(dirPath, name), installDir)
+        for dirPath, _, names in os.walk(installDir)
+        for name in names
+        if os.path.isfile(os.path.join(dirPath, name))
+        and not os.path.islink(os.path.join(dirPath, name))
+    )
+    with ThreadPoolExecutor() as executor:
+        digests = executor.map(lambda f: _hashFile(installDir / f), files)
+        manifestPath.write_text(
+            "".join(
+                f"{digest}  {name}\n"
+                for digest, name in zip(digests, files, strict=True)
+            )
+        )
+    return len(files)
+
+
+def parseChecksumManifest(text: str) -> dict[str, str]:
+    checksums: dict[str, str] = dict()
+    for line in text.splitlines():
+        digest, sep, name = line.partition("  ")
+        if sep:
+            checksums[os.path.normpath(name.lstrip("*"))] = digest
+    return checksums
+
+
+def detectCodec(archive: Path) -> str | None:
+    """Compression of archive by its magic bytes; None for a plain tar"""
+    with open(archive, "rb") as f:
+        head = f.read(8)
+    for magic, codec, _ in _codecs:
+        if head.startswith(magic):
+            return codec
+    return None
+
+
+@contextmanager
+def _decompressed(archive: Path, codec: str | None) -> Iterator[IO[bytes]]:
+    """Stream of the tar inside archive, decompressed by an external tool
+    running alongside the extraction where one is installed"""
+    if codec is None:
+        with open(archive, "rb") as f:
+            yield f
+        return
+    commands = next(commands for _, name, commands in _codecs if name == codec)
+    command = next((c for c in commands if shutil.which(c[0])), None)
+    if command is None:
+        if codec not in _pythonDecompressors:
+            raise RuntimeError(f"no decompressor for {codec} installed")
+        with _pythonDecompressors[codec](archive, "rb") as f:
+            yield f
+        return
+    with open(archive, "rb") as f:
+        proc = subprocess.Popen(command, stdin=f, stdout=subprocess.PIPE)
+    assert proc.stdout is not None
+    try:
+        yield proc.stdout
+        # tar stops at its end marker, before the padding after it
+        while proc.stdout.read(_chunkSize):
+            pass
+    finally:
+        # Stop reading early, e.g. on a checksum mismatch
+        proc.stdout.close()
+        returncode = proc.wait()
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, command)
+
+
+@dataclass
+class UnpackStats:
+    written: int = 0
+    # Existing files whose checksum matches the manifest
+    unchanged: int = 0
+    # Members not selected by the globs
+    skipped: int = 0
+    verified: int = 0
+
+
+class ArtifactUnpacker(LoggerMixin):
+    """Extract selected members of a package in one streaming pass: the
+    archive is decompressed while it is read and every member is written as
+    soon as it arrives, so that members which are not needed cost only
+    their decompression. Regular files are checked against the checksum
+    manifest of the package while they are written, and those already in
+    place with the recorded checksum are left alone."""
+
+    _destDir: Path
+    _include: list[str]
+    _exclude: list[str]
+    _stripComponents: int
+    _verify: bool
+
+    def __init__(
+        self,
+        destDir: Path,
+        include: Sequence[str] = (),
+        exclude: Sequence[str] = (),
+        stripComponents: int = 0,
+        verify: bool = True,
+    ) -> None:
+        super().__init__()
+        self._destDir = destDir
+        self._include = list(include)
+        self._exclude = list(exclude)
+        self._stripComponents = stripComponents
+        self._verify = verify
+
+    @staticmethod
+    def _matches(name: str, patterns: Sequence[str]) -> bool:
+        """A pattern selects a member or a directory holding it"""
+        parts = name.split("/")
+        return any(
+            fnmatch.fnmatchcase("/".join(parts[:i]), pattern)
+            for pattern in patterns
+            for i in range(1, len(parts) + 1)
+        )
+
+    def _selected(self, name: str) -> bool:
+        if self._include and not self._matches(name, self._include):
+            return False
+        return not self._matches(name, self._exclude)
+
+    def _target(self, name: str) -> Path:
+        target = self._destDir / name
+        parent = os.path.realpath(target.parent)
+        root = os.path.realpath(self._destDir)
+        if os.path.commonpath((parent, root)) != root:
+            raise RuntimeError(f"member '{name}' is outside of the archive")
+        return target
+
+    @staticmethod
+    def _writeVerified(
+        stream: IO[bytes],
+        target: Path,
+        member: tarfile.TarInfo,
+        expected: str | None,
+    ) -> str:
+        """Write a member next to target and return its checksum. Target is
+        replaced with it, which works for a running executable too, unless
+        the checksum differs from expected; target is left as it was then."""
+        temporary = target.with_name(f".{target.name}.{os.getpid()}")
+        digest = hashlib.sha256()
+        try:
+            with open(temporary, "wb") as f:
+                while chunk := stream.read(_chunkSize):
+                    digest.update(chunk)
+                    f.write(chunk)
+            if expected is None or digest.hexdigest() == expected:
+                os.chmod(temporary, member.mode & 0o7777)
+                os.utime(temporary, (member.mtime, member.mtime))
+                os.replace(temporary, target)
+        finally:
+            temporary.unlink(missing_ok=True)
+        return digest.hexdigest()
+
+    def unpack(self, archive: Path) -> UnpackStats:
+        codec = detectCodec(archive)
+        self.logger.info("Unpack %s (%s)", archive, codec or "tar")
+        stats = UnpackStats()
+        checksums: dict[str, str] | None = None
+        extracted: set[str] = set()
+        self._destDir.mkdir(parents=True, exist_ok=True)
+        with (
+            _decompressed(archive, codec) as stream,
+            tarfile.open(fileobj=stream, mode="r|") as tar,
+        ):
+            for member in tar:
+                name = os.path.normpath(member.name)
+                if name == CHECKSUM_MANIFEST_NAME and member.isfile():
+                    content = tar.extractfile(member)
+                    assert content is not None
+                    checksums = parseChecksumManifest(content.read().decode())
+                    continue
+                parts = name.split("/")[self._stripComponents :]
+                if not parts or not self._selected(name):
+                    stats.skipped += 1
+                    continue
+                relative = "/".join(parts)
+                if self._verify and checksums is None and member.isfile():
+                    self.logger.warning(
+                        "%s has no checksum manifest, nothing is verified",
+                        archive,
+                    )
+                    checksums = dict()
+                target = self._target(relative)
+                if member.isdir():
+                    target.mkdir(parents=True, exist_ok=True)
+                    continue
+                target.parent.mkdir(parents=True, exist_ok=True)
+                if member.issym():
+                    if target.is_symlink() or target.exists():
+                        target.unlink()
+                    target.symlink_to(member.linkname)
+                    stats.written += 1
+                elif member.islnk():
+                    source = os.path.normpath(member.linkname)
+                    if source not in extracted:
+                        raise RuntimeError(
+                            f"'{name}' links to '{source}', which is "
+                            "not selected"
+                        )
+                    linkSource = "/".join(
+                        source.split("/")[self._stripComponents :]
+                    )
+                    target.unlink(missing_ok=True)
+                    os.link(self._destDir / linkSource, target)
+                    stats.written += 1
+                elif member.isfile():
+                    expected = (checksums or {}).get(name)
+                    if (
+                        expected is not None
+                        and target.is_file()
+                        and not target.is_symlink()
+                        and target.stat().st_size == member.size
+                        and _hashFile(target) == expected
+                    ):
+                        stats.unchanged += 1
+                        extracted.add(name)
+                        continue
+                    content = tar.extractfile(member)
+                    assert content is not None
+                    if not self._verify:
+                        expected = None
+                    digest = self._writeVerified(
+                        content, target, member, expected
+                    )
+                    if expected is not None:
+                        if digest != expected:
+                            raise RuntimeError(
+                                f"checksum mismatch of '{name}' in {archive}"
+                            )
+                        stats.verified += 1
+                    stats.written += 1
+                else:
+                    stats.skipped += 1
+                    continue
+                extracted.add(name)
+        return stats
+
+
+def _parseArgs(args: Sequence[str]) -> Namespace:
+    parser = ArgumentParser(
+        prog="llvm-build unpack",
+        description="Extract selected files of a package, verifying them "
+        "against its checksum manifest",
+    )
+    parser.add_argument("archive", type=Path)
+    parser.add_argument(
+        "-C",
+        "--directory",
+        type=Path,
+        default=Path("."),
+        help="Directory to extract into",
+    )
+    parser.add_argument(
+        "--include",
+        action="append",
+        default=[],
+        help="Glob of members to extract, e.g. 'bin/clang*'; a directory "
+        "selects everything within it. May be repeated; all by default",
+    )
+    parser.add_argument(
+        "--exclude",
+        action="append",
+        default=[],
+        help="Glob of members not to extract, even if included",
+    )
+    parser.add_argument("--strip-components", type=int, default=0)
+    parser.add_argument(
+        "--no-verify",
+        action="store_true",
+        default=False,
+        help="Do not check files against the checksum manifest",
+    )
+    return parser.parse_args(args)
+
+
+def unpackMain(args: Sequence[str] | None = None) -> None:
+    parsedArgs = _parseArgs(sys.argv[1:] if args is None else args)
+    stats = ArtifactUnpacker(
+        parsedArgs.directory,
+        parsedArgs.include,
+        parsedArgs.exclude,
+        parsedArgs.strip_components,
+        not parsedArgs.no_verify,
+    ).unpack(parsedArgs.archive)
+    logging.getLogger(__file__).info(
+        "%d files written (%d verified), %d unchanged, %d members skipped",
+        stats.written,
+        stats.verified,
+        stats.unchanged,
+        stats.skipped,
+    )
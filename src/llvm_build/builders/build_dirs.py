@@ -0,0 +1,283 @@
+import fcntl
+import json
+import os
+import shutil
+import sys
+import time
+from argparse import ArgumentParser, Namespace
+from collections.abc import Iterable, Iterator, Sequence
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+from llvm_build.common.utils import FileSystemHelper, LoggerMixin
+
+# Files of a build tree that are only needed to link, not to run or install
+_intermediateSuffixes = (".o", ".obj", ".dwo")
+_sizeUnits = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30, "T": 1 << 40}
+
+
+def parseSize(text: str) -> int:
+    """Parse a byte count such as '500G' or '1.5T'"""
+    text = text.strip().upper().removesuffix("B")
+    if text and text[-1] in _sizeUnits:
+        return int(float(text[:-1]) * _sizeUnits[text[-1]])
+    return int(text)
+
+
+def formatSize(size: int) -> str:
+    for unit in ("T", "G", "M", "K"):
+        if size >= _sizeUnits[unit]:
+            return f"{size / _sizeUnits[unit]:.1f}{unit}"
+    return str(size)
+
+
+def _scanFiles(root: Path) -> Iterator[os.DirEntry[str]]:
+    """Yield the files under root without following symlinks"""
+    stack = [str(root)]
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    else:
+                        yield entry
+        except (FileNotFoundError, NotADirectoryError):
+            continue
+
+
+def diskUsage(root: Path) -> int:
+    """Bytes allocated to the files under root, counting hard links once"""
+    total = 0
+    seen: set[tuple[int, int]] = set()
+    for entry in _scanFiles(root):
+        info = entry.stat(follow_symlinks=False)
+        if info.st_nlink > 1:
+            if (info.st_dev, info.st_ino) in seen:
+                continue
+            seen.add((info.st_dev, info.st_ino))
+        total += info.st_blocks * 512
+    return total
+
+
+def removeIntermediates(root: Path, dryRun: bool = False) -> int:
+    """Delete object files, which CMake builds regenerate, and return the
+    bytes freed. The configuration and the linked outputs are kept. With
+    `dryRun`, only count the bytes."""
+    freed = 0
+    for entry in _scanFiles(root):
+        if entry.name.endswith(_intermediateSuffixes) and entry.is_file(
+            follow_symlinks=False
+        ):
+            freed += entry.stat(follow_symlinks=False).st_blocks * 512
+            if not dryRun:
+                os.unlink(entry.path)
+    return freed
+
+
+def _removeTree(root: Path, keep: Path | None) -> None:
+    """Remove root, except keep and the directories leading to it"""
+    if keep is None or not keep.is_relative_to(root):
+        shutil.rmtree(root, ignore_errors=True)
+        return
+    for entry in os.scandir(root):
+        path = Path(entry.path)
+        if path == keep:
+            continue
+        if keep.is_relative_to(path):
+            _removeTree(path, keep)
+        elif entry.is_dir(follow_symlinks=False):
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            path.unlink(missing_ok=True)
+
+
+@dataclass
+class BuildDirEntry:
+    lastUsed: float
+    size: int = 0
+    pinned: bool = False
+    # Whether object files were already removed
+    trimmed: bool = False
+    installDir: str | None = None
+
+
+def defaultRegistryPath() -> Path:
+    cacheHome = os.environ.get("XDG_CACHE_HOME")
+    return (
+        (Path(cacheHome) if cacheHome else Path.home() / ".cache")
+        / "llvm-build"
+        / "build-dirs.json"
+    )
+
+
+class BuildDirRegistry(LoggerMixin):
+    """Last use time and size of every build directory the driver built,
+    used to keep their total size within a disk budget. When over budget,
+    the least recently used directories first lose their object files and
+    are then removed; pinned directories and install trees are kept."""
+
+    _path: Path
+
+    def __init__(self, path: Path | None = None) -> None:
+        super().__init__()
+        self._path = path or defaultRegistryPath()
+
+    @contextmanager
+    def _entries(self) -> Iterator[dict[str, BuildDirEntry]]:
+        """Load the entries under a lock and write them back afterwards"""
+        if not self._path.parent.exists():
+            FileSystemHelper.create_dir(self._path.parent)
+        with open(self._path.with_suffix(".lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            entries: dict[str, BuildDirEntry] = dict()
+            if self._path.is_file():
+                try:
+                    for path, fields in json.loads(
+                        self._path.read_text()
+                    ).items():
+                        entries[path] = BuildDirEntry(**fields)
+                except (json.JSONDecodeError, TypeError):
+                    self.logger.warning(
+                        "ignoring corrupt registry '%s'", self._path
+                    )
+            yield entries
+            temporary = self._path.with_suffix(f".{os.getpid()}.tmp")
+            temporary.write_text(
+                json.dumps(
+                    {path: asdict(entry) for path, entry in entries.items()},
+                    indent=2,
+                )
+            )
+            os.replace(temporary, self._path)
+
+    def use(
+        self, buildDir: Path, installDir: Path | None, pinned: bool
+    ) -> None:
+        with self._entries() as entries:
+            entry = entries.setdefault(str(buildDir), BuildDirEntry(0.0))
+            entry.lastUsed = time.time()
+            entry.pinned = pinned
+            entry.trimmed = False
+            entry.installDir = None if installDir is None else str(installDir)
+
+    def measure(self, buildDirs: Iterable[Path]) -> None:
+        sizes = {str(path): diskUsage(path) for path in buildDirs}
+        with self._entries() as entries:
+            for path, size in sizes.items():
+                if path in entries:
+                    entries[path].size = size
+
+    def collect(
+        self, budget: int, keep: Sequence[Path] = (), dryRun: bool = False
+    ) -> list[str]:
+        """Trim or remove build directories until they fit in budget bytes,
+        returning the directories acted on"""
+        acted: list[str] = []
+        with self._entries() as entries:
+            for path in [p for p in entries if not os.path.isdir(p)]:
+                del entries[path]
+            total = sum(entry.size for entry in entries.values())
+            kept = {str(path) for path in keep}
+            candidates = sorted(
+                (
+                    (path, entry)
+                    for path, entry in entries.items()
+                    if not entry.pinned and path not in kept
+                ),
+                key=lambda item: item[1].lastUsed,
+            )
+            # Bytes a dry run would have trimmed, still counted in the sizes
+            trimmedBytes: dict[str, int] = dict()
+            # Trimming keeps a directory configured and its binaries usable,
+            # so it is tried on every candidate before anything is removed
+            for removing in (False, True):
+                for path, entry in candidates:
+                    if total <= budget:
+                        return acted
+                    if removing:
+                        self.logger.info(
+                            "Remove '%s' (%s)", path, formatSize(entry.size)
+                        )
+                        installDir = (
+                            Path(entry.installDir) if entry.installDir else None
+                        )
+                        # An install tree inside the directory stays
+                        installBytes = (
+                            diskUsage(installDir)
+                            if installDir is not None
+                            and installDir.is_relative_to(path)
+                            else 0
+                        )
+                        if not dryRun:
+                            _removeTree(Path(path), installDir)
+                            del entries[path]
+                        total -= max(
+                            0,
+                            entry.size
+                            - trimmedBytes.get(path, 0)
+                            - installBytes,
+                        )
+                    elif not entry.trimmed:
+                        self.logger.info("Remove object files of '%s'", path)
+                        freed = removeIntermediates(Path(path), dryRun)
+                        total -= freed
+                        if dryRun:
+                            trimmedBytes[path] = freed
+                        else:
+                            entry.size = diskUsage(Path(path))
+                            entry.trimmed = True
+                    else:
+                        continue
+                    acted.append(path)
+            if total > budget:
+                self.logger.warning(
+                    "build directories still use %s of %s",
+                    formatSize(total),
+                    formatSize(budget),
+                )
+        return acted
+
+    def report(self) -> list[tuple[str, BuildDirEntry]]:
+        with self._entries() as entries:
+            return sorted(
+                entries.items(), key=lambda item: item[1].lastUsed, reverse=True
+            )
+
+
+def _parseArgs(args: Sequence[str]) -> Namespace:
+    parser = ArgumentParser(
+        prog="llvm-build gc",
+        description="Keep build directories within a disk budget",
+    )
+    parser.add_argument(
+        "--budget",
+        type=parseSize,
+        default=None,
+        help="Total size of build directories, e.g. 300G; defaults to "
+        "$LLVM_BUILD_DISK_BUDGET, without a budget only list them",
+    )
+    parser.add_argument("--dry-run", action="store_true", default=False)
+    parser.add_argument("--registry", type=Path, default=None)
+    return parser.parse_args(args)
+
+
+def main(args: Sequence[str] | None = None) -> None:
+    parsedArgs = _parseArgs(sys.argv[1:] if args is None else args)
+    registry = BuildDirRegistry(parsedArgs.registry)
+    budget = parsedArgs.budget
+    if budget is None and os.environ.get("LLVM_BUILD_DISK_BUDGET"):
+        budget = parseSize(os.environ["LLVM_BUILD_DISK_BUDGET"])
+    if budget is not None:
+        registry.collect(budget, dryRun=parsedArgs.dry_run)
+    for path, entry in registry.report():
+        flags = "".join(
+            flag
+            for flag, isSet in (("P", entry.pinned), ("T", entry.trimmed))
+            if isSet
+        )
+        print(
+            f"{time.strftime('%Y-%m-%d %H:%M', time.localtime(entry.lastUsed))}"
+            f"  {formatSize(entry.size):>8}  {flags:2}  {path}"
+        )
@@ -14,6 +14,7 @@ from llvm_build.common.llvm import (
     LLVMSanitizer,
     LLVMTarget,
 )
+from llvm_build.common.process import ProcessRunner, runSync, writerSink
 from llvm_build.common.utils import LoggerMixin
 
 
@@ -342,11 +343,14 @@ class LLVMCMakeBuilder(LoggerMixin):
         self, binFile: Path, args: list[str], logFile: Path
     ):
         self._keep_regular_file_if_existent(logFile, True)
-        with logFile.open("w") as outErrorFile:
-            proc = subprocess.run(
-                args=[binFile, *args], stdout=outErrorFile, stderr=outErrorFile
+        with logFile.open("wb") as outErrorFile:
+            sink = writerSink(outErrorFile)
+            returncode = runSync(
+                ProcessRunner(
+                    [binFile, *args], stdoutSink=sink, stderrSink=sink
+                ).run()
             )
-        if proc.returncode != 0:
+        if returncode != 0:
             with logFile.open("r") as outErrorFile:
                 shutil.copyfileobj(outErrorFile, sys.stderr)
-            proc.check_returncode()
+            raise subprocess.CalledProcessError(returncode, [binFile, *args])
@@ -0,0 +1,192 @@
+import os
+from pathlib import Path
+from typing import Annotated, Any
+
+from pydantic import AfterValidator, BaseModel, ConfigDict
+
+from llvm_build.common.base_builders import BuilderKind
+from llvm_build.toolchain import ToolchainKind
+
+
+def resolveProjectPath(path: Path) -> Path:
+    if path.is_absolute():
+        return path.resolve()
+    else:
+        rootDir = Path(os.path.dirname(__file__)) / ".."
+        return (rootDir / path).resolve()
+
+
+def _resolvePath(path: Path | None) -> Path | None:
+    if path is None:
+        return None
+    return resolveProjectPath(path)
+
+
+class CompilerOptionConfig(BaseModel):
+    model_config = ConfigDict(frozen=True, defer_build=True)
+
+    cflags: list[str] = []
+    cxxflags: list[str] = []
+    ldflags: list[str] = []
+
+
+_NullableProjectRootBasedPath = Annotated[
+    Path | None, AfterValidator(_resolvePath)
+]
+_NonNullableProjectRootBasedPath = Annotated[
+    Path, AfterValidator(resolveProjectPath)
+]
+
+
+class ToolchainConfig(BaseModel):
+    model_config = ConfigDict(frozen=True, defer_build=True)
+
+    name: ToolchainKind
+    installDir: _NullableProjectRootBasedPath = None
+    targetPrefix: str = ""
+    # Target root filesystem of cross builds, also used to run them in qemu
+    sysroot: _NullableProjectRootBasedPath = None
+
+
+class BuildToolConfig(BaseModel):
+    model_config = ConfigDict(frozen=True, defer_build=True)
+
+    name: BuilderKind
+    customConfigureOptions: dict[str, str] = dict()
+    customBuildOptions: dict[str, str] = dict()
+    customInstallOptions: dict[str, str] = dict()
+    # LLVM_DISTRIBUTION_COMPONENTS; if set, only these are built and installed
+    distributionComponents: list[str] = []
+    # Targets such as check-llvm run by --test, with their lit tests split
+    # into testShards processes (one per build job by default)
+    checkTargets: list[str] = []
+    testShards: int | None = None
+    # Source path prefixes -> test directories, both relative to the
+    # repository, tried before the built-in rules of --changed-since
+    testSelectionRules: dict[str, list[str]] = {}
+    # Seconds a configure, build or install command may run, or go without
+    # printing anything, before it is terminated
+    timeout: float | None = None
+    inactivityTimeout: float | None = None
+    # Times a build whose jobs were OOM-killed is resumed with half the jobs
+    oomRetries: int = 2
+    # Preset the configure checks of fresh build directories with the
+    # results of former configures with the same compilers and flags
+    checkCache: bool = True
+
+
+class CompileTimeConfig(BaseModel):
+    model_config = ConfigDict(frozen=True, defer_build=True)
+
+    repetitions: int = 3
+    traceGranularity: int = 500
+    # Passed as TEST_SUITE_SUBDIRS, i.e. the CTMark subset by default
+    subdirs: list[str] = ["CTMark"]
+    outputDir: _NullableProjectRootBasedPath = None
+    jobs: int | None = None
+
+
+class PerfCountersConfig(BaseModel):
+    model_config = ConfigDict(frozen=True, defer_build=True)
+
+    # Defaults to hardware and software events of perf_counters
+    events: list[str] | None = None
+    # Drop events the configuring host cannot count
+    probe: bool = True
+
+
+class QemuUserConfig(BaseModel):
+    model_config = ConfigDict(frozen=True, defer_build=True)
+
+    qemu: str = "qemu-riscv64"
+    # e.g. "rv64,v=true,vlen=256"
+    cpu: str | None = None
+    # Path to the insn plugin (libinsn.so) of qemu to count instructions
+    plugin: _NullableProjectRootBasedPath = None
+    libraryPaths: list[_NonNullableProjectRootBasedPath] = []
+
+
+class SharedFrontendConfig(BaseModel):
+    model_config = ConfigDict(frozen=True, defer_build=True)
+
+    # Variants that should share bitcode must use the same directory
+    cacheDir: _NonNullableProjectRootBasedPath
+    # Defaults to the GlobalISel switches of bitcode_launcher
+    codegenFlags: list[str] | None = None
+
+
+class NativeToolsConfig(BaseModel):
+    model_config = ConfigDict(frozen=True, defer_build=True)
+
+    # Shared by the cross builds reusing the host tools; defaults to
+    # $XDG_CACHE_HOME/llvm-build/native-tools
+    cacheDir: _NullableProjectRootBasedPath = None
+    # Host compilers, found like CMake finds them if not set
+    cc: str | None = None
+    cxx: str | None = None
+
+
+class RuntimeTargetConfig(BaseModel):
+    model_config = ConfigDict(frozen=True, defer_build=True)
+
+    triple: str
+    sysroot: _NullableProjectRootBasedPath = None
+    compilerOption: CompilerOptionConfig | None = None
+    customConfigureOptions: dict[str, str] = dict()
+
+
+class RuntimesConfig(BaseModel):
+    model_config = ConfigDict(frozen=True, defer_build=True)
+
+    # LLVM_ENABLE_RUNTIMES of every triple
+    runtimes: list[str]
+    targets: list[RuntimeTargetConfig]
+    # Holds a build directory per triple; defaults to the build directory
+    # of the project with a "-runtimes" suffix
+    buildDir: _NullableProjectRootBasedPath = None
+    # Defines of every triple, before those of the triple
+    customConfigureOptions: dict[str, str] = dict()
+
+
+class SourceConfig(BaseModel):
+    model_config = ConfigDict(frozen=True, defer_build=True)
+
+    # Bare mirror holding all revisions; created from url if missing
+    mirrorDir: _NonNullableProjectRootBasedPath
+    url: str | None = None
+    # Worktree of the mirror, srcDir is usually a directory within it
+    checkoutDir: _NonNullableProjectRootBasedPath
+    revision: str = "main"
+    # Use the mirror as it is instead of fetching first
+    offline: bool = False
+    # Only check out the llvm-project directories the CMake defines need
+    sparse: bool = False
+    extraDirs: list[str] = []
+
+
+class ProjectConfig(BaseModel):
+    model_config = ConfigDict(frozen=True, defer_build=True)
+
+    name: str
+    description: str = ""
+    srcDir: _NonNullableProjectRootBasedPath
+    source: SourceConfig | None = None
+    buildDir: _NonNullableProjectRootBasedPath
+    # Never trimmed or removed to stay within the disk budget
+    pinBuildDir: bool = False
+    installDir: _NullableProjectRootBasedPath = None
+    packagePathPrefix: _NullableProjectRootBasedPath = None
+    compilerOption: CompilerOptionConfig | None = None
+    buildTool: BuildToolConfig
+    toolchain: ToolchainConfig
+    compileTime: CompileTimeConfig | None = None
+    perfCounters: PerfCountersConfig | None = None
+    sharedFrontend: SharedFrontendConfig | None = None
+    qemuUser: QemuUserConfig | None = None
+    # Host tools of cross builds, built once per revision and host compilers
+    nativeTools: NativeToolsConfig | None = None
+    # Runtimes built per triple with the installed compiler, after install
+    runtimes: RuntimesConfig | None = None
+    # Axis name -> value name -> config fragment merged into the rest of the
+    # config; every combination of values is one variant
+    matrix: dict[str, dict[str, dict[str, Any]]] | None = None
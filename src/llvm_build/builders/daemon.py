@@ -0,0 +1,447 @@
+import itertools
+import json
+import logging
+import os
+import queue
+import shutil
+import socket
+import socketserver
+import subprocess
+import sys
+import threading
+import time
+from argparse import ArgumentError, ArgumentParser, Namespace
+from collections.abc import Sequence
+from pathlib import Path
+from typing import Any
+
+from llvm_build.builders.driver import BuildSession, runBuild
+from llvm_build.common.utils import LoggerMixin
+
+# Counters of `ccache --print-stats` reported per build
+_ccacheCounters = (
+    "direct_cache_hit",
+    "preprocessed_cache_hit",
+    "cache_miss",
+)
+
+
+def defaultSocketPath() -> Path:
+    runtimeDir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtimeDir:
+        return Path(runtimeDir) / "llvm-build.sock"
+    return Path(f"/tmp/llvm-build-{os.getuid()}.sock")
+
+
+def _ccacheStats() -> dict[str, int] | None:
+    ccache = shutil.which("ccache")
+    if ccache is None:
+        return None
+    proc = subprocess.run(
+        [ccache, "--print-stats"], capture_output=True, text=True
+    )
+    if proc.returncode != 0:
+        return None
+    stats: dict[str, int] = dict()
+    for line in proc.stdout.splitlines():
+        key, _, value = line.partition("\t")
+        if key in _ccacheCounters and value.isdigit():
+            stats[key] = int(value)
+    return stats
+
+
+class _Connection:
+    """A client waiting for events of its build"""
+
+    _file: Any
+    _lock: threading.Lock
+    closed: bool
+
+    def __init__(self, file: Any) -> None:
+        self._file = file
+        self._lock = threading.Lock()
+        self.closed = False
+
+    def send(self, event: dict[str, Any]) -> None:
+        if self.closed:
+            return
+        line = json.dumps(event) + "\n"
+        with self._lock:
+            try:
+                self._file.write(line.encode())
+                self._file.flush()
+            except OSError:
+                # The client went away; the build still runs to completion
+                self.closed = True
+
+
+class BuildRequest:
+    id: int
+    priority: int
+    args: list[str]
+    connection: _Connection
+    done: threading.Event
+
+    def __init__(
+        self,
+        requestId: int,
+        priority: int,
+        args: Sequence[str],
+        connection: _Connection,
+    ) -> None:
+        self.id = requestId
+        self.priority = priority
+        self.args = list(args)
+        self.connection = connection
+        self.done = threading.Event()
+
+    def toJson(self) -> dict[str, Any]:
+        return {"id": self.id, "priority": self.priority, "args": self.args}
+
+
+class _StreamHandler(logging.Handler):
+    """Forward log records of one worker thread to the client of the build
+    it runs"""
+
+    _connection: _Connection
+    _threadId: int
+
+    def __init__(self, connection: _Connection, threadId: int) -> None:
+        super().__init__(logging.INFO)
+        self._connection = connection
+        self._threadId = threadId
+        self.setFormatter(
+            logging.Formatter("[%(asctime)s %(levelname)s] %(message)s")
+        )
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if record.thread != self._threadId:
+            return
+        self._connection.send({"event": "log", "message": self.format(record)})
+
+
+def _requestedJobs(args: Sequence[str]) -> str | None:
+    """The --jobs of build arguments in any spelling argparse accepts, e.g.
+    `--jobs=8`; the arguments are validated when the build runs"""
+    parser = ArgumentParser(add_help=False, exit_on_error=False)
+    parser.add_argument("--jobs", default=None)
+    try:
+        return parser.parse_known_args(args)[0].jobs
+    except ArgumentError:
+        return None
+
+
+class BuildDaemon(LoggerMixin):
+    """Run build requests of all clients on one machine from a single
+    priority queue, so that concurrent users share one job budget. Loaded
+    configs, resolved toolchains and probe results stay warm between
+    builds."""
+
+    _socketPath: Path
+    _jobs: int
+    _workers: int
+    _session: BuildSession
+    _queue: "queue.PriorityQueue[tuple[int, int, BuildRequest | None]]"
+    _ids: "itertools.count[int]"
+    _running: dict[int, BuildRequest]
+    _pending: dict[int, BuildRequest]
+    _lock: threading.Lock
+    _ccacheBaseline: dict[str, int] | None
+    _server: socketserver.ThreadingUnixStreamServer | None
+
+    def __init__(self, socketPath: Path, jobs: int, workers: int = 1) -> None:
+        super().__init__()
+        self._socketPath = socketPath
+        self._jobs = jobs
+        self._workers = workers
+        self._session = BuildSession()
+        self._queue = queue.PriorityQueue()
+        self._ids = itertools.count(1)
+        self._running = dict()
+        self._pending = dict()
+        self._lock = threading.Lock()
+        self._ccacheBaseline = _ccacheStats()
+        self._server = None
+
+    def submit(
+        self, args: Sequence[str], priority: int, connection: _Connection
+    ) -> BuildRequest:
+        args = list(args)
+        if _requestedJobs(args) is None:
+            args.extend(("--jobs", str(max(1, self._jobs // self._workers))))
+        request = BuildRequest(next(self._ids), priority, args, connection)
+        with self._lock:
+            self._pending[request.id] = request
+            position = sum(
+                1 for r in self._pending.values() if r.priority >= priority
+            )
+        # Higher priority first, then first come first served
+        self._queue.put((-priority, request.id, request))
+        connection.send(
+            {"event": "queued", "id": request.id, "position": position}
+        )
+        return request
+
+    def status(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "event": "status",
+                "jobs": self._jobs,
+                "workers": self._workers,
+                "running": [r.toJson() for r in self._running.values()],
+                "queued": [
+                    r.toJson()
+                    for r in sorted(
+                        self._pending.values(),
+                        key=lambda r: (-r.priority, r.id),
+                    )
+                ],
+                "toolchains": len(self._session.toolchains),
+                "configs": len(self._session.configs),
+            }
+
+    def _ccacheDelta(self) -> dict[str, int] | None:
+        stats = _ccacheStats()
+        if stats is None:
+            return None
+        baseline = self._ccacheBaseline or dict()
+        self._ccacheBaseline = stats
+        return {key: stats[key] - baseline.get(key, 0) for key in stats}
+
+    def _run(self, request: BuildRequest) -> None:
+        connection = request.connection
+        handler = _StreamHandler(connection, threading.get_ident())
+        rootLogger = logging.getLogger()
+        rootLogger.addHandler(handler)
+        connection.send({"event": "started", "id": request.id})
+        startTime = time.monotonic()
+        try:
+            runBuild(request.args, self._session)
+        except BaseException as e:
+            self.logger.exception("build %d failed", request.id)
+            connection.send(
+                {"event": "failed", "id": request.id, "error": str(e)}
+            )
+        else:
+            event: dict[str, Any] = {
+                "event": "finished",
+                "id": request.id,
+                "seconds": time.monotonic() - startTime,
+            }
+            # Only meaningful when builds do not overlap
+            if self._workers == 1:
+                ccache = self._ccacheDelta()
+                if ccache is not None:
+                    event["ccache"] = ccache
+            connection.send(event)
+        finally:
+            rootLogger.removeHandler(handler)
+
+    def _work(self) -> None:
+        while True:
+            _, _, request = self._queue.get()
+            if request is None:
+                return
+            with self._lock:
+                self._pending.pop(request.id, None)
+                self._running[request.id] = request
+            try:
+                self._run(request)
+            finally:
+                with self._lock:
+                    self._running.pop(request.id, None)
+                request.done.set()
+
+    def _handle(self, rfile: Any, wfile: Any) -> None:
+        connection = _Connection(wfile)
+        line = rfile.readline()
+        try:
+            message = json.loads(line)
+        except json.JSONDecodeError:
+            connection.send({"event": "error", "error": "malformed request"})
+            return
+        command = message.get("command")
+        if command == "status":
+            connection.send(self.status())
+        elif command == "shutdown":
+            connection.send({"event": "shutdown"})
+            assert self._server is not None
+            threading.Thread(target=self._server.shutdown).start()
+        elif command == "build":
+            request = self.submit(
+                message.get("args", []),
+                int(message.get("priority", 0)),
+                connection,
+            )
+            # Keep the connection open until the build is done
+            request.done.wait()
+        else:
+            connection.send(
+                {"event": "error", "error": f"unknown command: {command}"}
+            )
+
+    def serve(self) -> None:
+        if self._socketPath.exists():
+            if _isListening(self._socketPath):
+                raise RuntimeError(
+                    f"a daemon already listens on '{self._socketPath}'"
+                )
+            self._socketPath.unlink()
+        daemon = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self) -> None:
+                daemon._handle(self.rfile, self.wfile)
+
+        workers = [
+            threading.Thread(target=self._work) for _ in range(self._workers)
+        ]
+        for worker in workers:
+            worker.start()
+        with socketserver.ThreadingUnixStreamServer(
+            str(self._socketPath), Handler
+        ) as server:
+            server.daemon_threads = True
+            self._server = server
+            os.chmod(self._socketPath, 0o600)
+            self.logger.info(
+                "serving on '%s' with %d jobs", self._socketPath, self._jobs
+            )
+            try:
+                server.serve_forever()
+            finally:
+                self._socketPath.unlink(missing_ok=True)
+                self._stopWorkers(workers)
+
+    def _stopWorkers(self, workers: Sequence[threading.Thread]) -> None:
+        """Let running builds finish and fail the queued ones"""
+        for _ in workers:
+            # Sorts before any request
+            self._queue.put((-sys.maxsize, next(self._ids), None))
+        for worker in workers:
+            worker.join()
+        with self._lock:
+            pending = list(self._pending.values())
+            self._pending.clear()
+        for request in pending:
+            request.connection.send(
+                {"event": "failed", "id": request.id, "error": "shutdown"}
+            )
+            request.done.set()
+
+
+def _isListening(socketPath: Path) -> bool:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(str(socketPath))
+        except OSError:
+            return False
+    return True
+
+
+def request(socketPath: Path, message: dict[str, Any]) -> list[dict[str, Any]]:
+    """Send one request to the daemon and return all events it answers
+    with, printing log events as they arrive"""
+    events: list[dict[str, Any]] = []
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(str(socketPath))
+        sock.sendall((json.dumps(message) + "\n").encode())
+        with sock.makefile("rb") as f:
+            for line in f:
+                event = json.loads(line)
+                events.append(event)
+                if event.get("event") == "log":
+                    sys.stdout.write(event["message"] + "\n")
+                else:
+                    sys.stdout.write(json.dumps(event) + "\n")
+                sys.stdout.flush()
+    return events
+
+
+def _parseServeArgs(args: Sequence[str]) -> Namespace:
+    parser = ArgumentParser(
+        prog="llvm-build serve",
+        description="Run builds of all clients of this machine from one queue",
+    )
+    parser.add_argument("--socket", type=Path, default=defaultSocketPath())
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Total number of build jobs of the machine",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of builds run at once, splitting the jobs",
+    )
+    return parser.parse_args(args)
+
+
+def serveMain(args: Sequence[str]) -> None:
+    parsedArgs = _parseServeArgs(args)
+    BuildDaemon(parsedArgs.socket, parsedArgs.jobs, parsedArgs.workers).serve()
+
+
+def _parseSubmitArgs(args: Sequence[str]) -> tuple[Namespace, list[str]]:
+    parser = ArgumentParser(
+        prog="llvm-build submit",
+        description="Queue a build with the daemon and follow its progress; "
+        "arguments after '--' are those of a plain llvm-build run",
+    )
+    parser.add_argument("--socket", type=Path, default=defaultSocketPath())
+    parser.add_argument(
+        "--priority",
+        type=int,
+        default=0,
+        help="Builds with a higher priority run first",
+    )
+    parser.add_argument(
+        "--status",
+        action="store_true",
+        default=False,
+        help="Print the queue of the daemon instead",
+    )
+    parser.add_argument(
+        "--shutdown",
+        action="store_true",
+        default=False,
+        help="Stop the daemon after its running builds",
+    )
+    args = list(args)
+    buildArgs: list[str] = []
+    if "--" in args:
+        separator = args.index("--")
+        args, buildArgs = args[:separator], args[separator + 1 :]
+    parsedArgs = parser.parse_args(args)
+    if not (buildArgs or parsedArgs.status or parsedArgs.shutdown):
+        parser.error("nothing to do: give build arguments after '--'")
+    return parsedArgs, buildArgs
+
+
+def submitMain(args: Sequence[str]) -> None:
+    parsedArgs, buildArgs = _parseSubmitArgs(args)
+    if parsedArgs.status:
+        request(parsedArgs.socket, {"command": "status"})
+        return
+    if parsedArgs.shutdown:
+        request(parsedArgs.socket, {"command": "shutdown"})
+        return
+    # Relative paths are meant relative to the client, not the daemon
+    buildArgs = [
+        str(Path(arg).resolve())
+        if not arg.startswith("-") and Path(arg).exists()
+        else arg
+        for arg in buildArgs
+    ]
+    events = request(
+        parsedArgs.socket,
+        {
+            "command": "build",
+            "priority": parsedArgs.priority,
+            "args": buildArgs,
+        },
+    )
+    if not events or events[-1].get("event") != "finished":
+        sys.exit(1)
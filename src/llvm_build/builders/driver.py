@@ -1,133 +1,226 @@
+import asyncio
+import copy
+import dataclasses
+import functools
+import hashlib
+import importlib
+import itertools
+import json
 import logging
 import os
+import pickle
 import shutil
 import subprocess
 import sys
 from argparse import ArgumentParser, Namespace
-from collections.abc import Sequence
+from collections.abc import Callable, Iterator, Sequence
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Annotated, Any
-
-import yaml
-from pydantic import AfterValidator, BaseModel, ConfigDict
+from typing import TYPE_CHECKING, Any
 
+from llvm_build.builders.artifacts import (
+    CHECKSUM_MANIFEST_NAME,
+    writeChecksumManifest,
+)
+from llvm_build.builders.runtimes import (
+    RUNTIMES_REPORT_NAME,
+    RuntimesStage,
+    runtimeTargetDefines,
+)
 from llvm_build.common.adaptors import (
     CompilerOptionDefineProvider,
     ToolchainDefineProvider,
 )
 from llvm_build.common.base_builders import (
     AbstractBuilder,
+    AbstractCMakeDefineProvider,
     BuilderKind,
     CMakeBuilder,
     TimedBuilder,
 )
+from llvm_build.common.check_cache import CheckCache, defaultCheckCacheDir
 from llvm_build.common.compiler import (
     AbstractCompilerOption,
     CompilerOption,
+    CompilerOptionAggregate,
 )
 from llvm_build.common.define_providers import (
     CMakeDefineProviderAggregate,
     CustomCMakeDefineProvider,
 )
+from llvm_build.common.llvm import llvmSourceDirs
+from llvm_build.common.native_tools import (
+    NativeToolsCache,
+    NativeToolsDefineProvider,
+    defaultNativeToolsCacheDir,
+)
+from llvm_build.common.process import ProcessRunner, runSync
 from llvm_build.common.utils import FileSystemHelper
 from llvm_build.toolchain import PosixToolchain, ToolchainKind
 from llvm_build.toolchain.gnu import GnuToolchain
 from llvm_build.toolchain.llvm import LlvmToolchain
 
+# pydantic and yaml are only imported when a project config is loaded, and
+# not at all when it comes from the config cache, to keep startup and the
+# analysis subcommands fast
+if TYPE_CHECKING:
+    from llvm_build.builders.config import (
+        BuildToolConfig,
+        CompilerOptionConfig,
+        NativeToolsConfig,
+        PerfCountersConfig,
+        ProjectConfig,
+        QemuUserConfig,
+        RuntimesConfig,
+        SharedFrontendConfig,
+        SourceConfig,
+        ToolchainConfig,
+    )
 
-def _doResolvePath(path: Path) -> Path:
-    if path.is_absolute():
-        return path.resolve()
-    else:
-        rootDir = Path(os.path.dirname(__file__)) / ".."
-        return (rootDir / path).resolve()
+
+def _assembleFlagOption(config: "CompilerOptionConfig") -> CompilerOption:
+    option = CompilerOption()
+    for cflag in config.cflags:
+        option.addCFlag(cflag)
+    for cxxflag in config.cxxflags:
+        option.addCXXFlag(cxxflag)
+    for ldflag in config.ldflags:
+        option.addLDFalg(ldflag)
+    return option
 
 
-def _resolvePath(path: Path | None) -> Path | None:
-    if path is None:
+def _assembleCompilerOption(
+    projectConfig: "ProjectConfig",
+) -> AbstractCompilerOption | None:
+    if (
+        projectConfig.compilerOption is None
+        and projectConfig.compileTime is None
+    ):
         return None
-    return _doResolvePath(path)
+    aggregate = CompilerOptionAggregate()
+    if projectConfig.compilerOption is not None:
+        aggregate.addCompilerOptions(
+            _assembleFlagOption(projectConfig.compilerOption)
+        )
+    if projectConfig.compileTime is not None:
+        from llvm_build.testsuite.compile_time import TimeTraceCompilerOption
 
+        aggregate.addCompilerOptions(
+            TimeTraceCompilerOption(projectConfig.compileTime.traceGranularity)
+        )
+    return aggregate
 
-class _CompilerOptionConfig(BaseModel):
-    model_config = ConfigDict(frozen=True)
 
-    cflags: list[str] = []
-    cxxflags: list[str] = []
-    ldflags: list[str] = []
+# Custom configure option naming a CMake -C script rather than a define
+_initialCacheOption = "initialCache"
 
 
-_NullableProjectRootBasedPath = Annotated[
-    Path | None, AfterValidator(_resolvePath)
-]
-_NonNullableProjectRootBasedPath = Annotated[
-    Path, AfterValidator(_doResolvePath)
-]
+def _preloadCMakeOptions(builder: CMakeBuilder, config: "BuildToolConfig"):
+    initialCache = config.customConfigureOptions.get(_initialCacheOption)
+    if initialCache is not None:
+        from llvm_build.builders.config import resolveProjectPath
 
+        cachePath = resolveProjectPath(Path(initialCache))
+        FileSystemHelper.check_file(cachePath)
+        builder.setInitialCache(cachePath)
 
-class _ToolchainConfig(BaseModel):
-    model_config = ConfigDict(frozen=True)
 
-    name: ToolchainKind
-    installDir: _NullableProjectRootBasedPath = None
-    targetPrefix: str = ""
+@functools.cache
+def _probePerfEvents(events: tuple[str, ...]) -> list[str]:
+    """Probe once for all variants of a matrix"""
+    from llvm_build.testsuite.perf_counters import probeEvents
 
+    return probeEvents(events)
 
-class _BuildToolConfig(BaseModel):
-    model_config = ConfigDict(frozen=True)
 
-    name: BuilderKind
-    customConfigureOptions: dict[str, str] = dict()
-    customBuildOptions: dict[str, str] = dict()
-    customInstallOptions: dict[str, str] = dict()
+def _assemblePerfStatDefineProvider(
+    config: "PerfCountersConfig",
+) -> AbstractCMakeDefineProvider:
+    from llvm_build.testsuite.perf_counters import (
+        DEFAULT_EVENTS,
+        PerfStatDefineProvider,
+    )
 
+    events = config.events if config.events is not None else DEFAULT_EVENTS
+    if config.probe:
+        events = _probePerfEvents(tuple(events))
+    return PerfStatDefineProvider(events)
 
-class _ProjectConfig(BaseModel):
-    model_config = ConfigDict(frozen=True)
 
-    name: str
-    description: str = ""
-    srcDir: _NonNullableProjectRootBasedPath
-    buildDir: _NonNullableProjectRootBasedPath
-    installDir: _NullableProjectRootBasedPath = None
-    packagePathPrefix: _NullableProjectRootBasedPath = None
-    compilerOption: _CompilerOptionConfig | None = None
-    buildTool: _BuildToolConfig
-    toolchain: _ToolchainConfig
+def _assembleSharedFrontendDefineProvider(
+    config: "SharedFrontendConfig", buildDir: Path
+) -> AbstractCMakeDefineProvider:
+    from llvm_build.testsuite.bitcode_launcher import (
+        DEFAULT_CODEGEN_FLAGS,
+        SharedFrontendDefineProvider,
+    )
 
+    return SharedFrontendDefineProvider(
+        config.cacheDir,
+        buildDir,
+        config.codegenFlags
+        if config.codegenFlags is not None
+        else DEFAULT_CODEGEN_FLAGS,
+    )
 
-def _assembleCompilerOption(
-    projectConfig: _ProjectConfig,
-) -> AbstractCompilerOption | None:
-    if projectConfig.compilerOption is None:
-        return None
-    option = CompilerOption()
-    for cflag in projectConfig.compilerOption.cflags:
-        option.addCFlag(cflag)
-    for cxxflag in projectConfig.compilerOption.cxxflags:
-        option.addCXXFlag(cxxflag)
-    for ldflag in projectConfig.compilerOption.ldflags:
-        option.addLDFalg(ldflag)
-    return option
 
+def _assembleQemuUserDefineProvider(
+    config: "QemuUserConfig", sysroot: Path | None
+) -> AbstractCMakeDefineProvider:
+    from llvm_build.testsuite.qemu_user import QemuUserDefineProvider
 
-def _preloadCMakeOptions(builder: CMakeBuilder, config: _BuildToolConfig):
-    if "initialCache" in config.customConfigureOptions:
-        cachePath = _doResolvePath(
-            Path(config.customConfigureOptions["initialCache"])
-        )
-        FileSystemHelper.check_file(cachePath)
-        builder.setInitialCache(cachePath)
-        config.customConfigureOptions.pop("initialCache")
+    return QemuUserDefineProvider(
+        config.qemu, sysroot, config.cpu, config.plugin, config.libraryPaths
+    )
+
+
+def _assembleNativeToolsCache(
+    config: "NativeToolsConfig", projectConfig: "ProjectConfig"
+) -> NativeToolsCache:
+    return NativeToolsCache(
+        config.cacheDir or defaultNativeToolsCacheDir(),
+        projectConfig.srcDir,
+        projectConfig.buildTool.customConfigureOptions,
+        config.cc,
+        config.cxx,
+    )
+
+
+def _prepareNativeTools(
+    configs: Sequence["ProjectConfig"], jobs: int | None
+) -> None:
+    """Build the host tools of cross builds before any of them configures;
+    builds sharing a revision and host compilers share the tools. Their
+    trees count towards the disk budget like build directories, so that
+    those of old revisions are removed."""
+    from llvm_build.builders.build_dirs import BuildDirRegistry
+
+    registry = BuildDirRegistry()
+    for config in configs:
+        if config.nativeTools is None:
+            continue
+        toolsDir = _assembleNativeToolsCache(
+            config.nativeTools, config
+        ).prepare(jobs)
+        if toolsDir is not None:
+            registry.use(toolsDir.parent, None, pinned=False)
+            registry.measure([toolsDir.parent])
 
 
 def _assembleCMakeBuilder(
-    projectConfig: _ProjectConfig,
+    projectConfig: "ProjectConfig",
     toolchain: PosixToolchain,
     compilerOption: AbstractCompilerOption | None,
 ) -> CMakeBuilder:
     builder = CMakeBuilder(projectConfig.srcDir, projectConfig.buildDir)
     _preloadCMakeOptions(builder, projectConfig.buildTool)
+    builder.setTimeouts(
+        projectConfig.buildTool.timeout,
+        projectConfig.buildTool.inactivityTimeout,
+    )
+    builder.setOomRetries(projectConfig.buildTool.oomRetries)
+    if projectConfig.buildTool.checkCache:
+        builder.setCheckCache(CheckCache(defaultCheckCacheDir()))
     defineAggregate = CMakeDefineProviderAggregate()
     defineAggregate.addProvider(ToolchainDefineProvider(toolchain))
 
@@ -136,21 +229,153 @@ def _assembleCMakeBuilder(
             CompilerOptionDefineProvider(compilerOption)
         )
 
+    if projectConfig.nativeTools is not None:
+        defineAggregate.addProvider(
+            NativeToolsDefineProvider(
+                _assembleNativeToolsCache(
+                    projectConfig.nativeTools, projectConfig
+                )
+            )
+        )
+
     if projectConfig.installDir is not None:
         builder.setInstallDir(projectConfig.installDir)
 
+    if projectConfig.toolchain.sysroot is not None:
+        sysrootProvider = CustomCMakeDefineProvider()
+        sysrootProvider.addDefine(
+            "CMAKE_SYSROOT", str(projectConfig.toolchain.sysroot)
+        )
+        defineAggregate.addProvider(sysrootProvider)
+
+    if projectConfig.buildTool.checkTargets:
+        builder.setTestTargets(
+            projectConfig.buildTool.checkTargets,
+            projectConfig.buildTool.testShards,
+        )
+    if projectConfig.buildTool.distributionComponents:
+        distributionProvider = CustomCMakeDefineProvider()
+        distributionProvider.addDefine(
+            "LLVM_DISTRIBUTION_COMPONENTS",
+            ";".join(projectConfig.buildTool.distributionComponents),
+        )
+        defineAggregate.addProvider(distributionProvider)
+        builder.setBuildTargets(["distribution"])
+        builder.setInstallTargets(["install-distribution"])
+
     if projectConfig.buildTool.customConfigureOptions:
         customDefineProvider = CustomCMakeDefineProvider()
         for (
             key,
             value,
         ) in projectConfig.buildTool.customConfigureOptions.items():
-            customDefineProvider.addDefine(key, value)
+            if key != _initialCacheOption:
+                customDefineProvider.addDefine(key, value)
         defineAggregate.addProvider(customDefineProvider)
+    if projectConfig.compileTime is not None:
+        subdirProvider = CustomCMakeDefineProvider()
+        subdirProvider.addDefine(
+            "TEST_SUITE_SUBDIRS", ";".join(projectConfig.compileTime.subdirs)
+        )
+        defineAggregate.addProvider(subdirProvider)
+    if projectConfig.perfCounters is not None:
+        defineAggregate.addProvider(
+            _assemblePerfStatDefineProvider(projectConfig.perfCounters)
+        )
+    if projectConfig.qemuUser is not None:
+        if projectConfig.perfCounters is not None:
+            raise RuntimeError(
+                "perfCounters and qemuUser both need TEST_SUITE_RUN_UNDER"
+            )
+        defineAggregate.addProvider(
+            _assembleQemuUserDefineProvider(
+                projectConfig.qemuUser, projectConfig.toolchain.sysroot
+            )
+        )
+    if projectConfig.sharedFrontend is not None:
+        defineAggregate.addProvider(
+            _assembleSharedFrontendDefineProvider(
+                projectConfig.sharedFrontend, projectConfig.buildDir
+            )
+        )
     builder.setDefineProvider(defineAggregate)
     return builder
 
 
+def _runtimesBuildRoot(
+    projectConfig: "ProjectConfig", config: "RuntimesConfig"
+) -> Path:
+    return config.buildDir or projectConfig.buildDir.with_name(
+        f"{projectConfig.buildDir.name}-runtimes"
+    )
+
+
+def _runtimesJobs(config: "RuntimesConfig", jobs: int | None) -> int:
+    return max(1, (jobs or os.cpu_count() or 1) // len(config.targets))
+
+
+def _assembleRuntimeBuilders(
+    projectConfig: "ProjectConfig",
+    config: "RuntimesConfig",
+    jobs: int | None,
+) -> dict[str, CMakeBuilder]:
+    """A builder per triple of llvm-project/runtimes, compiled with the
+    clang installed by the project"""
+    installDir = projectConfig.installDir
+    if installDir is None:
+        raise RuntimeError("runtimes are built with the installed compiler")
+    toolchain = LlvmToolchain(installDir)
+    buildRoot = _runtimesBuildRoot(projectConfig, config)
+    targetJobs = _runtimesJobs(config, jobs)
+    builders: dict[str, CMakeBuilder] = dict()
+    for target in config.targets:
+        builder = CMakeBuilder(
+            projectConfig.srcDir.parent / "runtimes", buildRoot / target.triple
+        )
+        builder.setInstallDir(installDir)
+        builder.setBuildJobs(targetJobs)
+        defineAggregate = CMakeDefineProviderAggregate()
+        defineAggregate.addProvider(ToolchainDefineProvider(toolchain))
+        if target.compilerOption is not None:
+            defineAggregate.addProvider(
+                CompilerOptionDefineProvider(
+                    _assembleFlagOption(target.compilerOption)
+                )
+            )
+        # One provider, so that the options of a triple replace the others
+        targetProvider = CustomCMakeDefineProvider()
+        defines = runtimeTargetDefines(
+            target.triple, config.runtimes, toolchain.cc, installDir
+        )
+        if target.sysroot is not None:
+            defines["CMAKE_SYSROOT"] = str(target.sysroot)
+        defines.update(config.customConfigureOptions)
+        defines.update(target.customConfigureOptions)
+        for key, value in defines.items():
+            targetProvider.addDefine(key, value)
+        defineAggregate.addProvider(targetProvider)
+        builder.setDefineProvider(defineAggregate)
+        builders[target.triple] = builder
+    return builders
+
+
+def _assembleRuntimesStage(
+    projectConfig: "ProjectConfig",
+    config: "RuntimesConfig",
+    jobs: int | None,
+) -> RuntimesStage:
+    builders: dict[str, AbstractBuilder] = {
+        triple: TimedBuilder(builder)
+        for triple, builder in _assembleRuntimeBuilders(
+            projectConfig, config, jobs
+        ).items()
+    }
+    return RuntimesStage(
+        builders,
+        _runtimesBuildRoot(projectConfig, config) / RUNTIMES_REPORT_NAME,
+    )
+
+
 def _findCompilerInstallDir(compiler: str) -> Path:
     gcc = shutil.which(compiler)
     if gcc is None:
@@ -162,7 +387,7 @@ def _findCompilerInstallDir(compiler: str) -> Path:
     return (gccPath / ".." / "..").resolve()
 
 
-def _assembleToolchain(projectConfig: _ProjectConfig) -> PosixToolchain:
+def _assembleToolchain(projectConfig: "ProjectConfig") -> PosixToolchain:
     if projectConfig.toolchain.name == ToolchainKind.GNU:
         if projectConfig.toolchain.installDir is None:
             gccName = (
@@ -187,15 +412,60 @@ def _assembleToolchain(projectConfig: _ProjectConfig) -> PosixToolchain:
     raise RuntimeError("unknown toolchain: f{projectConfig.toolchain.name}")
 
 
-def _assembleBuilder(projectConfig: _ProjectConfig) -> AbstractBuilder:
-    toolchain = _assembleToolchain(projectConfig)
+def _wrapCompileTimeBuilder(
+    projectConfig: "ProjectConfig", builder: CMakeBuilder
+) -> AbstractBuilder:
+    config = projectConfig.compileTime
+    if config is None:
+        return builder
+    from llvm_build.testsuite.compile_time import CompileTimeBuilder
+
+    outputDir = config.outputDir or projectConfig.buildDir / "compile-time"
+    return CompileTimeBuilder(
+        builder, config.repetitions, outputDir, config.jobs
+    )
+
+
+def _assembleTestSelection(
+    projectConfig: "ProjectConfig",
+    changedSince: str | None,
+    fullSuiteFallback: bool,
+) -> Callable[[Path], list[Path] | None] | None:
+    if changedSince is None:
+        return None
+    from llvm_build.builders.test_selection import ChangeTestSelector
+
+    return ChangeTestSelector.fromGit(
+        projectConfig.srcDir,
+        changedSince,
+        rules=projectConfig.buildTool.testSelectionRules,
+        fallbackToFull=fullSuiteFallback,
+    ).select
+
+
+def _assembleBuilder(
+    projectConfig: "ProjectConfig",
+    buildJobs: int | None = None,
+    toolchain: PosixToolchain | None = None,
+    testSelection: Callable[[Path], list[Path] | None] | None = None,
+) -> AbstractBuilder:
+    if toolchain is None:
+        toolchain = _assembleToolchain(projectConfig)
     compilerOption = _assembleCompilerOption(projectConfig)
     if projectConfig.buildTool.name == BuilderKind.CMAKE:
-        return _assembleCMakeBuilder(projectConfig, toolchain, compilerOption)
+        builder = _assembleCMakeBuilder(
+            projectConfig, toolchain, compilerOption
+        )
+        if buildJobs is not None:
+            builder.setBuildJobs(buildJobs)
+        builder.setTestSelection(testSelection)
+        return _wrapCompileTimeBuilder(projectConfig, builder)
     raise RuntimeError(f"unknow build tool: {projectConfig.buildTool.name}")
 
 
 def _parseArgs(args: Sequence[str]) -> Namespace:
+    from llvm_build.builders.build_dirs import parseSize
+
     parser = ArgumentParser()
     parser.add_argument(
         "--src-dir",
@@ -260,9 +530,349 @@ def _parseArgs(args: Sequence[str]) -> Namespace:
         default=None,
         help="Directory where the toolchain is located",
     )
+    parser.add_argument(
+        "--jobs",
+        required=False,
+        type=int,
+        default=None,
+        help="Total number of build jobs, split evenly among the variants of "
+        "a matrix",
+    )
+    parser.add_argument(
+        "--test",
+        required=False,
+        action="store_true",
+        default=False,
+        help="Run buildTool.checkTargets after building",
+    )
+    parser.add_argument(
+        "--disk-budget",
+        required=False,
+        type=parseSize,
+        default=os.environ.get("LLVM_BUILD_DISK_BUDGET"),
+        help="Total size of build directories to keep, e.g. 300G; least "
+        "recently used ones are trimmed or removed before building",
+    )
+    parser.add_argument(
+        "--revision",
+        required=False,
+        default=None,
+        help="Revision to check out into source.checkoutDir",
+    )
+    parser.add_argument(
+        "--offline",
+        required=False,
+        action="store_true",
+        default=False,
+        help="Check out from the source mirror without fetching",
+    )
+    parser.add_argument(
+        "--changed-since",
+        required=False,
+        default=None,
+        help="With --test, run only the tests affected by the changes "
+        "since this revision",
+    )
+    parser.add_argument(
+        "--full-suite-fallback",
+        required=False,
+        action="store_true",
+        default=False,
+        help="Run all tests when --changed-since finds changes no tests map to",
+    )
+    parser.add_argument(
+        "--plan",
+        required=False,
+        action="store_true",
+        default=False,
+        help="Print the commands the build would run and its predicted cost "
+        "as JSON, without building anything",
+    )
+    parser.add_argument(
+        "--plan-history",
+        required=False,
+        type=Path,
+        default=None,
+        help="With --plan, the .ninja_log of a former build, pricing the "
+        "edges of fresh build directories",
+    )
     return parser.parse_args(args)
 
 
+def _parseVariantArgs(args: Sequence[str]) -> Namespace:
+    from llvm_build.builders.build_dirs import parseSize
+
+    parser = ArgumentParser(
+        prog="llvm-build variants",
+        description="Build several variants of a project concurrently",
+    )
+    parser.add_argument(
+        "--config",
+        dest="configs",
+        required=True,
+        action="append",
+        type=Path,
+        help="Configuration of one variant, may be repeated",
+    )
+    parser.add_argument(
+        "--src-dir",
+        required=False,
+        type=Path,
+        default=None,
+        help="Source code directory shared by all variants",
+    )
+    parser.add_argument(
+        "--toolchain-install-dir",
+        required=False,
+        type=Path,
+        default=None,
+        help="Directory where the toolchain is located",
+    )
+    parser.add_argument(
+        "--jobs",
+        required=False,
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Total number of build jobs, split evenly among the variants",
+    )
+    parser.add_argument(
+        "--manifest",
+        required=False,
+        type=Path,
+        default=None,
+        help="File to write the build directories of the variants to",
+    )
+    parser.add_argument(
+        "--no-install",
+        required=False,
+        action="store_true",
+        default=False,
+        help="Do not install executables, libraries and headers",
+    )
+    parser.add_argument(
+        "--disk-budget",
+        required=False,
+        type=parseSize,
+        default=os.environ.get("LLVM_BUILD_DISK_BUDGET"),
+        help="Total size of build directories to keep, e.g. 300G",
+    )
+    parsedArgs = parser.parse_args(args)
+    parsedArgs.build_dir = None
+    parsedArgs.install_dir = None
+    parsedArgs.revision = None
+    parsedArgs.offline = False
+    parsedArgs.changed_since = None
+    parsedArgs.full_suite_fallback = False
+    parsedArgs.plan = False
+    parsedArgs.plan_history = None
+    return parsedArgs
+
+
+def _prepareSources(configs: Sequence["ProjectConfig"]) -> None:
+    """Update the mirror and check out each source worktree once, with the
+    directories needed by all builds using it"""
+    from llvm_build.common.git_source import GitSourceProvider
+
+    checkouts: dict[Path, tuple[SourceConfig, set[str] | None]] = dict()
+    for config in configs:
+        source = config.source
+        if source is None:
+            continue
+        dirs: set[str] | None = None
+        if source.sparse:
+            defines = config.buildTool.customConfigureOptions
+            if config.runtimes is not None:
+                runtimes = [
+                    *filter(
+                        None, defines.get("LLVM_ENABLE_RUNTIMES", "").split(";")
+                    ),
+                    *config.runtimes.runtimes,
+                ]
+                defines = {
+                    **defines,
+                    "LLVM_ENABLE_RUNTIMES": ";".join(runtimes),
+                }
+            needed = llvmSourceDirs(defines)
+            if needed is not None:
+                dirs = {*needed, *source.extraDirs}
+        if source.checkoutDir in checkouts:
+            known, knownDirs = checkouts[source.checkoutDir]
+            if (known.mirrorDir, known.revision) != (
+                source.mirrorDir,
+                source.revision,
+            ):
+                raise RuntimeError(
+                    f"'{source.checkoutDir}' is checked out for different "
+                    "revisions"
+                )
+            dirs = (
+                None if dirs is None or knownDirs is None else dirs | knownDirs
+            )
+        checkouts[source.checkoutDir] = (source, dirs)
+    for source, dirs in checkouts.values():
+        provider = GitSourceProvider(source.mirrorDir, source.url)
+        if not source.offline:
+            provider.update()
+        provider.checkout(
+            source.revision,
+            source.checkoutDir,
+            None if dirs is None else sorted(dirs),
+        )
+
+
+@contextmanager
+def _usingBuildDirs(
+    configs: Sequence["ProjectConfig"], diskBudget: int | None
+) -> Iterator[None]:
+    """Record the use of the build directories, make room for them within
+    the disk budget and record their size once built"""
+    from llvm_build.builders.build_dirs import BuildDirRegistry
+
+    registry = BuildDirRegistry()
+    for config in configs:
+        registry.use(config.buildDir, config.installDir, config.pinBuildDir)
+    if diskBudget is not None:
+        registry.collect(
+            diskBudget, keep=[config.buildDir for config in configs]
+        )
+    try:
+        yield
+    finally:
+        registry.measure(
+            config.buildDir for config in configs if config.buildDir.is_dir()
+        )
+
+
+class BuildSession:
+    """State shared by the builds of one long-running process, such as the
+    build daemon: loaded configs and resolved toolchains"""
+
+    configs: dict[str, dict[str, "ProjectConfig"]]
+    toolchains: dict["ToolchainConfig", PosixToolchain]
+
+    def __init__(self) -> None:
+        self.configs = dict()
+        self.toolchains = dict()
+
+    def toolchain(self, projectConfig: "ProjectConfig") -> PosixToolchain:
+        if projectConfig.toolchain not in self.toolchains:
+            self.toolchains[projectConfig.toolchain] = _assembleToolchain(
+                projectConfig
+            )
+        return self.toolchains[projectConfig.toolchain]
+
+
+def _buildVariants(
+    variants: dict[str, "ProjectConfig"],
+    jobs: int,
+    install: bool,
+    manifestPath: Path | None,
+    session: BuildSession | None = None,
+    package: bool = False,
+    test: bool = False,
+    changedSince: str | None = None,
+    fullSuiteFallback: bool = False,
+) -> None:
+    """Build variants side by side within one job budget, resolving each
+    distinct toolchain once. A variant is installed and packaged as soon as
+    it is built, while the others are still building."""
+    cacheDirs = {
+        config.sharedFrontend.cacheDir if config.sharedFrontend else None
+        for config in variants.values()
+    }
+    if len(cacheDirs) > 1:
+        logging.getLogger(__file__).warning(
+            "variants do not share one frontend cache: %s", cacheDirs
+        )
+    if session is None:
+        session = BuildSession()
+    _prepareSources(list(variants.values()))
+    _prepareNativeTools(list(variants.values()), jobs)
+    builders: list[AbstractBuilder] = [
+        TimedBuilder(
+            _assembleBuilder(
+                config,
+                max(1, jobs // len(variants)),
+                session.toolchain(config),
+                _assembleTestSelection(config, changedSince, fullSuiteFallback),
+            )
+        )
+        for config in variants.values()
+    ]
+    if manifestPath is not None:
+        from llvm_build.testsuite.lit_results import VariantManifest
+
+        VariantManifest(
+            manifestPath,
+            {name: config.buildDir for name, config in variants.items()},
+        ).dump()
+    runSync(
+        _runVariantStages(
+            list(variants.values()),
+            builders,
+            install,
+            package,
+            test,
+            max(1, jobs // len(variants)),
+        )
+    )
+
+
+async def _runVariantStages(
+    configs: Sequence["ProjectConfig"],
+    builders: Sequence[AbstractBuilder],
+    install: bool,
+    package: bool,
+    test: bool,
+    jobs: int,
+) -> None:
+    # Configuring is mostly serial work of CMake, so all variants configure
+    # before any of them starts to compete for the build jobs
+    await asyncio.gather(*(builder.configureAsync() for builder in builders))
+
+    async def finish(config: "ProjectConfig", builder: AbstractBuilder) -> None:
+        await builder.buildAsync()
+        if test:
+            await builder.testAsync()
+        if install:
+            await builder.installAsync()
+            if config.runtimes is not None:
+                await _assembleRuntimesStage(
+                    config, config.runtimes, jobs
+                ).runAsync()
+        if package:
+            await _packageAsync(config)
+
+    # On failure, asyncio.run cancels the other variants, which terminates
+    # their build processes
+    await asyncio.gather(
+        *(
+            finish(config, builder)
+            for config, builder in zip(configs, builders, strict=True)
+        )
+    )
+
+
+def variantsMain(args: Sequence[str]) -> None:
+    """Build the variants of a project (e.g. SelectionDAG and GlobalISel
+    test-suite builds) side by side within one job budget. With a shared
+    `sharedFrontend.cacheDir`, each TU goes through the frontend once."""
+    parsedArgs = _parseVariantArgs(args)
+    variants: dict[str, ProjectConfig] = dict()
+    for configPath in parsedArgs.configs:
+        for name, config in _loadProjectConfigs(configPath, parsedArgs).items():
+            if len(parsedArgs.configs) > 1 or not name:
+                name = "-".join(filter(None, (configPath.stem, name)))
+            variants[name] = config
+    with _usingBuildDirs(list(variants.values()), parsedArgs.disk_budget):
+        _buildVariants(
+            variants,
+            parsedArgs.jobs,
+            not parsedArgs.no_install,
+            parsedArgs.manifest,
+        )
+
+
 def _config_logging():
     loggingFormat = (
         "[%(asctime)s %(levelname)s "
@@ -271,7 +881,42 @@ def _config_logging():
     logging.basicConfig(format=loggingFormat, level=logging.DEBUG)
 
 
-def _package(projectConfig: _ProjectConfig) -> None:
+def _packagePath(packagePathPrefix: Path) -> Path:
+    return Path(f"{packagePathPrefix}.tar.xz")
+
+
+def _manifestDir(packagePathPrefix: Path) -> Path:
+    """Holds the checksum manifest, packed ahead of the install tree"""
+    return Path(f"{packagePathPrefix}.checksums")
+
+
+def _packageCommand(
+    installDir: Path,
+    packagePath: Path,
+    filesToPack: Sequence[str],
+    manifestDir: Path,
+) -> list[str]:
+    return [
+        "tar",
+        "-c",
+        "-I",
+        "xz -9 -T0",
+        "-f",
+        f"{packagePath}",
+        "-C",
+        f"{manifestDir}",
+        CHECKSUM_MANIFEST_NAME,
+        "-C",
+        f"{installDir}",
+        *filesToPack,
+    ]
+
+
+def _package(projectConfig: "ProjectConfig") -> None:
+    runSync(_packageAsync(projectConfig))
+
+
+async def _packageAsync(projectConfig: "ProjectConfig") -> None:
     logger = logging.getLogger(__file__)
     logger.info("Start packaging")
     if projectConfig.packagePathPrefix is None:
@@ -282,25 +927,176 @@ def _package(projectConfig: _ProjectConfig) -> None:
     FileSystemHelper.create_dir(projectConfig.packagePathPrefix / "..")
     FileSystemHelper.check_bin_from_env("xz")
     FileSystemHelper.check_bin_from_env("tar")
-    filesToPack = os.listdir(projectConfig.installDir)
-    packagePath = f"{projectConfig.packagePathPrefix}.tar.xz"
-    args = [
-        "tar",
-        "-C",
-        f"{projectConfig.installDir}",
-        "-c",
-        "-I",
-        "xz -9 -T0",
-        "-f",
-        f"{packagePath}",
-    ]
-    args.extend(filesToPack)
+    packagePath = _packagePath(projectConfig.packagePathPrefix)
+    manifestDir = _manifestDir(projectConfig.packagePathPrefix)
+    manifestDir.mkdir(exist_ok=True)
+    count = await asyncio.to_thread(
+        writeChecksumManifest,
+        projectConfig.installDir,
+        manifestDir / CHECKSUM_MANIFEST_NAME,
+    )
+    logger.info("Recorded the checksums of %d files", count)
+    args = _packageCommand(
+        projectConfig.installDir,
+        packagePath,
+        os.listdir(projectConfig.installDir),
+        manifestDir,
+    )
     logging.getLogger(__file__).info(
         f"The command to package '{packagePath}' is %s%s",
         os.linesep,
         FileSystemHelper.convertCommandToStr(*args),
     )
-    subprocess.check_call(args)
+    await ProcessRunner(args).check()
+
+
+def _mergeConfig(
+    base: dict[str, Any], fragment: dict[str, Any]
+) -> dict[str, Any]:
+    """Mappings are merged, lists appended and other values replaced"""
+    merged = dict(base)
+    for key, value in fragment.items():
+        current = merged.get(key)
+        if isinstance(current, dict) and isinstance(value, dict):
+            merged[key] = _mergeConfig(current, value)
+        elif isinstance(current, list) and isinstance(value, list):
+            merged[key] = current + value
+        else:
+            merged[key] = value
+    return merged
+
+
+def _expandMatrix(config: dict[str, Any]) -> dict[str, dict[str, Any]]:
+    """Expand the `matrix` block into one config per combination of values,
+    named after the values and built in a subdirectory of `buildDir`. A
+    config without matrix is a single variant with an empty name."""
+    matrix = config.get("matrix")
+    if not matrix:
+        return {"": config}
+    base = {key: value for key, value in config.items() if key != "matrix"}
+    variants: dict[str, dict[str, Any]] = dict()
+    for combination in itertools.product(
+        *(axis.items() for axis in matrix.values())
+    ):
+        name = "-".join(valueName for valueName, _ in combination)
+        variant = copy.deepcopy(base)
+        for _, fragment in combination:
+            variant = _mergeConfig(variant, fragment or dict())
+        variant["name"] = f"{base['name']} [{name}]"
+        variant["buildDir"] = Path(base["buildDir"]) / name
+        if base.get("installDir") is not None:
+            variant["installDir"] = Path(base["installDir"]) / name
+        if base.get("packagePathPrefix") is not None:
+            variant["packagePathPrefix"] = f"{base['packagePathPrefix']}-{name}"
+        variants[name] = variant
+    return variants
+
+
+def _validateProjectConfigs(
+    content: bytes, args: Namespace
+) -> dict[str, "ProjectConfig"]:
+    import yaml
+
+    from llvm_build.builders.config import ProjectConfig
+
+    # The libyaml based loader is several times faster where available
+    loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+    config = yaml.load(content, Loader=loader)
+    _modifyProjectConfig(config, args)
+    # Validate the matrix block and the base before expanding them
+    ProjectConfig(**config)
+    return {
+        name: ProjectConfig(**variant)
+        for name, variant in _expandMatrix(config).items()
+    }
+
+
+def _configCacheKey(content: bytes, args: Namespace) -> str:
+    """Validated configs are cached by config file content and the CLI
+    overrides. Paths are resolved against the package directory and the
+    schema lives in this package and the enums it imports, so their
+    location and sources are part of the key as well, along with the
+    pydantic version the configs are pickled with."""
+    # Loading a cached config imports pydantic anyway
+    from pydantic.version import VERSION as pydanticVersion
+
+    digest = hashlib.sha256(content)
+    digest.update(f"{pydanticVersion}\0".encode())
+    for override in (
+        args.src_dir,
+        args.build_dir,
+        args.install_dir,
+        args.toolchain_install_dir,
+        args.revision,
+        args.offline,
+    ):
+        digest.update(f"{override}\0".encode())
+    packageDir = Path(__file__).parents[1]
+    for source in (
+        Path(__file__),
+        Path(__file__).with_name("config.py"),
+        packageDir / "common" / "base_builders.py",
+        packageDir / "toolchain" / "__init__.py",
+    ):
+        stat = source.stat()
+        digest.update(
+            f"{source.resolve()}:{stat.st_size}:{stat.st_mtime_ns}\0".encode()
+        )
+    return digest.hexdigest()
+
+
+def _configCachePath(key: str) -> Path | None:
+    if os.environ.get("LLVM_BUILD_NO_CONFIG_CACHE"):
+        return None
+    cacheHome = os.environ.get("XDG_CACHE_HOME")
+    cacheDir = (
+        (Path(cacheHome) if cacheHome else Path.home() / ".cache")
+        / "llvm-build"
+        / "configs"
+    )
+    return cacheDir / f"{key}.pickle"
+
+
+def _loadProjectConfigs(
+    configPath: Path, args: Namespace, session: BuildSession | None = None
+) -> dict[str, "ProjectConfig"]:
+    FileSystemHelper.check_file(configPath)
+    content = configPath.read_bytes()
+    key = _configCacheKey(content, args)
+    if session is not None and key in session.configs:
+        return session.configs[key]
+    variants = _loadProjectConfigsFromCache(content, args, key)
+    if session is not None:
+        session.configs[key] = variants
+    return variants
+
+
+def _loadProjectConfigsFromCache(
+    content: bytes, args: Namespace, key: str
+) -> dict[str, "ProjectConfig"]:
+    cachePath = _configCachePath(key)
+    if cachePath is not None and cachePath.is_file():
+        try:
+            with cachePath.open("rb") as f:
+                return pickle.load(f)
+        except Exception as e:
+            # Whatever a stale or corrupt entry raises, validate again
+            logging.getLogger(__file__).warning(
+                "ignoring unreadable config cache '%s': %s", cachePath, e
+            )
+    variants = _validateProjectConfigs(content, args)
+    if cachePath is not None:
+        try:
+            cachePath.parent.mkdir(parents=True, exist_ok=True)
+            temporary = cachePath.with_suffix(f".{os.getpid()}.tmp")
+            with temporary.open("wb") as f:
+                pickle.dump(variants, f)
+            os.replace(temporary, cachePath)
+        except OSError as e:
+            logging.getLogger(__file__).warning(
+                "cannot write config cache '%s': %s", cachePath, e
+            )
+    return variants
 
 
 def _modifyProjectConfig(config: dict[str, Any], args: Namespace) -> None:
@@ -312,24 +1108,228 @@ def _modifyProjectConfig(config: dict[str, Any], args: Namespace) -> None:
         config["installDir"] = args.install_dir
     if args.toolchain_install_dir is not None:
         config["toolchain"]["installDir"] = args.toolchain_install_dir
+    if "source" in config:
+        if args.revision is not None:
+            config["source"]["revision"] = args.revision
+        if args.offline:
+            config["source"]["offline"] = True
 
 
-def main() -> None:
-    _config_logging()
-    parsedCmdArgs = _parseArgs(sys.argv[1:])
-    FileSystemHelper.check_file(parsedCmdArgs.config)
-    with open(parsedCmdArgs.config) as configFile:
-        config = yaml.safe_load(configFile)
-    _modifyProjectConfig(config, parsedCmdArgs)
-    projectConfig = _ProjectConfig(**config)
-    builder = TimedBuilder(_assembleBuilder(projectConfig))
+# Subcommands are dispatched before the project options are parsed; each
+# module is imported on demand and provides `main(args)`, or the function
+# named after a colon.
+_subcommands: dict[str, str] = {
+    "variants": "llvm_build.builders.driver:variantsMain",
+    "serve": "llvm_build.builders.daemon:serveMain",
+    "submit": "llvm_build.builders.daemon:submitMain",
+    "compare": "llvm_build.testsuite.compare",
+    "history": "llvm_build.testsuite.history",
+    "size": "llvm_build.testsuite.code_size",
+    "run-tests": "llvm_build.testsuite.runner",
+    "gc": "llvm_build.builders.build_dirs",
+    "impact": "llvm_build.builders.impact",
+    "unpack": "llvm_build.builders.artifacts:unpackMain",
+}
+
+
+def _runSubcommand(args: Sequence[str]) -> bool:
+    if not args or args[0] not in _subcommands:
+        return False
+    moduleName, _, functionName = _subcommands[args[0]].partition(":")
+    module = importlib.import_module(moduleName)
+    getattr(module, functionName or "main")(args[1:])
+    return True
+
+
+def _planProject(
+    projectConfig: "ProjectConfig",
+    jobs: int,
+    toolchain: PosixToolchain,
+    parsedCmdArgs: Namespace,
+) -> dict[str, Any]:
+    from llvm_build.builders.plan import predictBuild, predictPackageSize
+
+    if projectConfig.buildTool.name != BuilderKind.CMAKE:
+        raise RuntimeError(f"unknow build tool: {projectConfig.buildTool.name}")
+    builder = _assembleCMakeBuilder(
+        projectConfig, toolchain, _assembleCompilerOption(projectConfig)
+    )
+    builder.setBuildJobs(jobs)
+    commands: dict[str, list[str] | None] = dict(builder.commands())
+    if parsedCmdArgs.no_install:
+        commands["install"] = None
+    package: dict[str, Any] | None = None
+    installDir = projectConfig.installDir
+    if (
+        parsedCmdArgs.package
+        and projectConfig.packagePathPrefix is not None
+        and installDir is not None
+    ):
+        packagePath = _packagePath(projectConfig.packagePathPrefix)
+        commands["package"] = _packageCommand(
+            installDir,
+            packagePath,
+            sorted(os.listdir(installDir)) if installDir.is_dir() else ["."],
+            _manifestDir(projectConfig.packagePathPrefix),
+        )
+        size, basis = predictPackageSize(packagePath, installDir)
+        package = {"path": str(packagePath), "bytes": size, "basis": basis}
+    prediction = predictBuild(
+        projectConfig.buildDir,
+        jobs,
+        builder.getBuildTargets(),
+        parsedCmdArgs.plan_history,
+    )
+    runtimes = (
+        _planRuntimes(projectConfig, projectConfig.runtimes, jobs)
+        if projectConfig.runtimes is not None
+        else None
+    )
+    wallSeconds = prediction.wallSeconds
+    if runtimes:
+        # The triples build side by side once the project is installed
+        wallSeconds += max(
+            (
+                plan["prediction"]["wallSeconds"]
+                for plan in runtimes.values()
+                if plan is not None
+            ),
+            default=0.0,
+        )
+    return {
+        "buildDir": str(projectConfig.buildDir),
+        "commands": commands,
+        "prediction": dataclasses.asdict(prediction),
+        "package": package,
+        "runtimes": runtimes,
+        "wallSeconds": wallSeconds,
+    }
+
+
+def _planRuntimes(
+    projectConfig: "ProjectConfig", config: "RuntimesConfig", jobs: int
+) -> dict[str, dict[str, Any] | None]:
+    """Commands and cost of the runtimes of each triple. They depend on the
+    installed clang, so nothing is planned for a project yet to be
+    installed."""
+    from llvm_build.builders.plan import predictBuild
+
+    try:
+        builders = _assembleRuntimeBuilders(projectConfig, config, jobs)
+    except (OSError, RuntimeError, subprocess.CalledProcessError) as e:
+        logging.getLogger(__file__).warning(
+            "runtimes are planned once the project is installed: %s", e
+        )
+        return {target.triple: None for target in config.targets}
+    targetJobs = _runtimesJobs(config, jobs)
+    plans: dict[str, dict[str, Any] | None] = dict()
+    for triple, builder in builders.items():
+        buildDir = _runtimesBuildRoot(projectConfig, config) / triple
+        prediction = predictBuild(
+            buildDir, targetJobs, builder.getBuildTargets()
+        )
+        plans[triple] = {
+            "buildDir": str(buildDir),
+            "commands": builder.commands(),
+            "prediction": dataclasses.asdict(prediction),
+        }
+    return plans
+
+
+def _planBuild(
+    variants: dict[str, "ProjectConfig"],
+    parsedCmdArgs: Namespace,
+    session: BuildSession | None,
+) -> None:
+    """Print the commands a build would run and what it is expected to
+    cost, as JSON, without running or checking out anything"""
+    if session is None:
+        session = BuildSession()
+    jobs = max(1, (parsedCmdArgs.jobs or os.cpu_count() or 1) // len(variants))
+    plans = {
+        name: _planProject(
+            config, jobs, session.toolchain(config), parsedCmdArgs
+        )
+        for name, config in variants.items()
+    }
+    json.dump(
+        {
+            # Variants build side by side
+            "wallSeconds": max(plan["wallSeconds"] for plan in plans.values()),
+            "variants": plans,
+        },
+        sys.stdout,
+        indent=2,
+    )
+    sys.stdout.write("\n")
+
+
+def runBuild(args: Sequence[str], session: BuildSession | None = None) -> None:
+    """Build a project as described by the command line `args`"""
+    parsedCmdArgs = _parseArgs(args)
+    variants = _loadProjectConfigs(parsedCmdArgs.config, parsedCmdArgs, session)
+    if parsedCmdArgs.plan:
+        _planBuild(variants, parsedCmdArgs, session)
+        return
+    with _usingBuildDirs(list(variants.values()), parsedCmdArgs.disk_budget):
+        if "" not in variants:
+            _buildVariants(
+                variants,
+                parsedCmdArgs.jobs or os.cpu_count() or 1,
+                not parsedCmdArgs.no_install,
+                next(iter(variants.values())).buildDir.parent / "variants.json",
+                session,
+                parsedCmdArgs.package,
+                parsedCmdArgs.test,
+                parsedCmdArgs.changed_since,
+                parsedCmdArgs.full_suite_fallback,
+            )
+        else:
+            _buildProject(variants[""], parsedCmdArgs, session)
+
+
+def _buildProject(
+    projectConfig: "ProjectConfig",
+    parsedCmdArgs: Namespace,
+    session: BuildSession | None,
+) -> None:
+    _prepareSources([projectConfig])
+    _prepareNativeTools([projectConfig], parsedCmdArgs.jobs)
+    toolchain = (
+        session.toolchain(projectConfig) if session is not None else None
+    )
+    builder = TimedBuilder(
+        _assembleBuilder(
+            projectConfig,
+            parsedCmdArgs.jobs,
+            toolchain,
+            _assembleTestSelection(
+                projectConfig,
+                parsedCmdArgs.changed_since,
+                parsedCmdArgs.full_suite_fallback,
+            ),
+        )
+    )
     builder.configure()
     builder.build()
+    if parsedCmdArgs.test:
+        builder.test()
     if not parsedCmdArgs.no_install:
         builder.install()
+        if projectConfig.runtimes is not None:
+            _assembleRuntimesStage(
+                projectConfig, projectConfig.runtimes, parsedCmdArgs.jobs
+            ).run()
     if parsedCmdArgs.package:
         _package(projectConfig)
 
 
+def main() -> None:
+    _config_logging()
+    if _runSubcommand(sys.argv[1:]):
+        return
+    runBuild(sys.argv[1:])
+
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,462 @@
+import json
+import os
+import pickle
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+from argparse import ArgumentParser, Namespace
+from collections.abc import Iterable, Sequence
+from dataclasses import dataclass, field
+from enum import StrEnum
+from pathlib import Path
+
+from llvm_build.common.base_builders import CMakeBuilder
+from llvm_build.common.utils import LoggerMixin
+
+_cacheName = ".llvm-build-impact.pickle"
+# Bump when the cached index changes shape
+_cacheVersion = 1
+_nodePattern = re.compile(
+    r'^"(0x[0-9a-f]+)" \[label="(.*?)"(, shape=ellipse)?\]$'
+)
+_edgePattern = re.compile(r'^"(0x[0-9a-f]+)" -> "(0x[0-9a-f]+)"(?: \[(.*)\])?$')
+# Files that make ninja rerun CMake, after which anything may rebuild
+_cmakeFileNames = ("CMakeLists.txt",)
+_cmakeFileSuffixes = (".cmake", ".cmake.in")
+
+
+class OutputKind(StrEnum):
+    OBJECT = "object"
+    LIBRARY = "library"
+    EXECUTABLE = "executable"
+    CUSTOM = "custom"
+
+
+def _outputKind(rule: str) -> OutputKind | None:
+    """Classify an output by the CMake rule producing it; None for phony
+    targets and build.ninja"""
+    if rule in ("phony", "RERUN_CMAKE"):
+        return None
+    if "_COMPILER__" in rule:
+        return OutputKind.OBJECT
+    if "_LIBRARY_LINKER__" in rule:
+        return OutputKind.LIBRARY
+    if "_EXECUTABLE_LINKER__" in rule:
+        return OutputKind.EXECUTABLE
+    return OutputKind.CUSTOM
+
+
+@dataclass
+class BuildGraph:
+    """Reverse dependencies of a ninja build directory. Paths are absolute;
+    order-only inputs are left out since they never cause a rebuild."""
+
+    # Output -> rule building it
+    rules: dict[str, str] = field(default_factory=dict)
+    # Output -> inputs, including the headers recorded in the deps log
+    inputs: dict[str, set[str]] = field(default_factory=dict)
+    # Input -> outputs rebuilt when it changes
+    dependents: dict[str, set[str]] = field(default_factory=dict)
+
+    def addEdge(
+        self, inputs: Iterable[str], outputs: Iterable[str], rule: str
+    ) -> None:
+        inputs = list(inputs)
+        for output in outputs:
+            self.rules[output] = rule
+            self.inputs.setdefault(output, set()).update(inputs)
+            for path in inputs:
+                self.dependents.setdefault(path, set()).add(output)
+
+    def addDeps(self, output: str, deps: Iterable[str]) -> None:
+        deps = list(deps)
+        self.inputs.setdefault(output, set()).update(deps)
+        for path in deps:
+            self.dependents.setdefault(path, set()).add(output)
+
+
+def _absolute(buildDir: Path, path: str) -> str:
+    return os.path.normpath(os.path.join(buildDir, path))
+
+
+def parseGraph(text: str, buildDir: Path, graph: BuildGraph) -> None:
+    """Add the edges printed by `ninja -t graph`"""
+    labels: dict[str, str] = dict()
+    ruleNodes: set[str] = set()
+    edges: list[tuple[str, str, str]] = []
+    for line in text.splitlines():
+        if match := _nodePattern.match(line):
+            labels[match.group(1)] = match.group(2)
+            if match.group(3):
+                ruleNodes.add(match.group(1))
+        elif match := _edgePattern.match(line):
+            edges.append((match.group(1), match.group(2), match.group(3) or ""))
+    # Edges with one input and output are drawn directly, labelled with the
+    # rule; others go through a node named after the rule
+    ruleInputs: dict[str, list[str]] = dict()
+    ruleOutputs: dict[str, list[str]] = dict()
+    for source, target, attributes in edges:
+        if "style=dotted" in attributes:
+            continue
+        if source in ruleNodes:
+            ruleOutputs.setdefault(source, []).append(labels[target])
+        elif target in ruleNodes:
+            ruleInputs.setdefault(target, []).append(labels[source])
+        else:
+            rule = attributes.partition('label=" ')[2].rstrip('"')
+            graph.addEdge(
+                [_absolute(buildDir, labels[source])],
+                [_absolute(buildDir, labels[target])],
+                rule,
+            )
+    for node in ruleNodes:
+        graph.addEdge(
+            (_absolute(buildDir, path) for path in ruleInputs.get(node, [])),
+            (_absolute(buildDir, path) for path in ruleOutputs.get(node, [])),
+            labels[node],
+        )
+
+
+def parseDeps(text: str, buildDir: Path, graph: BuildGraph) -> None:
+    """Add the header dependencies printed by `ninja -t deps`"""
+    output: str | None = None
+    deps: list[str] = []
+    for line in text.splitlines():
+        if line.startswith("    "):
+            deps.append(_absolute(buildDir, line.strip()))
+        elif line.strip():
+            if output is not None:
+                graph.addDeps(output, deps)
+            output = _absolute(buildDir, line.partition(": #deps")[0])
+            deps = []
+    if output is not None:
+        graph.addDeps(output, deps)
+
+
+def parseNinjaLog(text: str, buildDir: Path) -> dict[str, float]:
+    """Seconds the latest run of each output took"""
+    durations: dict[str, float] = dict()
+    for line in text.splitlines():
+        if line.startswith("#"):
+            continue
+        fields = line.split("\t")
+        if len(fields) < 4:
+            continue
+        durations[_absolute(buildDir, fields[3])] = (
+            int(fields[1]) - int(fields[0])
+        ) / 1000
+    return durations
+
+
+def _ninja(buildDir: Path, *args: str) -> str:
+    ninja = shutil.which("ninja")
+    if ninja is None:
+        raise RuntimeError("cannot find ninja")
+    return subprocess.check_output(
+        [ninja, "-C", str(buildDir), *args], text=True
+    )
+
+
+def _cacheStamp(buildDir: Path) -> list[tuple[str, int, int]]:
+    stamp = []
+    for name in ("build.ninja", ".ninja_deps"):
+        path = buildDir / name
+        if path.exists():
+            info = path.stat()
+            stamp.append((name, info.st_mtime_ns, info.st_size))
+    return stamp
+
+
+def loadGraph(buildDir: Path, store: bool = True) -> BuildGraph:
+    """Build the index from ninja, or reuse the one cached in the build
+    directory while build.ninja and the deps log are unchanged. A new
+    index is only cached if store is set."""
+    cachePath = buildDir / _cacheName
+    stamp = _cacheStamp(buildDir)
+    try:
+        with cachePath.open("rb") as f:
+            version, cachedStamp, graph = pickle.load(f)
+        if version == _cacheVersion and cachedStamp == stamp:
+            return graph
+    except (FileNotFoundError, pickle.UnpicklingError, EOFError, ValueError):
+        pass
+    graph = BuildGraph()
+    parseGraph(_ninja(buildDir, "-t", "graph"), buildDir, graph)
+    parseDeps(_ninja(buildDir, "-t", "deps"), buildDir, graph)
+    if not store:
+        return graph
+    temporary = cachePath.with_suffix(f".{os.getpid()}.tmp")
+    with temporary.open("wb") as f:
+        pickle.dump((_cacheVersion, stamp, graph), f)
+    os.replace(temporary, cachePath)
+    return graph
+
+
+@dataclass
+class ImpactReport:
+    # Kind -> affected outputs
+    affected: dict[OutputKind, list[str]]
+    # Targets whose build rebuilds everything affected
+    targets: list[str]
+    # Estimated build time of all affected outputs one after the other
+    serialSeconds: float
+    # Estimated build time with unlimited parallelism
+    criticalPathSeconds: float
+    # Outputs without a recorded duration, estimated from their kind
+    estimated: int
+    # Whether CMake files changed, so ninja reconfigures first
+    reconfigure: bool
+
+    def toJson(self) -> dict:
+        return {
+            "affected": {str(k): v for k, v in self.affected.items()},
+            "targets": self.targets,
+            "serialSeconds": self.serialSeconds,
+            "criticalPathSeconds": self.criticalPathSeconds,
+            "estimated": self.estimated,
+            "reconfigure": self.reconfigure,
+        }
+
+
+class ImpactAnalyzer(LoggerMixin):
+    """Tell what a change to source files rebuilds in an existing build
+    directory, and roughly how long that takes"""
+
+    _buildDir: Path
+    _graph: BuildGraph
+    _durations: dict[str, float]
+
+    def __init__(
+        self,
+        buildDir: Path,
+        graph: BuildGraph | None = None,
+        durations: dict[str, float] | None = None,
+    ) -> None:
+        super().__init__()
+        self._buildDir = buildDir.resolve()
+        self._graph = graph if graph is not None else loadGraph(self._buildDir)
+        if durations is None:
+            logPath = self._buildDir / ".ninja_log"
+            durations = (
+                parseNinjaLog(logPath.read_text(), self._buildDir)
+                if logPath.is_file()
+                else dict()
+            )
+        self._durations = durations
+
+    def _affected(self, changedFiles: Iterable[Path]) -> set[str]:
+        affected: set[str] = set()
+        pending = [str(path.resolve()) for path in changedFiles]
+        while pending:
+            for output in self._graph.dependents.get(pending.pop(), ()):
+                if output not in affected:
+                    affected.add(output)
+                    pending.append(output)
+        return affected
+
+    def _costs(self, outputs: set[str]) -> tuple[dict[str, float], int]:
+        """Duration of each output, using the median of its kind where no
+        run was recorded"""
+        byKind: dict[OutputKind | None, list[float]] = dict()
+        for output, seconds in self._durations.items():
+            kind = _outputKind(self._graph.rules.get(output, "phony"))
+            byKind.setdefault(kind, []).append(seconds)
+        costs: dict[str, float] = dict()
+        estimated = 0
+        for output in outputs:
+            kind = _outputKind(self._graph.rules.get(output, "phony"))
+            if kind is None:
+                costs[output] = 0.0
+            elif output in self._durations:
+                costs[output] = self._durations[output]
+            else:
+                known = byKind.get(kind)
+                costs[output] = statistics.median(known) if known else 0.0
+                estimated += 1
+        return costs, estimated
+
+    def _criticalPath(
+        self, outputs: set[str], costs: dict[str, float]
+    ) -> float:
+        finish: dict[str, float] = dict()
+        # Outputs in dependency order, so inputs are finished first
+        order: list[str] = []
+        visited: set[str] = set()
+        for root in outputs:
+            stack = [(root, False)]
+            while stack:
+                node, expanded = stack.pop()
+                if expanded:
+                    order.append(node)
+                    continue
+                if node in visited:
+                    continue
+                visited.add(node)
+                stack.append((node, True))
+                for path in self._graph.inputs.get(node, ()):
+                    if path in outputs and path not in visited:
+                        stack.append((path, False))
+        for node in order:
+            finish[node] = costs[node] + max(
+                (
+                    finish[path]
+                    for path in self._graph.inputs.get(node, ())
+                    if path in finish
+                ),
+                default=0.0,
+            )
+        return max(finish.values(), default=0.0)
+
+    def _relative(self, path: str) -> str:
+        return os.path.relpath(path, self._buildDir)
+
+    def analyze(self, changedFiles: Sequence[Path]) -> ImpactReport:
+        affected = self._affected(changedFiles)
+        # Targets are the affected outputs no other affected output, apart
+        # from phony ones such as `all`, consumes
+        consumed = {
+            path
+            for output in affected
+            if _outputKind(self._graph.rules.get(output, "phony")) is not None
+            for path in self._graph.inputs.get(output, ())
+        }
+        report: dict[OutputKind, list[str]] = dict()
+        targets: list[str] = []
+        for output in sorted(affected):
+            kind = _outputKind(self._graph.rules.get(output, "phony"))
+            if kind is None:
+                continue
+            report.setdefault(kind, []).append(self._relative(output))
+            if output not in consumed:
+                targets.append(self._relative(output))
+        costs, estimated = self._costs(affected)
+        return ImpactReport(
+            affected=report,
+            targets=targets,
+            serialSeconds=sum(costs.values()),
+            criticalPathSeconds=self._criticalPath(affected, costs),
+            estimated=estimated,
+            reconfigure=any(
+                path.name in _cmakeFileNames
+                or path.name.endswith(_cmakeFileSuffixes)
+                for path in changedFiles
+            ),
+        )
+
+
+def _cmakeHomeDirectory(buildDir: Path) -> Path | None:
+    cache = buildDir / "CMakeCache.txt"
+    if not cache.is_file():
+        return None
+    for line in cache.read_text().splitlines():
+        if line.startswith("CMAKE_HOME_DIRECTORY:"):
+            return Path(line.partition("=")[2])
+    return None
+
+
+def changedFiles(srcDir: Path, base: str) -> list[Path]:
+    """Files of the repository containing srcDir that differ from base,
+    including uncommitted changes"""
+    topLevel = Path(
+        subprocess.check_output(
+            ["git", "-C", str(srcDir), "rev-parse", "--show-toplevel"],
+            text=True,
+        ).strip()
+    )
+    names = subprocess.check_output(
+        ["git", "-C", str(topLevel), "diff", "--name-only", base, "--"],
+        text=True,
+    ).splitlines()
+    return [topLevel / name for name in names if name]
+
+
+def _formatSeconds(seconds: float) -> str:
+    minutes, seconds = divmod(round(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02}:{seconds:02}"
+
+
+def _parseArgs(args: Sequence[str]) -> Namespace:
+    parser = ArgumentParser(
+        prog="llvm-build impact",
+        description="Report what a source change rebuilds in a build "
+        "directory and how long it takes",
+    )
+    parser.add_argument("--build-dir", type=Path, required=True)
+    parser.add_argument(
+        "--src-dir",
+        type=Path,
+        default=None,
+        help="Defaults to the source directory the build was configured with",
+    )
+    parser.add_argument(
+        "--base",
+        default="HEAD",
+        help="Revision to diff the source tree against",
+    )
+    parser.add_argument(
+        "--files",
+        type=Path,
+        nargs="+",
+        default=None,
+        help="Changed files, instead of diffing the source tree",
+    )
+    parser.add_argument("--json", action="store_true", default=False)
+    parser.add_argument(
+        "--build",
+        action="store_true",
+        default=False,
+        help="Build the affected targets",
+    )
+    parser.add_argument("--jobs", type=int, default=None)
+    return parser.parse_args(args)
+
+
+def main(args: Sequence[str] | None = None) -> None:
+    parsedArgs = _parseArgs(sys.argv[1:] if args is None else args)
+    buildDir: Path = parsedArgs.build_dir.resolve()
+    srcDir = parsedArgs.src_dir or _cmakeHomeDirectory(buildDir)
+    if parsedArgs.files is not None:
+        files = list(parsedArgs.files)
+    elif srcDir is not None:
+        files = changedFiles(srcDir, parsedArgs.base)
+    else:
+        raise RuntimeError(f"cannot tell the source directory of '{buildDir}'")
+    builder: CMakeBuilder | None = None
+    if parsedArgs.build:
+        if srcDir is None:
+            raise RuntimeError(
+                f"cannot tell the source directory of '{buildDir}' to build "
+                "it, pass --src-dir"
+            )
+        builder = CMakeBuilder(srcDir, buildDir)
+    report = ImpactAnalyzer(buildDir).analyze(files)
+    if parsedArgs.json:
+        json.dump(report.toJson(), sys.stdout, indent=2)
+        print()
+    else:
+        if report.reconfigure:
+            print("CMake files changed: the build reconfigures first")
+        for kind in OutputKind:
+            print(f"{kind} outputs: {len(report.affected.get(kind, []))}")
+        print(
+            f"estimated: {_formatSeconds(report.serialSeconds)} serial, "
+            f"{_formatSeconds(report.criticalPathSeconds)} critical path"
+            + (
+                f" ({report.estimated} outputs without history)"
+                if report.estimated
+                else ""
+            )
+        )
+        print("targets:", " ".join(report.targets) or "(none)")
+    if builder is not None and report.targets:
+        builder.setBuildTargets(report.targets)
+        if parsedArgs.jobs is not None:
+            builder.setBuildJobs(parsedArgs.jobs)
+        builder.build()
+
+
+if __name__ == "__main__":
+    main()
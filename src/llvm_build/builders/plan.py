@@ -0,0 +1,136 @@
+import os
+import re
+import shutil
+import statistics
+import subprocess
+from collections.abc import Sequence
+from dataclasses import dataclass
+from pathlib import Path
+
+from llvm_build.builders.build_dirs import diskUsage
+from llvm_build.builders.impact import loadGraph
+from llvm_build.common.ninja import NinjaLog, NinjaLogEntry
+
+_progressPattern = re.compile(r"^\[(\d+)/(\d+)\]")
+_dirtyPattern = re.compile(r"^ninja explain: (.+) is dirty$")
+
+
+@dataclass
+class BuildPrediction:
+    # Edges ninja would run
+    edges: int
+    # Edges without a recorded duration, assumed to take the median
+    estimated: int
+    cpuSeconds: float
+    # Lower bound at the planned parallelism: the work spread over all
+    # jobs, or the longest edge
+    wallSeconds: float
+    jobs: int
+    # "ninja -n", or the .ninja_log of a former build for fresh build
+    # directories; None if neither is there and nothing can be predicted
+    source: str | None
+
+
+def parseDryRun(output: str) -> tuple[int, list[str]]:
+    """Parse `ninja -n -d explain` into the number of edges it would run
+    and the outputs it found dirty"""
+    edges = 0
+    dirty: list[str] = []
+    for line in output.splitlines():
+        if match := _progressPattern.match(line):
+            edges = int(match.group(2))
+        elif match := _dirtyPattern.match(line):
+            dirty.append(match.group(1))
+    return edges, dirty
+
+
+def _edgeDurations(entries: Sequence[NinjaLogEntry]) -> list[float]:
+    """One duration per edge; the outputs of an edge share its record"""
+    edges = {(e.start, e.end, e.commandHash): e.duration for e in entries}
+    return list(edges.values())
+
+
+def _predict(
+    edges: int, durations: list[float], jobs: int, source: str
+) -> BuildPrediction:
+    median = statistics.median(durations) if durations else 0.0
+    estimated = max(0, edges - len(durations))
+    if len(durations) > edges:
+        # Some of the outputs downstream of the dirty ones are not needed
+        # by the targets; their mean duration stands for the edges that are
+        cpuSeconds = statistics.fmean(durations) * edges
+    else:
+        cpuSeconds = sum(durations) + estimated * median
+    longest = max(durations, default=median)
+    return BuildPrediction(
+        edges=edges,
+        estimated=estimated,
+        cpuSeconds=cpuSeconds,
+        wallSeconds=max(cpuSeconds / jobs, longest) if edges else 0.0,
+        jobs=jobs,
+        source=source,
+    )
+
+
+def _withDependents(buildDir: Path, outputs: Sequence[str]) -> set[str]:
+    """Dirty outputs and everything rebuilt after them; ninja only
+    explains the outputs that are dirty before anything runs. Planning
+    leaves the build directory as it is, so the index is not cached."""
+    buildDir = buildDir.resolve()
+    graph = loadGraph(buildDir, store=False)
+    result: set[str] = set()
+    pending = [os.path.normpath(buildDir / output) for output in outputs]
+    while pending:
+        path = pending.pop()
+        if path in result:
+            continue
+        result.add(path)
+        pending.extend(graph.dependents.get(path, ()))
+    return {os.path.relpath(path, buildDir) for path in result}
+
+
+def predictBuild(
+    buildDir: Path,
+    jobs: int,
+    targets: Sequence[str] = (),
+    historyLog: Path | None = None,
+) -> BuildPrediction:
+    """Predict what building targets costs: ask ninja which edges are out
+    of date in a configured build directory, and price them with its
+    .ninja_log or historyLog. A fresh build directory is expected to run
+    every edge of the former build recorded in historyLog."""
+    ownLog = buildDir / ".ninja_log"
+    logPath = ownLog if ownLog.is_file() else historyLog
+    log = NinjaLog.load(logPath) if logPath is not None else None
+    ninja = shutil.which("ninja")
+    if (buildDir / "build.ninja").is_file() and ninja is not None:
+        proc = subprocess.run(
+            [ninja, "-C", str(buildDir), "-n", "-d", "explain", *targets],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        edges, dirty = parseDryRun(proc.stdout + proc.stderr)
+        known = [
+            log.entries[output]
+            for output in (_withDependents(buildDir, dirty) if edges else ())
+            if log is not None and output in log.entries
+        ]
+        return _predict(edges, _edgeDurations(known), jobs, "ninja -n")
+    if log is None:
+        return BuildPrediction(0, 0, 0.0, 0.0, jobs, None)
+    durations = _edgeDurations(list(log.entries.values()))
+    return _predict(len(durations), durations, jobs, str(logPath))
+
+
+def predictPackageSize(
+    packagePath: Path, installDir: Path | None
+) -> tuple[int | None, str | None]:
+    """Expected size of the package and what it is based on: the package
+    of the former build, or else the uncompressed install tree, which
+    bounds it from above"""
+    if packagePath.is_file():
+        return packagePath.stat().st_size, "former package"
+    if installDir is not None and installDir.is_dir():
+        return diskUsage(installDir), "uncompressed install tree"
+    return None, None
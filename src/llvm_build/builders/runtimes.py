@@ -0,0 +1,150 @@
+import asyncio
+import json
+import subprocess
+import time
+from collections.abc import Sequence
+from pathlib import Path
+
+from llvm_build.common.base_builders import AbstractBuilder
+from llvm_build.common.process import runSync
+from llvm_build.common.utils import LoggerMixin
+
+# Written to the directory holding the build directories of the triples
+RUNTIMES_REPORT_NAME = "runtimes-report.json"
+# CMAKE_SYSTEM_NAME by the OS component of a triple
+_systemNames = {
+    "linux": "Linux",
+    "freebsd": "FreeBSD",
+    "darwin": "Darwin",
+    "windows": "Windows",
+    "none": "Generic",
+}
+
+
+def resourceDir(clang: Path) -> Path:
+    """Where clang looks for compiler-rt, e.g. <prefix>/lib/clang/20"""
+    return Path(
+        subprocess.run(
+            [str(clang), "-print-resource-dir"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    )
+
+
+def runtimeTargetDefines(
+    triple: str,
+    runtimes: Sequence[str],
+    clang: Path,
+    installDir: Path,
+) -> dict[str, str]:
+    """Defines configuring llvm-project/runtimes for one triple with a
+    built clang, laid out in installDir like the runtimes of an LLVM build
+    with LLVM_RUNTIME_TARGETS"""
+    defines = {
+        "CMAKE_BUILD_TYPE": "Release",
+        "LLVM_ENABLE_RUNTIMES": ";".join(runtimes),
+        "LLVM_DEFAULT_TARGET_TRIPLE": triple,
+        # Keeps the libraries of the triples apart in lib/<triple>
+        "LLVM_ENABLE_PER_TARGET_RUNTIME_DIR": "ON",
+        "LLVM_INCLUDE_TESTS": "OFF",
+    }
+    for language in ("C", "CXX", "ASM"):
+        defines[f"CMAKE_{language}_COMPILER_TARGET"] = triple
+        # There is no C++ library for the triple before libcxx is built
+        defines[f"CMAKE_{language}_COMPILER_WORKS"] = "ON"
+    parts = triple.split("-")
+    systemName = next(
+        (_systemNames[p] for p in parts if p in _systemNames), None
+    )
+    if systemName is not None:
+        defines["CMAKE_SYSTEM_NAME"] = systemName
+        defines["CMAKE_SYSTEM_PROCESSOR"] = parts[0]
+    if "compiler-rt" in runtimes:
+        defines["COMPILER_RT_DEFAULT_TARGET_ONLY"] = "ON"
+        defines["COMPILER_RT_INSTALL_PATH"] = str(
+            resourceDir(clang).resolve().relative_to(installDir.resolve())
+        )
+    return defines
+
+
+class RuntimesStage(LoggerMixin):
+    """Build the runtimes of several triples side by side, each configured
+    on its own instead of as a sub-build of the LLVM build, so that their
+    configure steps run in parallel and a failing triple does not stop the
+    others. Installations into the shared prefix take turns. The time of
+    each step of each triple is written to the report."""
+
+    _builders: dict[str, AbstractBuilder]
+    _reportPath: Path
+
+    def __init__(
+        self, builders: dict[str, AbstractBuilder], reportPath: Path
+    ) -> None:
+        super().__init__()
+        self._builders = builders
+        self._reportPath = reportPath
+
+    async def _runTarget(
+        self,
+        triple: str,
+        builder: AbstractBuilder,
+        installLock: asyncio.Lock,
+        report: dict,
+    ) -> None:
+        seconds: dict[str, float] = dict()
+        report[triple] = {"seconds": seconds, "error": None}
+        step = "configure"
+        try:
+            start = time.monotonic()
+            await builder.configureAsync()
+            seconds[step] = time.monotonic() - start
+            step = "build"
+            start = time.monotonic()
+            await builder.buildAsync()
+            seconds[step] = time.monotonic() - start
+            step = "install"
+            async with installLock:
+                start = time.monotonic()
+                await builder.installAsync()
+                seconds[step] = time.monotonic() - start
+        except (RuntimeError, subprocess.CalledProcessError) as e:
+            self.logger.error(
+                "%s of runtimes for %s failed: %s", step, triple, e
+            )
+            report[triple]["error"] = f"{step}: {e}"
+
+    def run(self) -> None:
+        runSync(self.runAsync())
+
+    async def runAsync(self) -> None:
+        report: dict[str, dict] = dict()
+        installLock = asyncio.Lock()
+        try:
+            await asyncio.gather(
+                *(
+                    self._runTarget(triple, builder, installLock, report)
+                    for triple, builder in self._builders.items()
+                )
+            )
+        finally:
+            self._reportPath.parent.mkdir(parents=True, exist_ok=True)
+            self._reportPath.write_text(json.dumps(report, indent=2))
+        for triple, result in report.items():
+            self.logger.info(
+                "runtimes for %s: %s",
+                triple,
+                ", ".join(
+                    f"{step} {seconds:.1f}s"
+                    for step, seconds in result["seconds"].items()
+                ),
+            )
+        failed = [
+            triple for triple, result in report.items() if result["error"]
+        ]
+        if failed:
+            raise RuntimeError(
+                f"runtimes failed for {', '.join(failed)}, see "
+                f"{self._reportPath}"
+            )
@@ -0,0 +1,253 @@
+import os
+import pickle
+import re
+import shlex
+import subprocess
+from collections.abc import Iterable, Mapping, Sequence
+from pathlib import Path
+
+from llvm_build.builders.impact import (
+    BuildGraph,
+    ImpactAnalyzer,
+    OutputKind,
+    changedFiles,
+)
+from llvm_build.common.utils import LoggerMixin
+
+_indexName = ".llvm-build-test-index.pickle"
+# Source paths relative to the repository, mapped to test directories in
+# the order they are tried; the first rule naming an existing directory
+# wins
+_staticRules: list[tuple[re.Pattern[str], tuple[str, ...]]] = [
+    (
+        re.compile(r"^(?P<p>[^/]+)/lib/Target/(?P<d>[^/]+)/"),
+        (
+            "{p}/test/CodeGen/{d}",
+            "{p}/test/MC/{d}",
+            "{p}/test/MC/Disassembler/{d}",
+            "{p}/test/Transforms/CodeGenPrepare/{d}",
+        ),
+    ),
+    (
+        re.compile(r"^(?P<p>[^/]+)/lib/Transforms/(?P<d>[^/]+)/"),
+        ("{p}/test/Transforms/{d}",),
+    ),
+    (
+        re.compile(r"^(?P<p>[^/]+)/lib/(?P<d>[^/]+)/"),
+        ("{p}/test/{d}",),
+    ),
+    (
+        re.compile(r"^(?P<p>[^/]+)/tools/(?P<d>[^/]+)/"),
+        ("{p}/test/tools/{d}", "{p}/test/{d}"),
+    ),
+]
+_litConfigNames = ("lit.local.cfg", "lit.cfg.py", "lit.site.cfg.py.in")
+# Substitutions naming a tool differently
+_toolSubstitutions = {
+    "clang_cc1": "clang",
+    "clang_cl": "clang",
+    "clangxx": "clang",
+    "llc_dwarf": "llc",
+    "lld": "ld.lld",
+}
+# Commands that run the command following them
+_wrappers = frozenset(("not", "env"))
+
+
+def _repoRelative(path: Path, topLevel: Path) -> str | None:
+    try:
+        return path.resolve().relative_to(topLevel).as_posix()
+    except ValueError:
+        return None
+
+
+def runLineTools(text: str) -> set[str]:
+    """Names of the tools a lit test runs, with substitutions such as
+    %clang_cc1 resolved to the binary"""
+    tools: set[str] = set()
+    command = ""
+    for line in text.splitlines():
+        _, sep, rest = line.partition("RUN:")
+        if not sep:
+            continue
+        command += rest.strip()
+        if command.endswith("\\"):
+            command = command[:-1] + " "
+            continue
+        for part in re.split(r"\||&&|;", command):
+            try:
+                words = shlex.split(part)
+            except ValueError:
+                words = part.split()
+            for word in words:
+                if word in _wrappers or re.match(r"^\w+=", word):
+                    continue
+                name = word.lstrip("%").rstrip("}")
+                tools.add(_toolSubstitutions.get(name, os.path.basename(name)))
+                break
+        command = ""
+    return tools
+
+
+class RunLineIndex(LoggerMixin):
+    """Tools invoked by the RUN lines of each test below some directories,
+    cached in the build directory and rescanned per file on mtime change"""
+
+    _cachePath: Path
+    _entries: dict[str, tuple[int, frozenset[str]]]
+
+    def __init__(self, buildDir: Path) -> None:
+        super().__init__()
+        self._cachePath = buildDir / _indexName
+        try:
+            with self._cachePath.open("rb") as f:
+                self._entries = pickle.load(f)
+        except (FileNotFoundError, pickle.UnpicklingError, EOFError):
+            self._entries = dict()
+
+    def _scan(self, testDirs: Iterable[Path]) -> dict[str, frozenset[str]]:
+        entries: dict[str, tuple[int, frozenset[str]]] = dict()
+        scanned = 0
+        for testDir in testDirs:
+            for directory, dirNames, files in os.walk(testDir):
+                dirNames[:] = [d for d in dirNames if d != "Inputs"]
+                for name in files:
+                    path = os.path.join(directory, name)
+                    mtime = os.stat(path).st_mtime_ns
+                    cached = self._entries.get(path)
+                    if cached is not None and cached[0] == mtime:
+                        entries[path] = cached
+                        continue
+                    try:
+                        with open(path, errors="replace") as f:
+                            tools = runLineTools(f.read())
+                    except OSError:
+                        continue
+                    entries[path] = (mtime, frozenset(tools))
+                    scanned += 1
+        if scanned:
+            self.logger.info("Scanned RUN lines of %d tests", scanned)
+            self._entries = entries
+            temporary = self._cachePath.with_suffix(f".{os.getpid()}.tmp")
+            with temporary.open("wb") as f:
+                pickle.dump(entries, f)
+            os.replace(temporary, self._cachePath)
+        return {path: tools for path, (_, tools) in entries.items() if tools}
+
+    def testsUsing(
+        self, tools: set[str], testDirs: Iterable[Path]
+    ) -> list[Path]:
+        return sorted(
+            Path(path)
+            for path, used in self._scan(testDirs).items()
+            if used & tools
+        )
+
+
+class ChangeTestSelector(LoggerMixin):
+    """Pick the lit tests to run for a change. Changed tests and lit
+    configurations select themselves; source files map to test directories
+    by path rules first, and otherwise to the tests running a tool that
+    links the changed code, according to the ninja graph of the build."""
+
+    _topLevel: Path
+    _changedFiles: list[Path]
+    _rules: dict[str, list[str]]
+    _fallbackToFull: bool
+    # Loaded from the build directory if None
+    _graph: BuildGraph | None
+
+    def __init__(
+        self,
+        topLevel: Path,
+        changedFiles: Sequence[Path],
+        rules: Mapping[str, Sequence[str]] | None = None,
+        fallbackToFull: bool = False,
+        graph: BuildGraph | None = None,
+    ) -> None:
+        """`rules` map source path prefixes to test directories, both
+        relative to the repository, ahead of the built-in rules. With
+        `fallbackToFull`, a change no rule or tool maps runs everything."""
+        super().__init__()
+        self._graph = graph
+        self._topLevel = topLevel.resolve()
+        self._changedFiles = list(changedFiles)
+        self._rules = {k: list(v) for k, v in (rules or {}).items()}
+        self._fallbackToFull = fallbackToFull
+
+    @classmethod
+    def fromGit(cls, srcDir: Path, base: str, **kwargs) -> "ChangeTestSelector":
+        topLevel = subprocess.check_output(
+            ["git", "-C", str(srcDir), "rev-parse", "--show-toplevel"],
+            text=True,
+        ).strip()
+        return cls(Path(topLevel), changedFiles(srcDir, base), **kwargs)
+
+    def _static(self, relative: str) -> list[Path] | None:
+        parts = relative.split("/")
+        if "test" in parts[:-1]:
+            path = self._topLevel / relative
+            if parts[-1] in _litConfigNames:
+                return [path.parent]
+            return [path] if path.exists() else []
+        for prefix, dirs in self._rules.items():
+            if relative.startswith(prefix):
+                return [self._topLevel / d for d in dirs]
+        for pattern, templates in _staticRules:
+            match = pattern.match(relative)
+            if match is None:
+                continue
+            dirs = [
+                self._topLevel / t.format(**match.groupdict())
+                for t in templates
+            ]
+            dirs = [d for d in dirs if d.is_dir()]
+            if dirs:
+                return dirs
+        return None
+
+    def _testDirs(self) -> list[Path]:
+        return sorted(p for p in self._topLevel.glob("*/test") if p.is_dir())
+
+    def _dynamic(self, buildDir: Path, files: list[Path]) -> list[Path] | None:
+        try:
+            report = ImpactAnalyzer(buildDir, self._graph).analyze(files)
+        except (RuntimeError, subprocess.CalledProcessError, OSError) as e:
+            self.logger.warning("no build graph to map changes: %s", e)
+            return None
+        tools = {
+            os.path.basename(path)
+            for path in report.affected.get(OutputKind.EXECUTABLE, [])
+        }
+        if not tools:
+            return None
+        self.logger.info("Changes reach %s", ", ".join(sorted(tools)))
+        return RunLineIndex(buildDir).testsUsing(tools, self._testDirs())
+
+    def select(self, buildDir: Path) -> list[Path] | None:
+        """Test files and directories to run, or None for the full suite"""
+        selected: set[Path] = set()
+        unmapped: list[Path] = []
+        for path in self._changedFiles:
+            relative = _repoRelative(path, self._topLevel)
+            found = None if relative is None else self._static(relative)
+            if found is None:
+                unmapped.append(path)
+            else:
+                selected.update(found)
+        if unmapped:
+            found = self._dynamic(buildDir, unmapped)
+            if found is not None:
+                selected.update(found)
+            elif self._fallbackToFull:
+                self.logger.info(
+                    "No tests map to %s, running the full suite",
+                    ", ".join(str(p) for p in unmapped),
+                )
+                return None
+            else:
+                self.logger.warning(
+                    "No tests map to %s",
+                    ", ".join(str(p) for p in unmapped),
+                )
+        return sorted(selected)
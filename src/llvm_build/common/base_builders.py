@@ -1,14 +1,37 @@
 import abc
+import asyncio
 import datetime
+import json
 import os
 import shutil
 import subprocess
+import sys
+import time
+from collections.abc import Callable
 from contextlib import contextmanager
 from enum import StrEnum
 from pathlib import Path
 
+from llvm_build.common.check_cache import CheckCache
+from llvm_build.common.cmake import readCacheEntry
+from llvm_build.common.lit_shards import (
+    FAILURE_CODES,
+    LitCommand,
+    ShardedLitRun,
+    parseQueryInputs,
+)
+from llvm_build.common.oom import (
+    OutputTail,
+    memoryEventsPath,
+    oomCause,
+    readOomKills,
+)
+from llvm_build.common.process import ProcessRunner, runSync
 from llvm_build.common.utils import FileSystemHelper, LoggerMixin
 
+# Attempts of the build stage, written to the build directory
+BUILD_REPORT_NAME = "build-report.json"
+
 
 class BuilderKind(StrEnum):
     CMAKE = "cmake"
@@ -24,6 +47,23 @@ class AbstractBuilder(abc.ABC, LoggerMixin):
     @abc.abstractmethod
     def install(self) -> None: ...
 
+    def test(self) -> None:
+        """Run the tests of the build; builders without tests do nothing"""
+
+    # Builders running their commands with ProcessRunner override these; by
+    # default the blocking stages run on a worker thread
+    async def configureAsync(self) -> None:
+        await asyncio.to_thread(self.configure)
+
+    async def buildAsync(self) -> None:
+        await asyncio.to_thread(self.build)
+
+    async def installAsync(self) -> None:
+        await asyncio.to_thread(self.install)
+
+    async def testAsync(self) -> None:
+        await asyncio.to_thread(self.test)
+
 
 class TimedBuilder(AbstractBuilder):
     _builder: AbstractBuilder
@@ -55,6 +95,26 @@ class TimedBuilder(AbstractBuilder):
         with self._timingContext("Installation"):
             self._builder.install()
 
+    def test(self) -> None:
+        with self._timingContext("Testing"):
+            self._builder.test()
+
+    async def configureAsync(self) -> None:
+        with self._timingContext("Configuration"):
+            await self._builder.configureAsync()
+
+    async def buildAsync(self) -> None:
+        with self._timingContext("Building"):
+            await self._builder.buildAsync()
+
+    async def installAsync(self) -> None:
+        with self._timingContext("Installation"):
+            await self._builder.installAsync()
+
+    async def testAsync(self) -> None:
+        with self._timingContext("Testing"):
+            await self._builder.testAsync()
+
 
 class AbstractCMakeDefineProvider(abc.ABC):
     @abc.abstractmethod
@@ -79,7 +139,26 @@ class CMakeBuilder(AbstractBuilder):
     # If set None, path to cmake will be found out from $PATH
     _customCMakePath: Path | None
     _buildTargets: list[str]
+    # If empty, `cmake --install` installs everything
+    _installTargets: list[str]
+    # Check targets such as check-llvm, run by the test stage
+    _testTargets: list[str]
+    # Number of lit processes, one per build job if None
+    _testShards: int | None
+    # Given the build directory, the tests to run, or None for all of them
+    _testSelection: Callable[[Path], list[Path] | None] | None
     _initialCache: Path | None
+    # Configure check results shared between build directories
+    _checkCache: CheckCache | None
+    # If set None, the build tool decides the parallelism
+    _buildJobs: int | None
+    # Seconds a command may run, or stay silent, before it is terminated
+    _timeout: float | None
+    _inactivityTimeout: float | None
+    # Times an OOM-killed build is resumed with fewer jobs
+    _oomRetries: int
+    # cgroup memory.events confirming OOM kills, that of this process if None
+    _memoryEvents: Path | None
 
     def __init__(self, srcDir: Path, buildDir: Path) -> None:
         super().__init__()
@@ -91,7 +170,17 @@ class CMakeBuilder(AbstractBuilder):
         self._installDir = None
         self._customCMakePath = None
         self._buildTargets = []
+        self._installTargets = []
+        self._testTargets = []
+        self._testShards = None
+        self._testSelection = None
         self._initialCache = None
+        self._checkCache = None
+        self._buildJobs = None
+        self._timeout = None
+        self._inactivityTimeout = None
+        self._oomRetries = 0
+        self._memoryEvents = None
 
     def getSrcDir(self) -> Path:
         return self._srcDir
@@ -111,9 +200,69 @@ class CMakeBuilder(AbstractBuilder):
     def setCustomCMakePath(self, cmakePath: Path) -> None:
         self._customCMakePath = cmakePath
 
+    def setBuildTargets(self, targets: list[str]) -> None:
+        self._buildTargets = targets
+
+    def setInstallTargets(self, targets: list[str]) -> None:
+        """Install by building targets such as install-distribution, which
+        install into the prefix given at configuration"""
+        self._installTargets = targets
+
+    def setTestTargets(
+        self, targets: list[str], shards: int | None = None
+    ) -> None:
+        self._testTargets = targets
+        self._testShards = shards
+
+    def setTestSelection(
+        self, selection: Callable[[Path], list[Path] | None] | None
+    ) -> None:
+        """Run only some tests of the check targets, e.g. those a change
+        affects; the selection is made once the build graph is up to date"""
+        self._testSelection = selection
+
     def setInitialCache(self, cache: Path) -> None:
         self._initialCache = cache
 
+    def setCheckCache(self, checkCache: CheckCache) -> None:
+        self._checkCache = checkCache
+
+    def setBuildJobs(self, jobs: int) -> None:
+        self._buildJobs = jobs
+
+    def setTimeouts(
+        self, timeout: float | None, inactivityTimeout: float | None
+    ) -> None:
+        self._timeout = timeout
+        self._inactivityTimeout = inactivityTimeout
+
+    def getBuildJobs(self) -> int | None:
+        return self._buildJobs
+
+    def getBuildTargets(self) -> list[str]:
+        return self._buildTargets
+
+    def commands(self) -> dict[str, list[str]]:
+        """The configure, build and install commands as they would run"""
+        return {
+            "configure": self._configureCommand(),
+            "build": self._buildCommand(self._buildTargets),
+            "install": self._installCommand(),
+        }
+
+    def setOomRetries(
+        self, retries: int, memoryEvents: Path | None = None
+    ) -> None:
+        self._oomRetries = retries
+        self._memoryEvents = memoryEvents
+
+    async def _run(self, args: list[str]) -> None:
+        await ProcessRunner(
+            args,
+            timeout=self._timeout,
+            inactivityTimeout=self._inactivityTimeout,
+        ).check()
+
     def setDefineProvider(
         self, defineProvider: AbstractCMakeDefineProvider
     ) -> None:
@@ -138,12 +287,10 @@ class CMakeBuilder(AbstractBuilder):
             raise RuntimeError("cannot find cmake")
         return cmakePath
 
-    def _doConfig(self) -> None:
-        cmakePath = self._findCMakeOrRaise()
-        FileSystemHelper.check_dir(self._srcDir)
-        FileSystemHelper.create_dir(self._buildDir)
+    def _configureCommand(self, initialCache: Path | None = None) -> list[str]:
+        initialCache = initialCache or self._initialCache
         args: list[str] = [
-            str(cmakePath),
+            str(self._findCMakeOrRaise()),
             "-S",
             str(self._srcDir),
             "-B",
@@ -152,57 +299,251 @@ class CMakeBuilder(AbstractBuilder):
         if self._generator is not CMakeGenerator.DDEFAULT:
             args.append("-G")
             args.append(self._generator.value)
-        if self._initialCache:
-            FileSystemHelper.check_file(self._initialCache)
+        if initialCache:
             args.append("-C")
-            args.append(str(self._initialCache))
+            args.append(str(initialCache))
 
+        if self._installTargets and self._installDir:
+            args.append(f"-DCMAKE_INSTALL_PREFIX={self._installDir}")
         if self._defineProvider is not None:
             for key, value in self._defineProvider.getDefines().items():
                 args.append(f"-D{key}={value}")
+        return args
 
+    async def _doConfig(self) -> None:
+        FileSystemHelper.check_dir(self._srcDir)
+        FileSystemHelper.create_dir(self._buildDir)
+        if self._initialCache:
+            FileSystemHelper.check_file(self._initialCache)
+        key = initialCache = None
+        if self._checkCache is not None:
+            defines = (
+                self._defineProvider.getDefines()
+                if self._defineProvider is not None
+                else dict()
+            )
+            key = self._checkCache.key(defines, self._initialCache)
+            if not (self._buildDir / "CMakeCache.txt").exists():
+                initialCache = self._checkCache.initialCache(
+                    key, self._initialCache, self._buildDir
+                )
+        args = self._configureCommand(initialCache)
         self.logger.info(
             "Configuration command is: %s%s",
             os.linesep,
             FileSystemHelper.convertCommandToStr(*args),
         )
 
-        subprocess.check_call(args)
+        await self._run(args)
+        if self._checkCache is not None and key is not None:
+            self._checkCache.store(key, self._buildDir / "CMakeCache.txt")
 
     def configure(self) -> None:
+        runSync(self.configureAsync())
+
+    async def configureAsync(self) -> None:
         self.logger.info("Start configuration")
-        self._doConfig()
+        await self._doConfig()
 
-    def _doBuild(self) -> None:
-        cmakePath = self._findCMakeOrRaise()
+    def _buildCommand(
+        self, targets: list[str], jobs: int | None = None
+    ) -> list[str]:
         args: list[str] = [
-            str(cmakePath),
+            str(self._findCMakeOrRaise()),
             "--build",
             str(self._buildDir),
         ]
-        if self._buildTargets:
+        jobs = jobs or self._buildJobs
+        if jobs is not None:
+            args.append("--parallel")
+            args.append(str(jobs))
+        if targets:
             args.append("--target")
-            args.extend(self._buildTargets)
-        subprocess.check_call(args)
+            args.extend(targets)
+        return args
+
+    async def _limitLinkJobs(self, linkJobs: int) -> None:
+        """Lower the ninja pool of LLVM link jobs, which changes
+        build.ninja but no command, so nothing is rebuilt"""
+        await self._run(
+            [
+                str(self._findCMakeOrRaise()),
+                "-B",
+                str(self._buildDir),
+                f"-DLLVM_PARALLEL_LINK_JOBS={linkJobs}",
+            ]
+        )
+
+    async def _doBuild(self) -> None:
+        """Build, and resume a build whose compiler or linker was
+        OOM-killed with half the jobs, as long as retries are left. ninja
+        skips what was built before the kill. Every attempt is recorded in
+        the build report."""
+        eventsPath = self._memoryEvents or memoryEventsPath()
+        # None leaves the limit to ninja, or to no link pool at all
+        jobs = self._buildJobs
+        linkJobs: int | None = None
+        entry = readCacheEntry(self._buildDir, "LLVM_PARALLEL_LINK_JOBS")
+        if entry is not None and entry.isdigit():
+            linkJobs = int(entry)
+        attempts: list[dict] = []
+        for retry in range(self._oomRetries + 1):
+            stdout = OutputTail(sys.stdout.buffer)
+            stderr = OutputTail(sys.stderr.buffer)
+            killsBefore = readOomKills(eventsPath)
+            start = time.monotonic()
+            args = self._buildCommand(self._buildTargets, jobs)
+            returncode = await ProcessRunner(
+                args,
+                timeout=self._timeout,
+                inactivityTimeout=self._inactivityTimeout,
+                stdoutSink=stdout,
+                stderrSink=stderr,
+            ).run()
+            cause = None
+            if returncode != 0:
+                cause = oomCause(
+                    returncode,
+                    stdout.text() + stderr.text(),
+                    killsBefore,
+                    readOomKills(eventsPath),
+                )
+            attempts.append(
+                {
+                    "jobs": jobs,
+                    "linkJobs": linkJobs,
+                    "returncode": returncode,
+                    "seconds": time.monotonic() - start,
+                    "oom": cause,
+                }
+            )
+            self._writeBuildReport(attempts)
+            if returncode == 0:
+                return
+            if cause is None or retry == self._oomRetries or jobs == 1:
+                raise subprocess.CalledProcessError(returncode, args)
+            jobs = max(1, (jobs or os.cpu_count() or 1) // 2)
+            if entry is not None:
+                linkJobs = max(1, (linkJobs or jobs * 2) // 2)
+                await self._limitLinkJobs(linkJobs)
+            self.logger.warning(
+                "build was OOM-killed (%s), resuming with %d jobs%s",
+                cause,
+                jobs,
+                "" if linkJobs is None else f" and {linkJobs} link jobs",
+            )
+
+    def _writeBuildReport(self, attempts: list[dict]) -> None:
+        with (self._buildDir / BUILD_REPORT_NAME).open("w") as f:
+            json.dump(
+                {"targets": self._buildTargets, "attempts": attempts},
+                f,
+                indent=2,
+            )
 
     def build(self) -> None:
+        runSync(self.buildAsync())
+
+    async def buildAsync(self) -> None:
         self.logger.info("Start building")
-        self._doBuild()
+        await self._doBuild()
 
-    def _doInstall(self) -> None:
+    def clean(self) -> None:
+        """Remove build outputs while keeping the configuration"""
+        self.logger.info("Start cleaning")
         cmakePath = self._findCMakeOrRaise()
         FileSystemHelper.check_dir(self._buildDir)
+        runSync(
+            self._run(
+                [
+                    str(cmakePath),
+                    "--build",
+                    str(self._buildDir),
+                    "--target",
+                    "clean",
+                ]
+            )
+        )
+
+    def _installCommand(self) -> list[str]:
+        if self._installTargets:
+            return self._buildCommand(self._installTargets)
         args: list[str] = [
-            str(cmakePath),
+            str(self._findCMakeOrRaise()),
             "--install",
             str(self._buildDir),
         ]
         if self._installDir:
-            FileSystemHelper.create_dir(self._installDir)
             args.append("--prefix")
             args.append(str(self._installDir))
-        subprocess.check_call(args)
+        return args
+
+    async def _doInstall(self) -> None:
+        FileSystemHelper.check_dir(self._buildDir)
+        if self._installDir:
+            FileSystemHelper.create_dir(self._installDir)
+        await self._run(self._installCommand())
 
     def install(self) -> None:
+        runSync(self.installAsync())
+
+    async def installAsync(self) -> None:
         self.logger.info("Start installation")
-        self._doInstall()
+        await self._doInstall()
+
+    async def _ninja(self, *args: str) -> str:
+        ninja = shutil.which("ninja")
+        if ninja is None:
+            raise RuntimeError("cannot find ninja")
+        chunks: list[bytes] = []
+        await ProcessRunner(
+            [ninja, "-C", str(self._buildDir), *args], stdoutSink=chunks.append
+        ).check()
+        return b"".join(chunks).decode()
+
+    async def _doTest(self) -> None:
+        """Build what each check target depends on, then run its lit
+        command in shards instead of running the target itself"""
+        if self._generator is not CMakeGenerator.NINJA:
+            raise RuntimeError("the test stage needs the Ninja generator")
+        FileSystemHelper.check_dir(self._buildDir)
+        jobs = self._buildJobs or os.cpu_count() or 1
+        selection = None
+        if self._testSelection is not None:
+            selection = self._testSelection(self._buildDir)
+        failures = 0
+        for target in self._testTargets:
+            # The custom command behind the phony check target
+            rule = f"CMakeFiles/{target}"
+            inputs = parseQueryInputs(await self._ninja("-t", "query", rule))
+            if inputs:
+                await self._run(self._buildCommand(inputs))
+            commands = await self._ninja("-t", "commands", "-s", rule)
+            run = ShardedLitRun(
+                LitCommand.parse(commands.strip().splitlines()[-1]),
+                self._testShards or jobs,
+                jobs,
+                selection,
+            )
+            report = await run.run(
+                self._buildDir / "check-results" / f"{target}.json"
+            )
+            failed = [t for t in report["tests"] if t["code"] in FAILURE_CODES]
+            self.logger.info(
+                "%s: %d tests, %d failed",
+                target,
+                len(report["tests"]),
+                len(failed),
+            )
+            failures += len(failed)
+        if failures:
+            raise RuntimeError(f"{failures} tests failed")
+
+    def test(self) -> None:
+        runSync(self.testAsync())
+
+    async def testAsync(self) -> None:
+        if not self._testTargets:
+            return
+        self.logger.info("Start testing")
+        await self._doTest()
@@ -0,0 +1,142 @@
+import hashlib
+import os
+import re
+from pathlib import Path
+
+from llvm_build.common.utils import FileSystemHelper, LoggerMixin
+
+# Results of check_include_file, check_cxx_source_compiles,
+# check_c_compiler_flag, check_type_size and friends, which CMake keeps as
+# INTERNAL cache entries; failed checks have an empty value
+_checkName = re.compile(
+    r"^(?!CMAKE_)\w*?(?:HAVE|HAS|SUPPORTS|COMPILES|RUNS|SIZEOF)\w*$"
+)
+_entryPattern = re.compile(r"^([A-Za-z0-9_]+):INTERNAL=(.*)$")
+# Defines of the configure command that decide the outcome of checks
+_keyDefine = re.compile(
+    r"^CMAKE_(?:\w+_)?(?:COMPILER|FLAGS|SYSROOT)\w*$"
+    r"|^CMAKE_\w*LINKER\w*$"
+    r"|^CMAKE_SYSTEM_\w+$"
+    r"|^CMAKE_(?:CROSSCOMPILING|TOOLCHAIN_FILE)$"
+    r"|^LLVM_USE_LINKER$"
+    r"|^LLVM_ENABLE_LIBCXX$"
+)
+_compilerDefines = ("CMAKE_C_COMPILER", "CMAKE_CXX_COMPILER")
+_setPattern = re.compile(r'^set\((\w+) "(.*)" CACHE INTERNAL ""\)$')
+
+
+def defaultCheckCacheDir() -> Path:
+    cacheHome = os.environ.get("XDG_CACHE_HOME")
+    return (
+        (Path(cacheHome) if cacheHome else Path.home() / ".cache")
+        / "llvm-build"
+        / "check-cache"
+    )
+
+
+def parseCheckResults(text: str) -> dict[str, str]:
+    """Check results among the entries of a CMakeCache.txt"""
+    results: dict[str, str] = dict()
+    for line in text.splitlines():
+        match = _entryPattern.match(line)
+        if match is not None and _checkName.match(match.group(1)):
+            results[match.group(1)] = match.group(2)
+    return results
+
+
+def compilerFingerprint(compiler: str) -> str | None:
+    """Tell builds of a compiler apart by size and mtime, cheaper than
+    hashing it; None if it is not a file, e.g. looked up in $PATH"""
+    if not os.path.isfile(compiler):
+        return None
+    status = os.stat(compiler)
+    return f"{status.st_size}:{status.st_mtime_ns}"
+
+
+def _quote(value: str) -> str:
+    escaped = re.sub(r'([\\"$])', r"\\\1", value)
+    return f'"{escaped}"'
+
+
+class CheckCache(LoggerMixin):
+    """Results of the configure checks of former build directories, keyed
+    by a fingerprint of the compilers and the flags given to CMake. A fresh
+    build directory is configured with an initial cache presetting them, so
+    that CMake skips the checks, each of which compiles a test program.
+    Compilers are told apart by path, size and mtime; files of a sysroot
+    and scripts the initial cache includes are not, so a changed sysroot
+    needs a new path or an empty cache."""
+
+    _cacheDir: Path
+
+    def __init__(self, cacheDir: Path) -> None:
+        super().__init__()
+        self._cacheDir = cacheDir
+
+    def key(
+        self, defines: dict[str, str], initialCache: Path | None = None
+    ) -> str:
+        """initialCache is the user's -C script, which may set any of the
+        defines, so its content is part of the key"""
+        digest = hashlib.sha256()
+        for name in sorted(defines):
+            if _keyDefine.match(name):
+                digest.update(f"{name}={defines[name]}\0".encode())
+        if initialCache is not None:
+            digest.update(initialCache.read_bytes() + b"\0")
+        for name in _compilerDefines:
+            fingerprint = compilerFingerprint(defines.get(name, ""))
+            if fingerprint is not None:
+                digest.update(f"{fingerprint}\0".encode())
+        return digest.hexdigest()[:32]
+
+    def _path(self, key: str) -> Path:
+        return self._cacheDir / f"{key}.cmake"
+
+    def initialCache(
+        self, key: str, userCache: Path | None, buildDir: Path
+    ) -> Path | None:
+        """Write an initial cache for a fresh build directory: the cached
+        check results, then the user's initial cache, which wins where both
+        set an entry. None if nothing is cached for the key."""
+        path = self._path(key)
+        if not path.is_file():
+            return None
+        FileSystemHelper.create_dir(buildDir)
+        initialCache = buildDir / "llvm-build-initial-cache.cmake"
+        content = path.read_text()
+        if userCache is not None:
+            content += f"include({_quote(str(userCache.resolve()))})\n"
+        initialCache.write_text(content)
+        self.logger.info("Preset configure checks from %s", path)
+        return initialCache
+
+    def store(self, key: str, cmakeCache: Path) -> int:
+        """Merge the check results of a configured build directory into
+        the cache and return their number"""
+        if not cmakeCache.is_file():
+            return 0
+        results = parseCheckResults(cmakeCache.read_text())
+        if not results:
+            return 0
+        path = self._path(key)
+        if path.is_file():
+            cached: dict[str, str] = dict()
+            for line in path.read_text().splitlines():
+                match = _setPattern.match(line)
+                if match is not None:
+                    cached[match.group(1)] = re.sub(
+                        r"\\(.)", r"\1", match.group(2)
+                    )
+            results = {**cached, **results}
+        if not self._cacheDir.exists():
+            FileSystemHelper.create_dir(self._cacheDir)
+        temporary = path.with_suffix(f".{os.getpid()}.tmp")
+        temporary.write_text(
+            "".join(
+                f'set({name} {_quote(value)} CACHE INTERNAL "")\n'
+                for name, value in sorted(results.items())
+            )
+        )
+        os.replace(temporary, path)
+        return len(results)
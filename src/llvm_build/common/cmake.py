@@ -1,4 +1,5 @@
 from enum import Enum
+from pathlib import Path
 
 
 class CMakeBuildType(Enum):
@@ -6,3 +7,15 @@ class CMakeBuildType(Enum):
     RELEASE = "Release"
     RELEASE_WITH_DEBUG_INFO = "RelWithDebInfo"
     MIN_SIZE_RELEASE = "MinSizeRel"
+
+
+def readCacheEntry(buildDir: Path, name: str) -> str | None:
+    """Value of an entry of CMakeCache.txt, None if it is not set"""
+    cache = buildDir / "CMakeCache.txt"
+    if not cache.is_file():
+        return None
+    prefix = f"{name}:"
+    for line in cache.read_text().splitlines():
+        if line.startswith(prefix):
+            return line.partition("=")[2]
+    return None
@@ -0,0 +1,217 @@
+import abc
+import os
+import shlex
+import shutil
+import tarfile
+import tempfile
+from collections.abc import Iterable, Sequence
+from pathlib import Path
+
+from llvm_build.common.process import ProcessRunner, writerSink
+from llvm_build.common.utils import FileSystemHelper, LoggerMixin
+
+
+class AbstractExecutor(abc.ABC, LoggerMixin):
+    """A machine that runs shards of tests or benchmarks. Files are
+    mirrored at their local absolute paths, which build directories and the
+    lit configurations in them hardcode."""
+
+    name: str
+    # Tests a shard runs at once on this machine
+    jobs: int
+    # lit command of the machine, or None to use the local one
+    lit: str | None
+
+    def __init__(
+        self, name: str, jobs: int = 1, lit: str | None = None
+    ) -> None:
+        super().__init__()
+        self.name = name
+        self.jobs = jobs
+        self.lit = lit
+
+    def remotePath(self, path: Path) -> Path:
+        return path
+
+    @abc.abstractmethod
+    async def sync(self, paths: Iterable[Path]) -> None:
+        """Copy files to the executor, skipping those already there"""
+
+    @abc.abstractmethod
+    async def run(self, args: Sequence[str], cwd: Path) -> int:
+        """Run a command, whose paths are already mapped by remotePath, in
+        the mirrored cwd and return its exit code"""
+
+    @abc.abstractmethod
+    async def fetch(self, path: Path, localPath: Path) -> None:
+        """Copy a file back from the executor"""
+
+    @abc.abstractmethod
+    async def fetchFiles(self, paths: Iterable[Path]) -> None:
+        """Move the files a run wrote on the executor, e.g. benchmark
+        counters, to the same local paths. Missing files are skipped."""
+
+
+class LocalExecutor(AbstractExecutor):
+    """Run shards on this machine, where every file already is"""
+
+    def __init__(self, jobs: int = 1) -> None:
+        super().__init__("local", jobs)
+
+    async def sync(self, paths: Iterable[Path]) -> None:
+        for path in paths:
+            FileSystemHelper.check_file(path)
+
+    async def run(self, args: Sequence[str], cwd: Path) -> int:
+        return await ProcessRunner(args, cwd=cwd).run()
+
+    async def fetch(self, path: Path, localPath: Path) -> None:
+        if path.resolve() != localPath.resolve():
+            shutil.copyfile(path, localPath)
+
+    async def fetchFiles(self, paths: Iterable[Path]) -> None:
+        pass
+
+
+class SSHExecutor(AbstractExecutor):
+    """Run shards on a host reached by ssh, which only needs a POSIX shell,
+    tar and the tools the tests run. Files are sent as one tar stream per
+    sync, and only when they changed since they were last sent."""
+
+    _destination: str
+    _root: Path
+    _sshOptions: list[str]
+    # Path -> (mtime, size) of the files sent so far
+    _synced: dict[Path, tuple[int, int]]
+
+    def __init__(
+        self,
+        destination: str,
+        jobs: int = 1,
+        lit: str | None = "lit",
+        sshOptions: Sequence[str] = ("-o", "BatchMode=yes"),
+    ) -> None:
+        super().__init__(destination, jobs, lit)
+        self._destination = destination
+        self._root = Path("/")
+        self._sshOptions = list(sshOptions)
+        self._synced = dict()
+
+    def _shell(self) -> list[str]:
+        """Command running a shell command line on the host"""
+        return ["ssh", *self._sshOptions, self._destination]
+
+    def remotePath(self, path: Path) -> Path:
+        return self._root / path.resolve().relative_to("/")
+
+    async def _check(self, command: str, **kwargs) -> None:
+        returncode = await ProcessRunner(
+            [*self._shell(), command], **kwargs
+        ).run()
+        if returncode != 0:
+            raise RuntimeError(
+                f"'{command}' exited with {returncode} on {self.name}"
+            )
+
+    async def sync(self, paths: Iterable[Path]) -> None:
+        pending: dict[Path, tuple[int, int]] = dict()
+        for path in paths:
+            path = path.resolve()
+            status = os.stat(path)
+            stamp = (status.st_mtime_ns, status.st_size)
+            if self._synced.get(path) != stamp:
+                pending[path] = stamp
+        if not pending:
+            return
+        self.logger.info("Send %d files to %s", len(pending), self.name)
+        with tempfile.NamedTemporaryFile(suffix=".tar") as archive:
+            with tarfile.open(fileobj=archive, mode="w") as tar:
+                for path in pending:
+                    tar.add(path, arcname=str(path.relative_to("/")))
+            archive.flush()
+            root = shlex.quote(str(self._root))
+            await self._check(
+                f"mkdir -p {root} && tar -xf - -C {root}",
+                stdin=Path(archive.name),
+            )
+        self._synced.update(pending)
+
+    async def run(self, args: Sequence[str], cwd: Path) -> int:
+        return await ProcessRunner(
+            [
+                *self._shell(),
+                f"cd {shlex.quote(str(self.remotePath(cwd)))} && "
+                + shlex.join(args),
+            ]
+        ).run()
+
+    async def fetch(self, path: Path, localPath: Path) -> None:
+        with localPath.open("wb") as f:
+            await self._check(
+                f"cat {shlex.quote(str(path))}", stdoutSink=writerSink(f)
+            )
+
+    async def fetchFiles(self, paths: Iterable[Path]) -> None:
+        wanted = {path.resolve() for path in paths}
+        if not wanted:
+            return
+        names = " ".join(
+            shlex.quote(str(path.relative_to("/"))) for path in sorted(wanted)
+        )
+        with tempfile.TemporaryFile(suffix=".tar") as archive:
+            await self._check(
+                f"cd {shlex.quote(str(self._root))} && "
+                f"for f in {names}; do "
+                '[ -f "$f" ] && echo "$f"; '
+                "done | tar -cf - -T - && "
+                f"rm -f {names}",
+                stdoutSink=writerSink(archive),
+            )
+            if archive.tell() == 0:
+                return
+            archive.seek(0)
+            with tarfile.open(fileobj=archive) as tar:
+                members = [
+                    member
+                    for member in tar
+                    if member.isfile() and Path("/", member.name) in wanted
+                ]
+                self.logger.info(
+                    "Fetched %d files from %s", len(members), self.name
+                )
+                tar.extractall("/", members=members, filter="data")
+
+
+class FakeSSHExecutor(SSHExecutor):
+    """Stand-in for an SSH host that runs its commands with a local shell
+    and mirrors files below a local directory, so that everything but the
+    connection itself can be tried without a board. Its commands still see
+    the local files, so absolute paths resolve to those, not the mirror."""
+
+    def __init__(self, root: Path, jobs: int = 1) -> None:
+        super().__init__(f"fake:{root}", jobs, None, sshOptions=())
+        self._root = root
+
+    def _shell(self) -> list[str]:
+        return ["sh", "-c"]
+
+
+def parseExecutor(spec: str) -> AbstractExecutor:
+    """Parse 'local', 'ssh://[user@]host' or 'fake:/root', each optionally
+    followed by '#jobs'"""
+    spec, _, jobs = spec.partition("#")
+    numJobs = int(jobs) if jobs else 1
+    if spec == "local":
+        return LocalExecutor(numJobs)
+    if spec.startswith("ssh://"):
+        destination, _, root = spec.removeprefix("ssh://").partition("/")
+        if root.strip("/"):
+            raise RuntimeError(
+                f"executor '{spec}' names a root directory, but files are "
+                "mirrored at their local paths, which the lit configurations "
+                "of build directories refer to"
+            )
+        return SSHExecutor(destination, numJobs)
+    if spec.startswith("fake:"):
+        return FakeSSHExecutor(Path(spec.removeprefix("fake:")), numJobs)
+    raise RuntimeError(f"unknown executor '{spec}'")
@@ -0,0 +1,105 @@
+import fcntl
+import subprocess
+from collections.abc import Iterator, Sequence
+from contextlib import contextmanager
+from pathlib import Path
+
+from llvm_build.common.process import checkCall
+from llvm_build.common.utils import FileSystemHelper, LoggerMixin
+
+_lockName = "llvm-build.lock"
+
+
+class GitSourceProvider(LoggerMixin):
+    """Check out revisions of a repository as git worktrees of a local bare
+    mirror. Updating the mirror is an incremental fetch, and each worktree
+    only materializes the directories a build needs through a cone-mode
+    sparse checkout. Without a fetch, everything works offline."""
+
+    _mirrorDir: Path
+    _url: str | None
+
+    def __init__(self, mirrorDir: Path, url: str | None = None) -> None:
+        super().__init__()
+        self._mirrorDir = mirrorDir
+        self._url = url
+
+    def _git(self, *args: str, cwd: Path | None = None) -> None:
+        checkCall(["git", "-C", str(cwd or self._mirrorDir), *args])
+
+    def _output(self, *args: str) -> str:
+        return subprocess.check_output(
+            ["git", "-C", str(self._mirrorDir), *args], text=True
+        ).strip()
+
+    def hasMirror(self) -> bool:
+        return (self._mirrorDir / "HEAD").is_file()
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        """Serialize builds sharing the mirror, e.g. variants or the build
+        daemon"""
+        with open(self._mirrorDir / _lockName, "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            yield
+
+    def update(self) -> None:
+        """Create the mirror, or fetch what changed since the last update"""
+        if not self.hasMirror():
+            if self._url is None:
+                raise RuntimeError(
+                    f"'{self._mirrorDir}' is not a git mirror and no url "
+                    "is given to create it from"
+                )
+            self.logger.info("Create mirror of '%s'", self._url)
+            FileSystemHelper.create_dir(self._mirrorDir.parent)
+            checkCall(
+                ["git", "clone", "--mirror", self._url, str(self._mirrorDir)]
+            )
+            return
+        with self._locked():
+            self.logger.info("Fetch into '%s'", self._mirrorDir)
+            self._git("fetch", "--prune", "origin")
+
+    def checkout(
+        self,
+        revision: str,
+        checkoutDir: Path,
+        directories: Sequence[str] | None = None,
+    ) -> str:
+        """Check out `revision` into `checkoutDir`, limited to `directories`
+        (and files at the top level) unless it is None. An existing worktree
+        is moved to the revision in place. Returns the commit hash."""
+        if not self.hasMirror():
+            raise RuntimeError(f"'{self._mirrorDir}' is not a git mirror")
+        with self._locked():
+            commit = self._output(
+                "rev-parse", "--verify", f"{revision}^{{commit}}"
+            )
+            self._git("worktree", "prune")
+            if not (checkoutDir / ".git").exists():
+                self.logger.info("Add worktree '%s'", checkoutDir)
+                FileSystemHelper.create_dir(checkoutDir.parent)
+                self._git(
+                    "worktree",
+                    "add",
+                    "--no-checkout",
+                    "--detach",
+                    str(checkoutDir),
+                    commit,
+                )
+            if directories is None:
+                self._git("sparse-checkout", "disable", cwd=checkoutDir)
+            else:
+                self._git(
+                    "sparse-checkout",
+                    "set",
+                    "--cone",
+                    *sorted(directories),
+                    cwd=checkoutDir,
+                )
+            self.logger.info("Check out %s (%s)", revision, commit)
+            self._git(
+                "checkout", "--detach", "--force", commit, cwd=checkoutDir
+            )
+        return commit
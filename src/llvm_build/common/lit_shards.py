@@ -0,0 +1,299 @@
+import asyncio
+import heapq
+import json
+import os
+import re
+import shlex
+import statistics
+import time
+from collections.abc import Sequence
+from pathlib import Path
+
+from llvm_build.common.process import ProcessRunner
+from llvm_build.common.utils import FileSystemHelper, LoggerMixin
+
+TIMES_NAME = ".lit_test_times.txt"
+# Result codes lit counts as failures, which it records with negative times
+FAILURE_CODES = frozenset(("FAIL", "XPASS", "UNRESOLVED", "TIMEOUT"))
+_suitePattern = re.compile(r"^  (.+) - \d+ tests$")
+_litNames = ("lit", "llvm-lit", "lit.py")
+
+
+class LitCommand:
+    """A lit invocation as found in the build rule of a check target, e.g.
+    `cd test && python bin/llvm-lit -sv test`"""
+
+    cwd: Path | None
+    # Interpreter and lit script
+    lit: list[str]
+    args: list[str]
+    # Test suite directories or files given to lit
+    paths: list[str]
+
+    def __init__(
+        self,
+        lit: Sequence[str],
+        args: Sequence[str],
+        paths: Sequence[str],
+        cwd: Path | None = None,
+    ) -> None:
+        self.lit = list(lit)
+        self.args = list(args)
+        self.paths = list(paths)
+        self.cwd = cwd
+
+    @classmethod
+    def parse(cls, command: str) -> "LitCommand":
+        cwd: Path | None = None
+        tokens: list[str] = []
+        for part in command.split("&&"):
+            words = shlex.split(part)
+            if len(words) == 2 and words[0] == "cd":
+                cwd = Path(words[1])
+            elif words:
+                tokens = words
+        end = next(
+            (
+                i + 1
+                for i, token in enumerate(tokens)
+                if os.path.basename(token) in _litNames
+            ),
+            None,
+        )
+        if end is None:
+            raise RuntimeError(f"no lit invocation in '{command}'")
+        lit, rest = tokens[:end], tokens[end:]
+        args = [t for t in rest if t.startswith("-") or not os.path.exists(t)]
+        paths = [t for t in rest if t not in args]
+        return cls(lit, args, paths, cwd)
+
+
+def parseQueryInputs(output: str) -> list[str]:
+    """Inputs of the first node printed by `ninja -t query`, i.e. what has
+    to be built before its command can run"""
+    inputs: list[str] = []
+    inInputs = False
+    for line in output.splitlines():
+        if line.startswith("  input:"):
+            inInputs = True
+        elif line.startswith("  ") and not line.startswith("    "):
+            if inInputs:
+                break
+        elif inInputs and line.strip():
+            inputs.append(line.strip().lstrip("|").strip())
+    return inputs
+
+
+def parseDiscovery(
+    output: str,
+) -> tuple[dict[str, tuple[Path, Path]], list[str]]:
+    """Parse `lit --show-suites --show-tests` into suite name -> (source
+    root, exec root) and the full names of the tests"""
+    suites: dict[str, tuple[Path, Path]] = dict()
+    tests: list[str] = []
+    suite: str | None = None
+    sourceRoot = Path()
+    inTests = False
+    for line in output.splitlines():
+        if line.startswith("-- Available Tests --"):
+            inTests = True
+        elif inTests:
+            if line.startswith("  ") and " :: " in line:
+                tests.append(line.strip())
+        elif match := _suitePattern.match(line):
+            suite = match.group(1)
+        elif line.startswith("    Source Root: "):
+            sourceRoot = Path(line.partition(": ")[2])
+        elif line.startswith("    Exec Root  : ") and suite is not None:
+            suites[suite] = (sourceRoot, Path(line.partition(": ")[2]))
+    return suites, tests
+
+
+def readTestTimes(path: Path) -> dict[str, float]:
+    """Path in suite -> seconds; negative for tests that last failed"""
+    times: dict[str, float] = dict()
+    if not path.is_file():
+        return times
+    for line in path.read_text().splitlines():
+        fields = line.split(maxsplit=1)
+        if len(fields) != 2:
+            continue
+        try:
+            times[fields[1]] = float(fields[0])
+        except ValueError:
+            continue
+    return times
+
+
+def recordedTime(code: str, elapsed: float) -> float:
+    """The time lit records for a test, negative if it failed"""
+    return min(-elapsed, -1.0e-6) if code in FAILURE_CODES else elapsed
+
+
+def updateTestTimes(path: Path, times: dict[str, float]) -> None:
+    merged = {**readTestTimes(path), **times}
+    path.write_text("".join(f"{t:e} {name}\n" for name, t in merged.items()))
+
+
+def splitShards(
+    times: dict[str, float], tests: Sequence[str], shards: int
+) -> list[list[str]]:
+    """Longest processing time first: hand the slowest remaining test to
+    the least loaded shard. Tests without a recorded time are assumed to
+    take the median."""
+    known = [abs(t) for t in times.values()]
+    default = statistics.median(known) if known else 1.0
+    ordered = sorted(tests, key=lambda t: (-abs(times.get(t, default)), t))
+    heap = [(0.0, i) for i in range(shards)]
+    result: list[list[str]] = [[] for _ in range(shards)]
+    for test in ordered:
+        load, i = heapq.heappop(heap)
+        result[i].append(test)
+        heapq.heappush(heap, (load + abs(times.get(test, default)), i))
+    return [shard for shard in result if shard]
+
+
+class ShardedLitRun(LoggerMixin):
+    """Run the tests of a check target in several lit processes, balanced
+    by the times lit recorded in earlier runs, and merge their reports
+    into one. Times are recorded once all shards finished, as concurrent
+    lit processes would overwrite each other's times files."""
+
+    _command: LitCommand
+    _shards: int
+    _jobs: int
+    # Test files and directories to run, or None for all tests
+    _selection: set[Path] | None
+
+    def __init__(
+        self,
+        command: LitCommand,
+        shards: int,
+        jobs: int,
+        selection: Sequence[Path] | None = None,
+    ) -> None:
+        super().__init__()
+        self._command = command
+        self._shards = max(1, shards)
+        # Threads of each lit process
+        self._jobs = max(1, jobs // self._shards)
+        self._selection = None if selection is None else set(selection)
+
+    async def _discover(self) -> tuple[dict[str, tuple[Path, Path]], list[str]]:
+        chunks: list[bytes] = []
+        returncode = await ProcessRunner(
+            [
+                *self._command.lit,
+                *self._command.args,
+                "--show-suites",
+                "--show-tests",
+                *self._command.paths,
+            ],
+            cwd=self._command.cwd,
+            stdoutSink=chunks.append,
+        ).run()
+        if returncode != 0:
+            raise RuntimeError(f"lit test discovery exited with {returncode}")
+        return parseDiscovery(b"".join(chunks).decode(errors="replace"))
+
+    def _isSelected(
+        self, suites: dict[str, tuple[Path, Path]], test: str
+    ) -> bool:
+        assert self._selection is not None
+        suite, _, pathInSuite = test.partition(" :: ")
+        if suite not in suites:
+            return False
+        path = suites[suite][0] / pathInSuite
+        return path in self._selection or not self._selection.isdisjoint(
+            path.parents
+        )
+
+    def _times(self, suites: dict[str, tuple[Path, Path]]) -> dict[str, float]:
+        times: dict[str, float] = dict()
+        for name, (sourceRoot, execRoot) in suites.items():
+            path = execRoot / TIMES_NAME
+            if not path.is_file():
+                path = sourceRoot / TIMES_NAME
+            for test, seconds in readTestTimes(path).items():
+                times[f"{name} :: {test}"] = seconds
+        return times
+
+    async def _runShard(
+        self, index: int, tests: list[str], workDir: Path
+    ) -> Path:
+        output = workDir / f"shard{index}.json"
+        responseFile = workDir / f"shard{index}.rsp"
+        output.unlink(missing_ok=True)
+        # A response file keeps the long filter off the command line
+        responseFile.write_text(
+            "--filter=^(?:"
+            + "|".join(re.escape(test) for test in tests)
+            + ")$\n"
+        )
+        await ProcessRunner(
+            [
+                *self._command.lit,
+                *self._command.args,
+                "-q",
+                "-j",
+                str(self._jobs),
+                "--skip-test-time-recording",
+                "-o",
+                str(output),
+                f"@{responseFile}",
+                *self._command.paths,
+            ],
+            cwd=self._command.cwd,
+        ).run()
+        if not output.exists():
+            raise RuntimeError(f"lit shard {index} did not write {output}")
+        return output
+
+    def _recordTimes(
+        self, suites: dict[str, tuple[Path, Path]], tests: list[dict]
+    ) -> None:
+        bySuite: dict[str, dict[str, float]] = dict()
+        for test in tests:
+            suite, _, path = test["name"].partition(" :: ")
+            if suite not in suites or test.get("elapsed") is None:
+                continue
+            bySuite.setdefault(suite, dict())[path] = recordedTime(
+                test["code"], float(test["elapsed"])
+            )
+        for suite, times in bySuite.items():
+            updateTestTimes(suites[suite][1] / TIMES_NAME, times)
+
+    async def run(self, outputPath: Path) -> dict:
+        """Run the selected tests, write the merged lit JSON report to outputPath
+        and return it"""
+        suites, tests = await self._discover()
+        if self._selection is not None:
+            tests = [t for t in tests if self._isSelected(suites, t)]
+        shards = splitShards(self._times(suites), tests, self._shards)
+        self.logger.info(
+            "Run %d tests in %d shards of %d jobs",
+            len(tests),
+            len(shards),
+            self._jobs,
+        )
+        workDir = outputPath.with_suffix(".shards")
+        if not workDir.exists():
+            FileSystemHelper.create_dir(workDir)
+        start = time.monotonic()
+        outputs = await asyncio.gather(
+            *(
+                self._runShard(i, shard, workDir)
+                for i, shard in enumerate(shards)
+            )
+        )
+        merged: dict = {"__version__": None, "elapsed": 0.0, "tests": []}
+        for output in outputs:
+            with output.open() as f:
+                report = json.load(f)
+            merged["__version__"] = report.get("__version__")
+            merged["tests"].extend(report.get("tests", []))
+        merged["elapsed"] = time.monotonic() - start
+        with outputPath.open("w") as f:
+            json.dump(merged, f, indent=2)
+        self._recordTimes(suites, merged["tests"])
+        return merged
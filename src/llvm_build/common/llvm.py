@@ -60,3 +60,36 @@ class LLVMSanitizer(StrEnum):
     DATA_FLOW = "DataFlow"
     ADDRESS_UNDEFINED = "Address;Undefined"
     LEAKS = "Leaks"
+
+
+# Directories of llvm-project every build reads besides the enabled projects
+_baseSourceDirs = ("llvm", "cmake", "third-party")
+# Directories enabled projects and runtimes use from other subprojects
+_implicitSourceDirs: dict[str, tuple[str, ...]] = {
+    "bolt": ("clang",),
+    "clang-tools-extra": ("clang",),
+    "flang": ("clang", "mlir"),
+    "libcxx": ("libcxxabi", "runtimes"),
+    "libcxxabi": ("libcxx", "runtimes"),
+    "libunwind": ("libcxx", "runtimes"),
+    # lld/MachO includes libunwind/include
+    "lld": ("libunwind",),
+    "lldb": ("clang",),
+}
+
+
+def llvmSourceDirs(defines: dict[str, str]) -> list[str] | None:
+    """Top-level directories of llvm-project needed to configure and build
+    with the given CMake defines, or None if the whole tree is needed"""
+    enabled: list[str] = []
+    for define in ("LLVM_ENABLE_PROJECTS", "LLVM_ENABLE_RUNTIMES"):
+        enabled.extend(filter(None, defines.get(define, "").split(";")))
+    if LLVMProject.ALL in enabled:
+        return None
+    dirs: set[str] = set(_baseSourceDirs)
+    if defines.get("LLVM_ENABLE_RUNTIMES"):
+        dirs.add("runtimes")
+    for name in enabled:
+        dirs.add(name)
+        dirs.update(_implicitSourceDirs.get(name, ()))
+    return sorted(dirs)
@@ -0,0 +1,231 @@
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+from pathlib import Path
+
+from llvm_build.common.base_builders import (
+    AbstractCMakeDefineProvider,
+    CMakeBuilder,
+)
+from llvm_build.common.check_cache import compilerFingerprint
+from llvm_build.common.define_providers import CustomCMakeDefineProvider
+from llvm_build.common.utils import FileSystemHelper, LoggerMixin
+
+# Host tools the NATIVE sub-build of a cross build makes, and the defines
+# pointing a cross build at them; LLVM_NATIVE_TOOL_DIR covers those without
+_hostTools: dict[str, str | None] = {
+    "llvm-tblgen": "LLVM_TABLEGEN",
+    "llvm-min-tblgen": None,
+    "llvm-config": "LLVM_CONFIG_PATH",
+    "clang-tblgen": "CLANG_TABLEGEN",
+    "clang-pseudo-gen": "CLANG_PSEUDO_GEN",
+    "clang-tidy-confusable-chars-gen": "CLANG_TIDY_CONFUSABLE_CHARS_GEN",
+    "lldb-tblgen": "LLDB_TABLEGEN",
+    "mlir-tblgen": "MLIR_TABLEGEN",
+}
+# Defines of the cross build that decide which host tools there are and
+# what they generate
+_carriedDefines = (
+    "LLVM_ENABLE_PROJECTS",
+    "LLVM_TARGETS_TO_BUILD",
+    "LLVM_EXPERIMENTAL_TARGETS_TO_BUILD",
+)
+_manifestName = "native-tools.json"
+
+
+def defaultNativeToolsCacheDir() -> Path:
+    cacheHome = os.environ.get("XDG_CACHE_HOME")
+    return (
+        (Path(cacheHome) if cacheHome else Path.home() / ".cache")
+        / "llvm-build"
+        / "native-tools"
+    )
+
+
+def _findHostCompiler(compiler: str | None, variable: str, default: str) -> str:
+    """The compiler given, else the one CMake picks for a native build"""
+    name = compiler or os.environ.get(variable) or default
+    path = shutil.which(name)
+    if path is None:
+        raise RuntimeError(f"host compiler not found: {name}")
+    return path
+
+
+class NativeToolsCache(LoggerMixin):
+    """Host tools of cross builds, such as llvm-tblgen and clang-tblgen,
+    built once per source revision and host compilers into a shared
+    directory, instead of by the NATIVE sub-build of each cross build
+    directory. Uncommitted changes of the source tree are part of the
+    revision; a tree outside of git is not cached."""
+
+    _cacheDir: Path
+    _srcDir: Path
+    _defines: dict[str, str]
+    _cc: str | None
+    _cxx: str | None
+
+    def __init__(
+        self,
+        cacheDir: Path,
+        srcDir: Path,
+        crossDefines: dict[str, str],
+        cc: str | None = None,
+        cxx: str | None = None,
+    ) -> None:
+        super().__init__()
+        self._cacheDir = cacheDir
+        self._srcDir = srcDir
+        self._defines = {
+            name: crossDefines[name]
+            for name in _carriedDefines
+            if name in crossDefines
+        }
+        self._cc = cc
+        self._cxx = cxx
+
+    def _compilers(self) -> tuple[str, str]:
+        return (
+            _findHostCompiler(self._cc, "CC", "cc"),
+            _findHostCompiler(self._cxx, "CXX", "c++"),
+        )
+
+    def _sourceRevision(self) -> str | None:
+        try:
+            head = subprocess.run(
+                ["git", "-C", str(self._srcDir), "rev-parse", "HEAD"],
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout.strip()
+            diff = subprocess.run(
+                ["git", "-C", str(self._srcDir), "diff", "HEAD"],
+                capture_output=True,
+                check=True,
+            ).stdout
+        except (OSError, subprocess.CalledProcessError):
+            return None
+        return f"{head}:{hashlib.sha256(diff).hexdigest()}"
+
+    def key(self) -> str | None:
+        revision = self._sourceRevision()
+        if revision is None:
+            return None
+        digest = hashlib.sha256()
+        digest.update(f"{revision}\0".encode())
+        for compiler in self._compilers():
+            digest.update(
+                f"{compiler}:{compilerFingerprint(compiler)}\0".encode()
+            )
+        for name, value in sorted(self._defines.items()):
+            digest.update(f"{name}={value}\0".encode())
+        return digest.hexdigest()[:32]
+
+    def tools(self, key: str | None = None) -> tuple[Path, list[str]] | None:
+        """The directory of the cached host tools and their names; None if
+        they are not built for the current revision, or for key if given"""
+        key = key or self.key()
+        if key is None:
+            return None
+        manifest = self._cacheDir / key / _manifestName
+        if not manifest.is_file():
+            return None
+        return self._cacheDir / key / "bin", json.loads(manifest.read_text())
+
+    def prepare(self, jobs: int | None = None) -> Path | None:
+        """Build the host tools unless they are cached, and return the
+        directory holding them"""
+        key = self.key()
+        if key is None:
+            self.logger.warning(
+                "'%s' is not a git checkout, cross builds make their own "
+                "host tools",
+                self._srcDir,
+            )
+            return None
+        if not self._cacheDir.exists():
+            FileSystemHelper.create_dir(self._cacheDir)
+        # Cross builds of one revision, e.g. variants, wait for the first
+        # one to build the tools
+        with open(self._cacheDir / f"{key}.lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            buildDir = self._cacheDir / key
+            if not (buildDir / _manifestName).is_file():
+                self._build(buildDir, jobs)
+        self.logger.info("Use host tools of %s", buildDir)
+        return buildDir / "bin"
+
+    def _build(self, buildDir: Path, jobs: int | None) -> None:
+        cc, cxx = self._compilers()
+        defines = CustomCMakeDefineProvider()
+        defines.addDefine("CMAKE_BUILD_TYPE", "Release")
+        defines.addDefine("CMAKE_C_COMPILER", cc)
+        defines.addDefine("CMAKE_CXX_COMPILER", cxx)
+        for name, value in self._defines.items():
+            defines.addDefine(name, value)
+        for option in ("TESTS", "BENCHMARKS", "EXAMPLES"):
+            defines.addDefine(f"LLVM_INCLUDE_{option}", "OFF")
+        builder = CMakeBuilder(self._srcDir, buildDir)
+        builder.setDefineProvider(defines)
+        if jobs is not None:
+            builder.setBuildJobs(jobs)
+        builder.configure()
+        tools = self._availableTools(buildDir)
+        if not tools:
+            raise RuntimeError(f"no host tools to build in {buildDir}")
+        builder.setBuildTargets(tools)
+        builder.build()
+        temporary = buildDir / f"{_manifestName}.{os.getpid()}"
+        temporary.write_text(json.dumps(tools))
+        os.replace(temporary, buildDir / _manifestName)
+
+    @staticmethod
+    def _availableTools(buildDir: Path) -> list[str]:
+        """Host tools among the targets of the configured build, which
+        depend on the enabled projects and the LLVM version"""
+        ninja = shutil.which("ninja")
+        if ninja is None:
+            raise RuntimeError("cannot find ninja")
+        output = subprocess.run(
+            [ninja, "-C", str(buildDir), "-t", "targets", "all"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        targets = {line.partition(": ")[0] for line in output.splitlines()}
+        return [tool for tool in _hostTools if tool in targets]
+
+
+class NativeToolsDefineProvider(AbstractCMakeDefineProvider):
+    """Point a cross build at the host tools of a NativeToolsCache. Until
+    they are built, nothing is defined and the cross build makes its own.
+    The revision is looked up once, not by every configure command."""
+
+    _cache: NativeToolsCache
+    _key: str | None
+    _keyKnown: bool
+
+    def __init__(self, cache: NativeToolsCache) -> None:
+        super().__init__()
+        self._cache = cache
+        self._key = None
+        self._keyKnown = False
+
+    def getDefines(self) -> dict[str, str]:
+        if not self._keyKnown:
+            self._key = self._cache.key()
+            self._keyKnown = True
+        if self._key is None:
+            return dict()
+        cached = self._cache.tools(self._key)
+        if cached is None:
+            return dict()
+        toolsDir, tools = cached
+        defines = {"LLVM_NATIVE_TOOL_DIR": str(toolsDir)}
+        for tool in tools:
+            define = _hostTools[tool]
+            if define is not None:
+                defines[define] = str(toolsDir / tool)
+        return defines
@@ -0,0 +1,84 @@
+from collections.abc import Iterator
+from pathlib import Path
+
+from llvm_build.common.utils import FileSystemHelper
+
+
+class NinjaLogEntry:
+    """One line of `.ninja_log`. Times are milliseconds relative to the start
+    of the ninja invocation that ran the edge."""
+
+    start: int
+    end: int
+    mtime: int
+    output: str
+    commandHash: str
+
+    def __init__(
+        self, start: int, end: int, mtime: int, output: str, commandHash: str
+    ) -> None:
+        self.start = start
+        self.end = end
+        self.mtime = mtime
+        self.output = output
+        self.commandHash = commandHash
+
+    @property
+    def duration(self) -> float:
+        """Duration in seconds"""
+        return (self.end - self.start) / 1000.0
+
+
+class NinjaLog:
+    """Parsed `.ninja_log` (format v5 and later). The log is appended to by
+    every ninja invocation, so `entries` keeps the latest record of every
+    output while `lastBuild` only keeps the records of the last invocation."""
+
+    path: Path
+    entries: dict[str, NinjaLogEntry]
+    lastBuild: list[NinjaLogEntry]
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.entries = dict()
+        self.lastBuild = []
+
+    @classmethod
+    def load(cls, path: Path) -> "NinjaLog":
+        FileSystemHelper.check_file(path)
+        log = cls(path)
+        previousEnd = -1
+        for entry in cls.iterEntries(path):
+            # Entries are written in completion order, so a decreasing end
+            # time marks the start of a new invocation.
+            if entry.end < previousEnd:
+                log.lastBuild = []
+            previousEnd = entry.end
+            log.entries[entry.output] = entry
+            log.lastBuild.append(entry)
+        return log
+
+    @staticmethod
+    def iterEntries(path: Path) -> Iterator[NinjaLogEntry]:
+        with path.open() as f:
+            header = f.readline()
+            if not header.startswith("# ninja log v"):
+                raise RuntimeError(f"not a ninja log: {path}")
+            for line in f:
+                fields = line.rstrip("\n").split("\t")
+                if len(fields) != 5:
+                    continue
+                start, end, mtime, output, commandHash = fields
+                yield NinjaLogEntry(
+                    int(start), int(end), int(mtime), output, commandHash
+                )
+
+    def lastBuildWallTime(self) -> float:
+        if not self.lastBuild:
+            return 0.0
+        start = min(entry.start for entry in self.lastBuild)
+        end = max(entry.end for entry in self.lastBuild)
+        return (end - start) / 1000.0
+
+    def lastBuildCpuTime(self) -> float:
+        return sum(entry.duration for entry in self.lastBuild)
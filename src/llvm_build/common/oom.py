@@ -0,0 +1,77 @@
+import re
+from pathlib import Path
+from typing import BinaryIO
+
+# Traces of a job killed by SIGKILL in the output of ninja: the shell
+# reporting "Killed", compiler drivers naming the signal, exit status 137
+_killedPattern = re.compile(r"\bKilled\b|\bsignal 9\b|\b(?:status|code) 137\b")
+# Exit codes of a process killed by SIGKILL, directly or through a shell
+_killedCodes = (137, -9)
+
+
+def memoryEventsPath(procRoot: Path = Path("/proc")) -> Path | None:
+    """memory.events of the cgroup v2 this process belongs to, which counts
+    the OOM kills of the cgroup and its descendants"""
+    try:
+        lines = (procRoot / "self" / "cgroup").read_text().splitlines()
+    except OSError:
+        return None
+    for line in lines:
+        if line.startswith("0::"):
+            path = Path("/sys/fs/cgroup") / line[3:].lstrip("/")
+            path /= "memory.events"
+            return path if path.is_file() else None
+    return None
+
+
+def readOomKills(path: Path | None) -> int | None:
+    if path is None:
+        return None
+    try:
+        text = path.read_text()
+    except OSError:
+        return None
+    for line in text.splitlines():
+        key, _, value = line.partition(" ")
+        if key == "oom_kill":
+            return int(value)
+    return None
+
+
+def oomCause(
+    returncode: int,
+    output: str,
+    killsBefore: int | None,
+    killsAfter: int | None,
+) -> str | None:
+    """Why a failed build looks OOM-killed, or None if it does not. A job
+    killed by SIGKILL counts as OOM-killed if the cgroup recorded an OOM
+    kill meanwhile, or if there is no cgroup to tell."""
+    if returncode not in _killedCodes and not _killedPattern.search(output):
+        return None
+    if killsBefore is None or killsAfter is None:
+        return "job killed by SIGKILL, no cgroup OOM counter to confirm"
+    if killsAfter > killsBefore:
+        return f"{killsAfter - killsBefore} OOM kills in the cgroup"
+    return None
+
+
+class OutputTail:
+    """Output sink forwarding to a stream while keeping the last bytes"""
+
+    _stream: BinaryIO
+    _size: int
+    _tail: bytes
+
+    def __init__(self, stream: BinaryIO, size: int = 1 << 16) -> None:
+        self._stream = stream
+        self._size = size
+        self._tail = b""
+
+    def __call__(self, chunk: bytes) -> None:
+        self._stream.write(chunk)
+        self._stream.flush()
+        self._tail = (self._tail + chunk)[-self._size :]
+
+    def text(self) -> str:
+        return self._tail.decode(errors="replace")
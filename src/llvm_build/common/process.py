@@ -0,0 +1,206 @@
+import asyncio
+import contextlib
+import os
+import signal
+import subprocess
+import sys
+import time
+from collections.abc import Callable, Coroutine, Mapping, Sequence
+from pathlib import Path
+from typing import Any, BinaryIO
+
+from llvm_build.common.utils import LoggerMixin
+
+# Called with each chunk a process writes to stdout or stderr
+OutputSink = Callable[[bytes], None]
+
+_chunkSize = 1 << 16
+# Time a process group gets to exit after SIGTERM before it is killed
+_terminateGracePeriod = 5.0
+# asyncio only reports the exit of a process once its pipes are closed,
+# which a child left running in the background may delay, so the exit is
+# also polled
+_exitPollInterval = 0.1
+
+
+class ProcessTimeoutError(RuntimeError):
+    command: list[str]
+    timeout: float
+    inactivity: bool
+
+    def __init__(
+        self, command: Sequence[str], timeout: float, inactivity: bool
+    ) -> None:
+        kind = "produced no output for" if inactivity else "ran for more than"
+        super().__init__(f"'{command[0]}' {kind} {timeout} seconds")
+        self.command = list(command)
+        self.timeout = timeout
+        self.inactivity = inactivity
+
+
+def writerSink(stream: BinaryIO) -> OutputSink:
+    def write(chunk: bytes) -> None:
+        stream.write(chunk)
+        stream.flush()
+
+    return write
+
+
+def _stdoutSink(chunk: bytes) -> None:
+    sys.stdout.buffer.write(chunk)
+    sys.stdout.buffer.flush()
+
+
+def _stderrSink(chunk: bytes) -> None:
+    sys.stderr.buffer.write(chunk)
+    sys.stderr.buffer.flush()
+
+
+class ProcessRunner(LoggerMixin):
+    """Run a command in its own process group with asyncio, forwarding its
+    output as it arrives. The whole group is terminated when the command
+    exceeds its wall-clock timeout, stays silent for longer than its
+    inactivity timeout, or the awaiting task is cancelled (e.g. on Ctrl-C),
+    so that no compiler or linker outlives its build."""
+
+    _args: list[str]
+    _cwd: Path | None
+    _env: Mapping[str, str] | None
+    _timeout: float | None
+    _inactivityTimeout: float | None
+    _stdoutSink: OutputSink
+    _stderrSink: OutputSink
+    # Read as standard input instead of /dev/null
+    _stdin: Path | None
+    _lastOutput: float
+
+    def __init__(
+        self,
+        args: Sequence[str | Path],
+        cwd: Path | None = None,
+        env: Mapping[str, str] | None = None,
+        timeout: float | None = None,
+        inactivityTimeout: float | None = None,
+        stdoutSink: OutputSink | None = None,
+        stderrSink: OutputSink | None = None,
+        stdin: Path | None = None,
+    ) -> None:
+        super().__init__()
+        self._args = [str(arg) for arg in args]
+        self._cwd = cwd
+        self._env = env
+        self._timeout = timeout
+        self._inactivityTimeout = inactivityTimeout
+        self._stdoutSink = stdoutSink or _stdoutSink
+        self._stderrSink = stderrSink or _stderrSink
+        self._stdin = stdin
+        self._lastOutput = 0.0
+
+    async def _forward(
+        self, stream: asyncio.StreamReader, sink: OutputSink
+    ) -> None:
+        while chunk := await stream.read(_chunkSize):
+            self._lastOutput = time.monotonic()
+            sink(chunk)
+
+    async def _terminate(self, proc: asyncio.subprocess.Process) -> None:
+        for sig, grace in (
+            (signal.SIGTERM, _terminateGracePeriod),
+            (signal.SIGKILL, None),
+        ):
+            try:
+                os.killpg(proc.pid, sig)
+            except ProcessLookupError:
+                break
+            try:
+                await asyncio.wait_for(proc.wait(), grace)
+                break
+            except TimeoutError:
+                continue
+
+    def _deadline(self, startTime: float) -> tuple[float, float, bool] | None:
+        """Return the earliest (deadline, timeout, isInactivity)"""
+        deadlines: list[tuple[float, float, bool]] = []
+        if self._timeout is not None:
+            deadlines.append((startTime + self._timeout, self._timeout, False))
+        if self._inactivityTimeout is not None:
+            deadlines.append(
+                (
+                    self._lastOutput + self._inactivityTimeout,
+                    self._inactivityTimeout,
+                    True,
+                )
+            )
+        return min(deadlines) if deadlines else None
+
+    async def run(self) -> int:
+        """Return the exit code of the command"""
+        with contextlib.ExitStack() as stack:
+            stdin = (
+                subprocess.DEVNULL
+                if self._stdin is None
+                else stack.enter_context(self._stdin.open("rb"))
+            )
+            proc = await asyncio.create_subprocess_exec(
+                *self._args,
+                cwd=self._cwd,
+                env=None if self._env is None else dict(self._env),
+                stdin=stdin,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                start_new_session=True,
+            )
+        assert proc.stdout is not None and proc.stderr is not None
+        startTime = self._lastOutput = time.monotonic()
+        readers = asyncio.gather(
+            self._forward(proc.stdout, self._stdoutSink),
+            self._forward(proc.stderr, self._stderrSink),
+        )
+        waiter = asyncio.ensure_future(proc.wait())
+        try:
+            while proc.returncode is None:
+                timeout = _exitPollInterval
+                deadline = self._deadline(startTime)
+                if deadline is not None:
+                    remaining = deadline[0] - time.monotonic()
+                    if remaining <= 0:
+                        raise ProcessTimeoutError(self._args, *deadline[1:])
+                    timeout = min(timeout, remaining)
+                await asyncio.wait({waiter}, timeout=timeout)
+            try:
+                await asyncio.wait_for(
+                    readers, self._inactivityTimeout or _terminateGracePeriod
+                )
+            except TimeoutError:
+                self.logger.warning(
+                    "'%s' exited but its pipes stayed open", self._args[0]
+                )
+                await self._terminate(proc)
+                # Let the closed pipes finish the transport in this loop
+                await asyncio.wait({waiter}, timeout=_terminateGracePeriod)
+        except BaseException:
+            # Timeouts and cancellation both end here
+            self.logger.warning("terminating '%s'", self._args[0])
+            await asyncio.shield(self._terminate(proc))
+            readers.cancel()
+            raise
+        finally:
+            waiter.cancel()
+        return proc.returncode
+
+    async def check(self) -> None:
+        """Like subprocess.check_call"""
+        returncode = await self.run()
+        if returncode != 0:
+            raise subprocess.CalledProcessError(returncode, self._args)
+
+
+def runSync[T](coroutine: Coroutine[Any, Any, T]) -> T:
+    """Run a coroutine from synchronous code, which must not already run in
+    an event loop"""
+    return asyncio.run(coroutine)
+
+
+def checkCall(args: Sequence[str | Path], **kwargs: Any) -> None:
+    """Blocking counterpart of ProcessRunner.check"""
+    runSync(ProcessRunner(args, **kwargs).check())
@@ -0,0 +1,368 @@
+import fcntl
+import hashlib
+import os
+import re
+import shlex
+import shutil
+import subprocess
+import sys
+from collections.abc import Sequence
+from pathlib import Path
+
+from llvm_build.common.base_builders import AbstractCMakeDefineProvider
+
+# Flags that only affect instruction selection and later stages
+DEFAULT_CODEGEN_FLAGS = ("-fglobal-isel", "-fno-global-isel")
+# -mllvm options with these prefixes are treated as codegen flags as well
+_codegenMLLVMPrefixes = ("-global-isel",)
+
+_sourceSuffixes = frozenset(
+    (".c", ".cc", ".cpp", ".cxx", ".c++", ".C", ".m", ".mm")
+)
+# Options only the frontend understands, each followed by a value
+_frontendOptionsWithValue = frozenset(
+    (
+        "-I",
+        "-D",
+        "-U",
+        "-include",
+        "-imacros",
+        "-isystem",
+        "-iquote",
+        "-idirafter",
+        "-isysroot",
+    )
+)
+_depOptionsWithValue = frozenset(("-MF", "-MT", "-MQ"))
+_depFlags = frozenset(("-MD", "-MMD", "-MP"))
+# Anything that does not produce one object file from one source is run as
+# is
+_passthroughFlags = frozenset(("-E", "-S", "-emit-llvm", "-M", "-MM"))
+
+
+class CompileCommand:
+    """A compiler invocation split into the arguments needed by the frontend
+    and by the backend"""
+
+    compiler: str
+    source: str
+    output: str
+    frontendArgs: list[str]
+    backendArgs: list[str]
+    codegenArgs: list[str]
+    depArgs: list[str]
+    depFile: str | None
+    depTarget: str | None
+
+    def __init__(self, compiler: str) -> None:
+        self.compiler = compiler
+        self.source = ""
+        self.output = ""
+        self.frontendArgs = []
+        self.backendArgs = []
+        self.codegenArgs = []
+        self.depArgs = []
+        self.depFile = None
+        self.depTarget = None
+
+    @classmethod
+    def parse(
+        cls, command: Sequence[str], codegenFlags: Sequence[str]
+    ) -> "CompileCommand | None":
+        """Return None if the command is not a plain single-source compile
+        to an object file"""
+        if not command:
+            return None
+        result = cls(command[0])
+        sources: list[str] = []
+        compileOnly = False
+        args = list(command[1:])
+        i = 0
+        while i < len(args):
+            arg = args[i]
+            nextArg = args[i + 1] if i + 1 < len(args) else None
+            if arg in _passthroughFlags or arg.startswith("-flto"):
+                return None
+            if arg == "-c":
+                compileOnly = True
+            elif arg == "-o" and nextArg is not None:
+                result.output = nextArg
+                i += 1
+            elif arg.startswith("-o") and len(arg) > 2:
+                result.output = arg[2:]
+            elif arg in codegenFlags:
+                result.codegenArgs.append(arg)
+            elif (
+                arg == "-mllvm"
+                and nextArg is not None
+                and nextArg.startswith(_codegenMLLVMPrefixes)
+            ):
+                result.codegenArgs.extend((arg, nextArg))
+                i += 1
+            elif arg in _depOptionsWithValue and nextArg is not None:
+                result.depArgs.extend((arg, nextArg))
+                if arg == "-MF":
+                    result.depFile = nextArg
+                elif result.depTarget is None:
+                    result.depTarget = nextArg
+                i += 1
+            elif arg in _depFlags:
+                result.depArgs.append(arg)
+            elif (
+                arg in _frontendOptionsWithValue or arg == "-x"
+            ) and nextArg is not None:
+                result.frontendArgs.extend((arg, nextArg))
+                i += 1
+            elif arg.startswith(("-I", "-D", "-U", "-std=")):
+                result.frontendArgs.append(arg)
+            elif arg in ("-mllvm", "-Xclang") and nextArg is not None:
+                result.frontendArgs.extend((arg, nextArg))
+                result.backendArgs.extend((arg, nextArg))
+                i += 1
+            elif (
+                not arg.startswith("-") and Path(arg).suffix in _sourceSuffixes
+            ):
+                sources.append(arg)
+            else:
+                result.frontendArgs.append(arg)
+                result.backendArgs.append(arg)
+            i += 1
+        if not compileOnly or len(sources) != 1 or not result.output:
+            return None
+        result.source = sources[0]
+        return result
+
+    def cacheKey(self, buildDir: str | None) -> str:
+        """Identify the pre-codegen bitcode: compiler binary, frontend flags
+        with the build directory masked out, and the source contents. The
+        headers are only known after compiling; see _inputsFingerprint."""
+        digest = hashlib.sha256()
+        compilerPath = shutil.which(self.compiler) or self.compiler
+        stat = os.stat(compilerPath)
+        digest.update(
+            f"{os.path.realpath(compilerPath)}:{stat.st_size}:"
+            f"{stat.st_mtime_ns}\0".encode()
+        )
+        for arg in self.frontendArgs:
+            if buildDir:
+                arg = arg.replace(buildDir, "<build>")
+            digest.update(arg.encode() + b"\0")
+        with open(self.source, "rb") as f:
+            digest.update(hashlib.file_digest(f, "sha256").digest())
+        return digest.hexdigest()
+
+
+def _dependencies(depFile: Path) -> list[str]:
+    """Prerequisites of the first rule of a make dependency file"""
+    content = depFile.read_text().replace("\\\n", " ")
+    _, sep, deps = content.partition("\n")[0].partition(": ")
+    if not sep:
+        return []
+    return [
+        dep.replace("\\ ", " ")
+        for dep in re.split(r"(?<!\\)\s+", deps.strip())
+        if dep
+    ]
+
+
+def _inputsFingerprint(paths: Sequence[str]) -> str:
+    """Size and mtime of every file the frontend read, like the compiler
+    in cacheKey, so that bitcode compiled before a header changed is not
+    reused. Paths are absolute since variants compile in other
+    directories."""
+    lines = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            lines.append(f"{path}\0missing\n")
+            continue
+        lines.append(f"{path}\0{stat.st_size}:{stat.st_mtime_ns}\n")
+    return "".join(lines)
+
+
+def _inputsUnchanged(inputs: Path) -> bool:
+    if not inputs.exists():
+        return False
+    recorded = inputs.read_text()
+    paths = [line.partition("\0")[0] for line in recorded.splitlines()]
+    return recorded == _inputsFingerprint(paths)
+
+
+def _copyDepFile(cached: Path, command: CompileCommand) -> None:
+    """Copy the dependency file recorded for the first variant, retargeted
+    to the object file of this variant"""
+    if command.depFile is None:
+        return
+    content = cached.read_text()
+    _, sep, deps = content.partition(": ")
+    if sep and command.depTarget is not None:
+        content = f"{command.depTarget}: {deps}"
+    Path(command.depFile).write_text(content)
+
+
+def _compileFrontend(command: CompileCommand, cacheDir: Path, key: str) -> Path:
+    bitcode = cacheDir / f"{key}.bc"
+    depCopy = cacheDir / f"{key}.d"
+    inputs = cacheDir / f"{key}.inputs"
+    with open(cacheDir / f"{key}.lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        if bitcode.exists() and _inputsUnchanged(inputs):
+            _copyDepFile(depCopy, command)
+            return bitcode
+        temporary = cacheDir / f"{key}.bc.{os.getpid()}"
+        depArgs = list(command.depArgs)
+        depFile = command.depFile
+        if depFile is None:
+            # The headers are needed to check the bitcode before reuse
+            depFile = str(cacheDir / f"{key}.d.{os.getpid()}")
+            if not any(arg in _depFlags for arg in depArgs):
+                depArgs.append("-MD")
+            depArgs.extend(("-MF", depFile))
+        if command.depTarget is None:
+            # Keep the object file, not the temporary, as the target
+            depArgs.extend(("-MT", command.output))
+        returncode = subprocess.call(
+            [
+                command.compiler,
+                *command.frontendArgs,
+                *depArgs,
+                "-emit-llvm",
+                "-c",
+                command.source,
+                "-o",
+                str(temporary),
+            ]
+        )
+        if returncode != 0:
+            temporary.unlink(missing_ok=True)
+            if depFile != command.depFile:
+                Path(depFile).unlink(missing_ok=True)
+            sys.exit(returncode)
+        if depFile == command.depFile:
+            shutil.copyfile(depFile, depCopy)
+        else:
+            os.replace(depFile, depCopy)
+        inputs.write_text(
+            _inputsFingerprint(
+                [os.path.abspath(dep) for dep in _dependencies(depCopy)]
+            )
+        )
+        os.replace(temporary, bitcode)
+    return bitcode
+
+
+def _compileBackend(command: CompileCommand, bitcode: Path) -> int:
+    return subprocess.call(
+        [
+            command.compiler,
+            *command.backendArgs,
+            *command.codegenArgs,
+            # The bitcode is already optimized; only run codegen on it
+            "-Xclang",
+            "-disable-llvm-passes",
+            "-Wno-unused-command-line-argument",
+            "-c",
+            str(bitcode),
+            "-o",
+            command.output,
+        ]
+    )
+
+
+class SharedFrontendDefineProvider(AbstractCMakeDefineProvider):
+    """Route every C/C++ compile of a project through this launcher, which
+    shares the frontend and middle-end between builds that differ only in
+    codegen flags such as -fglobal-isel/-fno-global-isel.
+
+    Each compile is split in two: without the codegen flags the TU is
+    compiled to optimized bitcode, cached by compiler, flags and source
+    and reused while the headers it read are unchanged; then only the
+    backend runs on the cached bitcode with the full flags.
+    The first variant to compile a TU fills the cache and the others wait
+    for it under a file lock."""
+
+    _cacheDir: Path
+    _buildDir: Path
+    _codegenFlags: list[str]
+
+    def __init__(
+        self,
+        cacheDir: Path,
+        buildDir: Path,
+        codegenFlags: Sequence[str] = DEFAULT_CODEGEN_FLAGS,
+    ) -> None:
+        super().__init__()
+        self._cacheDir = cacheDir
+        self._buildDir = buildDir
+        self._codegenFlags = list(codegenFlags)
+
+    def getDefines(self) -> dict[str, str]:
+        launcher = [
+            sys.executable,
+            "-m",
+            __name__,
+            "--cache-dir",
+            str(self._cacheDir),
+            "--build-dir",
+            str(self._buildDir),
+        ]
+        for flag in self._codegenFlags:
+            launcher.append(f"--codegen-flag={flag}")
+        launcher.append("--")
+        # Launchers are CMake lists
+        value = ";".join(launcher)
+        return {
+            "CMAKE_C_COMPILER_LAUNCHER": value,
+            "CMAKE_CXX_COMPILER_LAUNCHER": value,
+        }
+
+
+def main(args: Sequence[str] | None = None) -> None:
+    args = list(sys.argv[1:] if args is None else args)
+    if "--" not in args:
+        sys.stderr.write(
+            f"usage: {__name__} --cache-dir DIR [--build-dir DIR] "
+            "[--codegen-flag=FLAG...] -- COMPILER ARGS...\n"
+        )
+        sys.exit(2)
+    separator = args.index("--")
+    options, compilerCommand = args[:separator], args[separator + 1 :]
+    cacheDir: Path | None = None
+    buildDir: str | None = None
+    codegenFlags: list[str] = []
+    i = 0
+    while i < len(options):
+        if options[i] == "--cache-dir":
+            cacheDir = Path(options[i + 1])
+            i += 1
+        elif options[i] == "--build-dir":
+            buildDir = options[i + 1]
+            i += 1
+        elif options[i].startswith("--codegen-flag="):
+            codegenFlags.append(options[i].partition("=")[2])
+        i += 1
+    command = (
+        CompileCommand.parse(
+            compilerCommand, codegenFlags or DEFAULT_CODEGEN_FLAGS
+        )
+        if cacheDir is not None
+        else None
+    )
+    if command is None:
+        os.execvp(compilerCommand[0], compilerCommand)
+    assert cacheDir is not None
+    cacheDir.mkdir(parents=True, exist_ok=True)
+    bitcode = _compileFrontend(command, cacheDir, command.cacheKey(buildDir))
+    returncode = _compileBackend(command, bitcode)
+    if returncode != 0:
+        sys.stderr.write(
+            "backend compile failed: "
+            + shlex.join([command.compiler, str(bitcode)])
+            + "\n"
+        )
+    sys.exit(returncode)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,383 @@
+import json
+import os
+import stat
+import struct
+import sys
+from argparse import ArgumentParser, Namespace
+from collections.abc import Iterator, Sequence
+from concurrent.futures import ProcessPoolExecutor
+from enum import StrEnum
+from io import StringIO
+from pathlib import Path
+from typing import Any
+
+from llvm_build.common.utils import FileSystemHelper, LoggerMixin
+from llvm_build.testsuite.lit_results import LitResultFile, LitTestResult
+
+SECTION_CATEGORIES = ("text", "data", "rodata", "bss")
+
+# RISC-V (and a few other targets) place small objects in .sdata, .sbss and
+# .srodata, which count towards their big siblings.
+_sectionPrefixes = {
+    ".text": "text",
+    ".data": "data",
+    ".sdata": "data",
+    ".rodata": "rodata",
+    ".srodata": "rodata",
+    ".bss": "bss",
+    ".sbss": "bss",
+    ".tbss": "bss",
+    ".tdata": "data",
+}
+
+_ELF_MAGIC = b"\x7fELF"
+_ET_REL = 1
+_ET_EXEC = 2
+_ET_DYN = 3
+_SHN_XINDEX = 0xFFFF
+
+
+class BinaryKind(StrEnum):
+    EXECUTABLE = "executable"
+    OBJECT = "object"
+
+
+def sectionCategory(name: str) -> str | None:
+    for prefix, category in _sectionPrefixes.items():
+        if name == prefix or name.startswith(prefix + "."):
+            return category
+    return None
+
+
+class BinarySize:
+    path: str
+    kind: BinaryKind
+    sizes: dict[str, int]
+
+    def __init__(self, path: str, kind: BinaryKind, sizes: dict[str, int]):
+        self.path = path
+        self.kind = kind
+        self.sizes = sizes
+
+    def toJson(self) -> dict[str, Any]:
+        return {"path": self.path, "kind": self.kind.value, **self.sizes}
+
+
+def readElfSectionSizes(path: Path) -> tuple[int, dict[str, int]] | None:
+    """Return (e_type, {category: bytes}) of an ELF file, or None if the
+    file is not ELF. Only the file header and section headers are read."""
+    with path.open("rb") as f:
+        ident = f.read(16)
+        if len(ident) < 16 or ident[:4] != _ELF_MAGIC:
+            return None
+        is64 = ident[4] == 2
+        endian = "<" if ident[5] == 1 else ">"
+        if is64:
+            header = f.read(48)
+            eType, shoff = (
+                struct.unpack_from(endian + "H", header, 0)[0],
+                struct.unpack_from(endian + "Q", header, 24)[0],
+            )
+            shentsize, shnum, shstrndx = struct.unpack_from(
+                endian + "HHH", header, 42
+            )
+            entry = struct.Struct(endian + "IIQQQQ")
+        else:
+            header = f.read(36)
+            eType, shoff = (
+                struct.unpack_from(endian + "H", header, 0)[0],
+                struct.unpack_from(endian + "I", header, 16)[0],
+            )
+            shentsize, shnum, shstrndx = struct.unpack_from(
+                endian + "HHH", header, 30
+            )
+            entry = struct.Struct(endian + "IIIIII")
+        if shoff == 0:
+            return eType, dict.fromkeys(SECTION_CATEGORIES, 0)
+        f.seek(shoff)
+        first = entry.unpack(f.read(entry.size))
+        # Extended numbering: the real values live in section header 0
+        if shnum == 0:
+            shnum = first[5]
+        if shstrndx == _SHN_XINDEX:
+            f.seek(shoff + 40 if is64 else shoff + 24)
+            shstrndx = struct.unpack(endian + "I", f.read(4))[0]
+        f.seek(shoff)
+        table = f.read(shentsize * shnum)
+        headers = [
+            entry.unpack_from(table, i * shentsize) for i in range(shnum)
+        ]
+        strtab = headers[shstrndx]
+        f.seek(strtab[4])
+        names = f.read(strtab[5])
+    sizes: dict[str, int] = dict.fromkeys(SECTION_CATEGORIES, 0)
+    for nameOffset, _, _, _, _, size in headers:
+        end = names.find(b"\0", nameOffset)
+        name = names[nameOffset:end].decode(errors="replace")
+        category = sectionCategory(name)
+        if category is not None:
+            sizes[category] += size
+    return eType, sizes
+
+
+def _measure(args: tuple[Path, str]) -> BinarySize | None:
+    path, relativePath = args
+    try:
+        result = readElfSectionSizes(path)
+    except (OSError, struct.error, IndexError):
+        return None
+    if result is None:
+        return None
+    eType, sizes = result
+    if eType == _ET_REL:
+        return BinarySize(relativePath, BinaryKind.OBJECT, sizes)
+    if eType == _ET_EXEC or (eType == _ET_DYN and ".so" not in path.name):
+        return BinarySize(relativePath, BinaryKind.EXECUTABLE, sizes)
+    return None
+
+
+def _iterCandidates(root: Path) -> Iterator[tuple[Path, str]]:
+    """Yield object files and files with an executable bit, using scandir
+    so that stat results come from the directory listing where possible"""
+    pending = [root]
+    while pending:
+        directory = pending.pop()
+        with os.scandir(directory) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    pending.append(Path(entry.path))
+                    continue
+                if not entry.is_file(follow_symlinks=False):
+                    continue
+                if not entry.name.endswith(".o"):
+                    mode = entry.stat(follow_symlinks=False).st_mode
+                    if not mode & (stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH):
+                        continue
+                path = Path(entry.path)
+                yield path, str(path.relative_to(root))
+
+
+class CodeSizeReport(LoggerMixin):
+    buildDir: Path
+    binaries: dict[str, BinarySize]
+
+    def __init__(self, buildDir: Path, binaries: Sequence[BinarySize]):
+        self.buildDir = buildDir
+        self.binaries = {binary.path: binary for binary in binaries}
+
+    @classmethod
+    def collect(
+        cls, buildDir: Path, jobs: int | None = None
+    ) -> "CodeSizeReport":
+        FileSystemHelper.check_dir(buildDir)
+        candidates = list(_iterCandidates(buildDir))
+        jobs = jobs or os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            chunksize = max(1, len(candidates) // (jobs * 4))
+            binaries = [
+                binary
+                for binary in executor.map(
+                    _measure, candidates, chunksize=chunksize
+                )
+                if binary is not None
+            ]
+        cls.classLogger().info(
+            "measured %d binaries out of %d candidates in '%s'",
+            len(binaries),
+            len(candidates),
+            buildDir,
+        )
+        return cls(buildDir, binaries)
+
+    def totals(self) -> dict[BinaryKind, dict[str, int]]:
+        totals: dict[BinaryKind, dict[str, int]] = {
+            kind: dict.fromkeys(SECTION_CATEGORIES, 0) for kind in BinaryKind
+        }
+        for binary in self.binaries.values():
+            for category, size in binary.sizes.items():
+                totals[binary.kind][category] += size
+        return totals
+
+    def toJson(self) -> dict[str, Any]:
+        return {
+            "buildDir": str(self.buildDir),
+            "totals": {
+                kind.value: sizes for kind, sizes in self.totals().items()
+            },
+            "binaries": [
+                binary.toJson()
+                for binary in sorted(
+                    self.binaries.values(), key=lambda b: b.path
+                )
+            ],
+        }
+
+    def toLitResults(self) -> LitResultFile:
+        """Executables as lit tests with lit's 'size..<section>' metrics"""
+        return LitResultFile(
+            self.buildDir,
+            (
+                LitTestResult(
+                    f"code-size :: {binary.path}",
+                    "PASS",
+                    None,
+                    {
+                        f"size..{category}": float(size)
+                        for category, size in binary.sizes.items()
+                    },
+                )
+                for binary in self.binaries.values()
+                if binary.kind is BinaryKind.EXECUTABLE
+            ),
+        )
+
+
+class CodeSizeDiff:
+    baseline: CodeSizeReport
+    candidate: CodeSizeReport
+
+    def __init__(self, baseline: CodeSizeReport, candidate: CodeSizeReport):
+        self.baseline = baseline
+        self.candidate = candidate
+
+    def _matched(self) -> list[tuple[BinarySize, BinarySize]]:
+        return [
+            (binary, self.candidate.binaries[path])
+            for path, binary in sorted(self.baseline.binaries.items())
+            if path in self.candidate.binaries
+            and binary.kind is BinaryKind.EXECUTABLE
+        ]
+
+    def toJson(self) -> dict[str, Any]:
+        baseTotals = self.baseline.totals()
+        candTotals = self.candidate.totals()
+        return {
+            "baseline": str(self.baseline.buildDir),
+            "candidate": str(self.candidate.buildDir),
+            "totals": {
+                kind.value: {
+                    category: {
+                        "baseline": baseTotals[kind][category],
+                        "candidate": candTotals[kind][category],
+                    }
+                    for category in SECTION_CATEGORIES
+                }
+                for kind in BinaryKind
+            },
+            "executables": [
+                {
+                    "path": base.path,
+                    **{
+                        category: {
+                            "baseline": base.sizes[category],
+                            "candidate": cand.sizes[category],
+                        }
+                        for category in SECTION_CATEGORIES
+                    },
+                }
+                for base, cand in self._matched()
+            ],
+        }
+
+    def formatTable(self, top: int = 20) -> str:
+        out = StringIO()
+        baseTotals = self.baseline.totals()
+        candTotals = self.candidate.totals()
+        out.write(
+            f"{'total':<24}{'baseline':>14}{'candidate':>14}{'delta':>9}\n"
+        )
+        for kind in BinaryKind:
+            for category in SECTION_CATEGORIES:
+                base = baseTotals[kind][category]
+                cand = candTotals[kind][category]
+                out.write(
+                    f"{kind.value + ' .' + category:<24}{base:>14}{cand:>14}"
+                    f"{_formatDelta(base, cand):>9}\n"
+                )
+        matched = self._matched()
+        matched.sort(
+            key=lambda pair: abs(pair[1].sizes["text"] - pair[0].sizes["text"]),
+            reverse=True,
+        )
+        if matched and top > 0:
+            out.write(
+                f"-- largest .text changes of {len(matched)} executables --\n"
+            )
+            for base, cand in matched[:top]:
+                out.write(
+                    f"  {base.path} {base.sizes['text']} -> "
+                    f"{cand.sizes['text']} "
+                    f"({_formatDelta(base.sizes['text'], cand.sizes['text'])})\n"
+                )
+        return out.getvalue()
+
+
+def _formatDelta(base: int, cand: int) -> str:
+    if base == 0:
+        return "n/a" if cand else "0.00%"
+    return f"{(cand - base) / base * 100:+.2f}%"
+
+
+def _parseArgs(args: Sequence[str]) -> Namespace:
+    parser = ArgumentParser(
+        prog="llvm-build size",
+        description="Measure ELF section sizes of test-suite binaries",
+    )
+    parser.add_argument("buildDir", type=Path, help="Build directory")
+    parser.add_argument(
+        "otherBuildDir",
+        type=Path,
+        nargs="?",
+        default=None,
+        help="Build directory to compare against the first one",
+    )
+    parser.add_argument(
+        "--jobs", type=int, default=None, help="Number of worker processes"
+    )
+    parser.add_argument(
+        "--json", type=Path, default=None, help="File to write the report"
+    )
+    parser.add_argument(
+        "--lit-output",
+        type=Path,
+        default=None,
+        help="File to write executable sizes as lit results of the first "
+        "build directory",
+    )
+    parser.add_argument(
+        "--top",
+        type=int,
+        default=20,
+        help="Number of executables with the largest change to print",
+    )
+    return parser.parse_args(args)
+
+
+def main(args: Sequence[str] | None = None) -> None:
+    parsedArgs = _parseArgs(sys.argv[1:] if args is None else args)
+    report = CodeSizeReport.collect(parsedArgs.buildDir, parsedArgs.jobs)
+    if parsedArgs.lit_output is not None:
+        report.toLitResults().dump(parsedArgs.lit_output)
+    output: dict[str, Any]
+    if parsedArgs.otherBuildDir is None:
+        output = report.toJson()
+        for kind, sizes in report.totals().items():
+            sys.stdout.write(
+                f"{kind.value}: "
+                + ", ".join(f".{c} {s}" for c, s in sizes.items())
+                + "\n"
+            )
+    else:
+        other = CodeSizeReport.collect(
+            parsedArgs.otherBuildDir, parsedArgs.jobs
+        )
+        diff = CodeSizeDiff(report, other)
+        output = diff.toJson()
+        sys.stdout.write(diff.formatTable(parsedArgs.top))
+    if parsedArgs.json is not None:
+        with parsedArgs.json.open("w") as f:
+            json.dump(output, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,525 @@
+import json
+import logging
+import math
+import os
+import sys
+from argparse import ArgumentParser, Namespace
+from collections.abc import Sequence
+from enum import StrEnum
+from io import StringIO
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+
+from llvm_build.testsuite.lit_results import (
+    LitResultSet,
+    VariantManifest,
+    parseResultSetSpec,
+)
+
+HASH_METRIC = "hash"
+# Counters collected by the perf stat wrapper are less noisy than exec_time
+DEFAULT_METRICS = (
+    "exec_time",
+    "perf..instructions",
+    "perf..cycles",
+    "qemu..instructions",
+    "compile_time",
+    "size..text",
+    HASH_METRIC,
+)
+
+
+class Aggregate(StrEnum):
+    """How the samples of a test from repeated runs are reduced"""
+
+    MEDIAN = "median"
+    MIN = "min"
+    MEAN = "mean"
+
+
+_aggregateFunctions = {
+    Aggregate.MEDIAN: np.nanmedian,
+    Aggregate.MIN: np.nanmin,
+    Aggregate.MEAN: np.nanmean,
+}
+
+
+def _padSamples(
+    names: Sequence[str], resultSet: LitResultSet, metric: str
+) -> np.ndarray:
+    """Return a (tests x runs) matrix of samples, padded with NaN"""
+    columns = [resultSet.numericSamples(name, metric) for name in names]
+    width = max((len(c) for c in columns), default=0)
+    matrix = np.full((len(names), max(width, 1)), np.nan)
+    for row, samples in enumerate(columns):
+        matrix[row, : len(samples)] = samples
+    return matrix
+
+
+def mannWhitneyPValues(x: np.ndarray, y: np.ndarray) -> np.ndarray:
+    """Two-sided Mann-Whitney U test for every row of two NaN-padded sample
+    matrices, using the normal approximation with tie and continuity
+    correction. Rows with fewer than two samples on either side get NaN."""
+    n1 = np.sum(~np.isnan(x), axis=1)
+    n2 = np.sum(~np.isnan(y), axis=1)
+    diff = x[:, :, None] - y[:, None, :]
+    valid = ~np.isnan(diff)
+    u = np.sum(
+        np.where(valid, (diff > 0) + 0.5 * (diff == 0), 0.0), axis=(1, 2)
+    )
+    # Each member of a group of t ties contributes t^2 - 1, which sums up to
+    # the t^3 - t term of the tie correction.
+    combined = np.concatenate((x, y), axis=1)
+    tieSizes = np.sum(combined[:, :, None] == combined[:, None, :], axis=2)
+    tieTerm = np.sum(
+        np.where(np.isnan(combined), 0, tieSizes**2 - 1), axis=1
+    ).astype(float)
+    total = (n1 + n2).astype(float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        variance = (
+            n1 * n2 / 12.0 * ((total + 1) - tieTerm / (total * (total - 1)))
+        )
+        z = (np.abs(u - n1 * n2 / 2.0) - 0.5) / np.sqrt(variance)
+    z = np.clip(np.nan_to_num(z, nan=0.0), 0.0, None)
+    erfc = np.frompyfunc(math.erfc, 1, 1)
+    pValues = np.asarray(erfc(z / math.sqrt(2)), dtype=float)
+    pValues[variance <= 0] = 1.0
+    pValues[(n1 < 2) | (n2 < 2)] = np.nan
+    return pValues
+
+
+def bootstrapGeomeanInterval(
+    logRatios: np.ndarray,
+    resamples: int,
+    confidence: float,
+    rng: np.random.Generator,
+    chunkSize: int = 256,
+) -> tuple[float, float]:
+    """Percentile bootstrap interval of the geometric mean, resampling over
+    tests. Resamples are drawn in chunks to bound memory."""
+    if logRatios.size == 0:
+        return math.nan, math.nan
+    means = np.empty(resamples)
+    for start in range(0, resamples, chunkSize):
+        stop = min(start + chunkSize, resamples)
+        indices = rng.integers(
+            0, logRatios.size, (stop - start, logRatios.size)
+        )
+        means[start:stop] = logRatios[indices].mean(axis=1)
+    tail = (1.0 - confidence) / 2.0 * 100.0
+    low, high = np.percentile(means, (tail, 100.0 - tail))
+    return math.exp(low), math.exp(high)
+
+
+class MetricComparison:
+    """Comparison of one numeric metric between the baseline and a
+    candidate. A ratio below 1 means the candidate has a smaller value."""
+
+    metric: str
+    testNames: list[str]
+    baseline: np.ndarray
+    candidate: np.ndarray
+    ratios: np.ndarray
+    pValues: np.ndarray
+    geomean: float
+    interval: tuple[float, float]
+
+    def __init__(
+        self,
+        metric: str,
+        testNames: list[str],
+        baseline: np.ndarray,
+        candidate: np.ndarray,
+        pValues: np.ndarray,
+        geomean: float,
+        interval: tuple[float, float],
+    ) -> None:
+        self.metric = metric
+        self.testNames = testNames
+        self.baseline = baseline
+        self.candidate = candidate
+        with np.errstate(divide="ignore", invalid="ignore"):
+            self.ratios = candidate / baseline
+        self.pValues = pValues
+        self.geomean = geomean
+        self.interval = interval
+
+    def significant(self, alpha: float) -> np.ndarray:
+        return np.nan_to_num(self.pValues, nan=1.0) < alpha
+
+    def toJson(self, alpha: float) -> dict[str, Any]:
+        significant = self.significant(alpha)
+        return {
+            "geomean": _jsonFloat(self.geomean),
+            "interval": [_jsonFloat(v) for v in self.interval],
+            "improved": int(np.sum(significant & (self.ratios < 1))),
+            "regressed": int(np.sum(significant & (self.ratios > 1))),
+            "tests": [
+                {
+                    "name": name,
+                    "baseline": _jsonFloat(self.baseline[i]),
+                    "candidate": _jsonFloat(self.candidate[i]),
+                    "ratio": _jsonFloat(self.ratios[i]),
+                    "pValue": _jsonFloat(self.pValues[i]),
+                }
+                for i, name in enumerate(self.testNames)
+            ],
+        }
+
+
+def _jsonFloat(value: float) -> float | None:
+    value = float(value)
+    return None if math.isnan(value) or math.isinf(value) else value
+
+
+class CandidateComparison:
+    """Everything known about one candidate relative to the baseline"""
+
+    label: str
+    metrics: dict[str, MetricComparison]
+    hashMismatches: list[str]
+    statusChanges: list[tuple[str, str, str]]
+    onlyInBaseline: list[str]
+    onlyInCandidate: list[str]
+
+    def __init__(self, label: str) -> None:
+        self.label = label
+        self.metrics = dict()
+        self.hashMismatches = []
+        self.statusChanges = []
+        self.onlyInBaseline = []
+        self.onlyInCandidate = []
+
+
+class ResultComparator:
+    _aggregate: Aggregate
+    _resamples: int
+    _confidence: float
+    _seed: int | None
+
+    def __init__(
+        self,
+        aggregate: Aggregate = Aggregate.MEDIAN,
+        resamples: int = 1000,
+        confidence: float = 0.95,
+        seed: int | None = None,
+    ) -> None:
+        self._aggregate = aggregate
+        self._resamples = resamples
+        self._confidence = confidence
+        self._seed = seed
+
+    def compare(
+        self,
+        baseline: LitResultSet,
+        candidate: LitResultSet,
+        metrics: Sequence[str] = DEFAULT_METRICS,
+    ) -> CandidateComparison:
+        result = CandidateComparison(candidate.label)
+        baseNames = baseline.testNames()
+        candNames = candidate.testNames()
+        names = sorted(baseNames & candNames)
+        result.onlyInBaseline = sorted(baseNames - candNames)
+        result.onlyInCandidate = sorted(candNames - baseNames)
+        for name in names:
+            baseCodes = baseline.codes(name)
+            candCodes = candidate.codes(name)
+            if baseCodes != candCodes:
+                result.statusChanges.append(
+                    (
+                        name,
+                        "/".join(sorted(baseCodes)),
+                        "/".join(sorted(candCodes)),
+                    )
+                )
+        for metric in metrics:
+            if metric == HASH_METRIC:
+                result.hashMismatches = self._compareHashes(
+                    names, baseline, candidate
+                )
+            else:
+                comparison = self._compareMetric(
+                    names, baseline, candidate, metric
+                )
+                if comparison is not None:
+                    result.metrics[metric] = comparison
+        return result
+
+    @staticmethod
+    def _compareHashes(
+        names: Sequence[str], baseline: LitResultSet, candidate: LitResultSet
+    ) -> list[str]:
+        mismatches: list[str] = []
+        for name in names:
+            baseHashes = baseline.stringValues(name, HASH_METRIC)
+            candHashes = candidate.stringValues(name, HASH_METRIC)
+            if baseHashes and candHashes and baseHashes != candHashes:
+                mismatches.append(name)
+        return mismatches
+
+    def _compareMetric(
+        self,
+        names: Sequence[str],
+        baseline: LitResultSet,
+        candidate: LitResultSet,
+        metric: str,
+    ) -> MetricComparison | None:
+        baseSamples = _padSamples(names, baseline, metric)
+        candSamples = _padSamples(names, candidate, metric)
+        present = np.any(~np.isnan(baseSamples), axis=1) & np.any(
+            ~np.isnan(candSamples), axis=1
+        )
+        if not np.any(present):
+            return None
+        baseSamples = baseSamples[present]
+        candSamples = candSamples[present]
+        presentNames = [n for n, p in zip(names, present, strict=True) if p]
+        aggregate = _aggregateFunctions[self._aggregate]
+        baseValues = aggregate(baseSamples, axis=1)
+        candValues = aggregate(candSamples, axis=1)
+        pValues = mannWhitneyPValues(baseSamples, candSamples)
+        positive = (baseValues > 0) & (candValues > 0)
+        logRatios = np.log(candValues[positive] / baseValues[positive])
+        geomean = (
+            math.exp(float(logRatios.mean())) if logRatios.size else math.nan
+        )
+        interval = bootstrapGeomeanInterval(
+            logRatios,
+            self._resamples,
+            self._confidence,
+            np.random.default_rng(self._seed),
+        )
+        return MetricComparison(
+            metric,
+            presentNames,
+            baseValues,
+            candValues,
+            pValues,
+            geomean,
+            interval,
+        )
+
+
+class ComparisonReport:
+    baselineLabel: str
+    candidates: list[CandidateComparison]
+    alpha: float
+
+    def __init__(
+        self,
+        baselineLabel: str,
+        candidates: list[CandidateComparison],
+        alpha: float = 0.05,
+    ) -> None:
+        self.baselineLabel = baselineLabel
+        self.candidates = candidates
+        self.alpha = alpha
+
+    def toJson(self) -> dict[str, Any]:
+        return {
+            "baseline": self.baselineLabel,
+            "alpha": self.alpha,
+            "candidates": {
+                candidate.label: {
+                    "metrics": {
+                        metric: comparison.toJson(self.alpha)
+                        for metric, comparison in candidate.metrics.items()
+                    },
+                    "hashMismatches": candidate.hashMismatches,
+                    "statusChanges": [
+                        {"name": name, "baseline": old, "candidate": new}
+                        for name, old, new in candidate.statusChanges
+                    ],
+                    "onlyInBaseline": candidate.onlyInBaseline,
+                    "onlyInCandidate": candidate.onlyInCandidate,
+                }
+                for candidate in self.candidates
+            },
+        }
+
+    def formatTable(self, top: int = 20) -> str:
+        out = StringIO()
+        for candidate in self.candidates:
+            out.write(f"== {candidate.label} vs {self.baselineLabel} ==\n")
+            for metric, comparison in candidate.metrics.items():
+                self._writeMetric(out, metric, comparison, top)
+            if candidate.hashMismatches:
+                out.write(
+                    f"-- hash mismatches ({len(candidate.hashMismatches)}) --\n"
+                )
+                for name in candidate.hashMismatches:
+                    out.write(f"  {name}\n")
+            if candidate.statusChanges:
+                out.write(
+                    f"-- status changes ({len(candidate.statusChanges)}) --\n"
+                )
+                for name, old, new in candidate.statusChanges:
+                    out.write(f"  {name}: {old} -> {new}\n")
+            if candidate.onlyInBaseline or candidate.onlyInCandidate:
+                out.write(
+                    f"-- unmatched tests: {len(candidate.onlyInBaseline)} "
+                    f"only in baseline, {len(candidate.onlyInCandidate)} "
+                    "only in candidate --\n"
+                )
+            out.write(os.linesep)
+        return out.getvalue()
+
+    def _writeMetric(
+        self,
+        out: StringIO,
+        metric: str,
+        comparison: MetricComparison,
+        top: int,
+    ) -> None:
+        significant = comparison.significant(self.alpha)
+        low, high = comparison.interval
+        out.write(
+            f"-- {metric}: geomean {comparison.geomean:.4f} "
+            f"[{low:.4f}, {high:.4f}], "
+            f"{int(np.sum(significant & (comparison.ratios < 1)))} improved, "
+            f"{int(np.sum(significant & (comparison.ratios > 1)))} regressed, "
+            f"{len(comparison.testNames)} tests --\n"
+        )
+        if top <= 0:
+            return
+        with np.errstate(divide="ignore", invalid="ignore"):
+            distance = np.abs(np.log(comparison.ratios))
+        order = np.argsort(-np.nan_to_num(distance, nan=-1.0), kind="stable")
+        width = max(
+            (len(comparison.testNames[i]) for i in order[:top]), default=0
+        )
+        for i in order[:top]:
+            mark = "*" if significant[i] else " "
+            out.write(
+                f"  {comparison.testNames[i]:<{width}} "
+                f"{comparison.baseline[i]:>12.4f} "
+                f"{comparison.candidate[i]:>12.4f} "
+                f"{comparison.ratios[i]:>8.4f} {mark}\n"
+            )
+
+
+def _parseArgs(args: Sequence[str]) -> Namespace:
+    parser = ArgumentParser(
+        prog="llvm-build compare",
+        description="Compare lit JSON results of a baseline and candidates",
+    )
+    parser.add_argument(
+        "results",
+        nargs="*",
+        help="Result files as '[label=]file[,file...]', the first one is the "
+        "baseline; several files of one label are repeated runs",
+    )
+    parser.add_argument(
+        "--manifest",
+        type=Path,
+        default=None,
+        help="Variant manifest of a matrix build, whose variants come before "
+        "any result files given",
+    )
+    parser.add_argument(
+        "--metric",
+        dest="metrics",
+        action="append",
+        default=None,
+        help=f"Metric to compare (default: {', '.join(DEFAULT_METRICS)})",
+    )
+    parser.add_argument(
+        "--aggregate",
+        choices=[a.value for a in Aggregate],
+        default=Aggregate.MEDIAN.value,
+        help="How samples from repeated runs are reduced",
+    )
+    parser.add_argument(
+        "--resamples",
+        type=int,
+        default=1000,
+        help="Number of bootstrap resamples for the geomean interval",
+    )
+    parser.add_argument(
+        "--confidence",
+        type=float,
+        default=0.95,
+        help="Confidence level of the geomean interval",
+    )
+    parser.add_argument(
+        "--alpha",
+        type=float,
+        default=0.05,
+        help="Significance level of the Mann-Whitney U test",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=None,
+        help="Seed of the bootstrap random generator",
+    )
+    parser.add_argument(
+        "--top",
+        type=int,
+        default=20,
+        help="Number of tests with the largest change to print per metric",
+    )
+    parser.add_argument(
+        "--json",
+        type=Path,
+        default=None,
+        help="File to write the comparison as JSON",
+    )
+    return parser.parse_args(args)
+
+
+def compareResultSets(
+    resultSets: Sequence[LitResultSet],
+    comparator: ResultComparator,
+    metrics: Sequence[str] = DEFAULT_METRICS,
+    alpha: float = 0.05,
+) -> ComparisonReport:
+    if len(resultSets) < 2:
+        raise RuntimeError("at least two result sets are needed to compare")
+    baseline = resultSets[0]
+    return ComparisonReport(
+        baseline.label,
+        [
+            comparator.compare(baseline, candidate, metrics)
+            for candidate in resultSets[1:]
+        ],
+        alpha,
+    )
+
+
+def main(args: Sequence[str] | None = None) -> None:
+    parsedArgs = _parseArgs(sys.argv[1:] if args is None else args)
+    resultSets: list[LitResultSet] = []
+    if parsedArgs.manifest is not None:
+        resultSets.extend(
+            VariantManifest.load(parsedArgs.manifest).resultSets()
+        )
+    resultSets.extend(
+        LitResultSet.load(*parseResultSetSpec(spec))
+        for spec in parsedArgs.results
+    )
+    comparator = ResultComparator(
+        Aggregate(parsedArgs.aggregate),
+        parsedArgs.resamples,
+        parsedArgs.confidence,
+        parsedArgs.seed,
+    )
+    report = compareResultSets(
+        resultSets,
+        comparator,
+        parsedArgs.metrics or DEFAULT_METRICS,
+        parsedArgs.alpha,
+    )
+    sys.stdout.write(report.formatTable(parsedArgs.top))
+    if parsedArgs.json is not None:
+        with parsedArgs.json.open("w") as f:
+            json.dump(report.toJson(), f, indent=2)
+        logging.getLogger(__file__).info(
+            "Comparison written to '%s'", parsedArgs.json
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+import json
+import os
+import shutil
+from collections.abc import Iterable, Sequence
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any
+
+from llvm_build.common.base_builders import AbstractBuilder, CMakeBuilder
+from llvm_build.common.compiler import AbstractCompilerOption
+from llvm_build.common.utils import FileSystemHelper
+from llvm_build.testsuite.lit_results import LitResultFile, LitTestResult
+
+# Phases summarized by clang in "Total <phase>" events of a time trace
+PHASES = (
+    "ExecuteCompiler",
+    "Frontend",
+    "Backend",
+    "Optimizer",
+    "CodeGenPasses",
+)
+INSTRUCTION_SELECTION = "InstructionSelection"
+_globalISelPasses = frozenset(
+    (
+        "IRTranslator",
+        "Legalizer",
+        "RegBankSelect",
+        "InstructionSelect",
+        "Localizer",
+    )
+)
+
+
+def isInstructionSelectionPass(name: str) -> bool:
+    """Match SelectionDAG ISel passes (e.g. 'RISC-V DAG->DAG Pattern
+    Instruction Selection') and the GlobalISel pipeline passes"""
+    return (
+        "Instruction Selection" in name
+        or name in _globalISelPasses
+        or name.endswith("LegalizerCombiner")
+    )
+
+
+class TimeTraceCompilerOption(AbstractCompilerOption):
+    """Make clang write a `-ftime-trace` JSON next to every object file"""
+
+    _granularity: int
+
+    def __init__(self, granularity: int = 500) -> None:
+        super().__init__()
+        self._granularity = granularity
+
+    def getCFlags(self) -> list[str]:
+        return [
+            "-ftime-trace",
+            f"-ftime-trace-granularity={self._granularity}",
+        ]
+
+    def getCXXFlags(self) -> list[str]:
+        return self.getCFlags()
+
+    def getLDFlags(self) -> list[str]:
+        return []
+
+
+class TimeTraceSummary:
+    """Per-phase and per-pass totals in seconds, summed over traces"""
+
+    phases: dict[str, float]
+    passes: dict[str, float]
+    instructionSelection: float
+    traces: int
+
+    def __init__(self) -> None:
+        self.phases = dict()
+        self.passes = dict()
+        self.instructionSelection = 0.0
+        self.traces = 0
+
+    def merge(self, other: "TimeTraceSummary") -> None:
+        for name, seconds in other.phases.items():
+            self.phases[name] = self.phases.get(name, 0.0) + seconds
+        for name, seconds in other.passes.items():
+            self.passes[name] = self.passes.get(name, 0.0) + seconds
+        self.instructionSelection += other.instructionSelection
+        self.traces += other.traces
+
+    def toJson(self) -> dict[str, Any]:
+        return {
+            "traces": self.traces,
+            "phases": self.phases,
+            "instructionSelection": self.instructionSelection,
+            "passes": self.passes,
+        }
+
+    def toLitResults(self) -> list[LitTestResult]:
+        """Express the totals as lit tests, so that runs of different
+        variants can be fed to `llvm-build compare`"""
+        metric = "compile_time"
+        results = [
+            LitTestResult(
+                f"compile-time :: phase/{name}", "PASS", None, {metric: seconds}
+            )
+            for name, seconds in self.phases.items()
+        ]
+        results.append(
+            LitTestResult(
+                f"compile-time :: {INSTRUCTION_SELECTION}",
+                "PASS",
+                None,
+                {metric: self.instructionSelection},
+            )
+        )
+        results.extend(
+            LitTestResult(
+                f"compile-time :: pass/{name}", "PASS", None, {metric: seconds}
+            )
+            for name, seconds in self.passes.items()
+        )
+        return results
+
+
+def parseTimeTrace(path: Path) -> TimeTraceSummary:
+    summary = TimeTraceSummary()
+    with path.open() as f:
+        trace = json.load(f)
+    for event in trace.get("traceEvents", ()):
+        if event.get("ph") != "X":
+            continue
+        name: str = event.get("name", "")
+        seconds = event.get("dur", 0) / 1e6
+        if name.startswith("Total "):
+            phase = name[len("Total ") :]
+            if phase in PHASES:
+                summary.phases[phase] = summary.phases.get(phase, 0) + seconds
+            continue
+        # Legacy codegen passes are reported as "RunPass" with the pass name
+        # in the detail, new pass manager passes by their own name.
+        if name == "RunPass":
+            passName = event.get("args", dict()).get("detail", name)
+        elif name.endswith("Pass"):
+            passName = name
+        else:
+            continue
+        summary.passes[passName] = summary.passes.get(passName, 0) + seconds
+        if isInstructionSelectionPass(passName):
+            summary.instructionSelection += seconds
+    summary.traces = 1
+    return summary
+
+
+def aggregateTimeTraces(
+    paths: Sequence[Path], jobs: int | None = None
+) -> TimeTraceSummary:
+    total = TimeTraceSummary()
+    if not paths:
+        return total
+    jobs = jobs or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        chunksize = max(1, len(paths) // (jobs * 4))
+        for summary in executor.map(parseTimeTrace, paths, chunksize=chunksize):
+            total.merge(summary)
+    return total
+
+
+def _findTimeTraces(buildDir: Path) -> Iterable[Path]:
+    """clang names the trace of 'x.c.o' 'x.c.json'"""
+    for objectFile in buildDir.rglob("*.o"):
+        trace = objectFile.with_suffix(".json")
+        if trace.is_file():
+            yield trace
+
+
+class CompileTimeBuilder(AbstractBuilder):
+    """Build a project compiled with `-ftime-trace` several times from
+    scratch and aggregate the traces of every repetition into
+    `<outputDir>/run-<i>/results.json` (lit format) and
+    `<outputDir>/compile_time.json`."""
+
+    _builder: CMakeBuilder
+    _repetitions: int
+    _outputDir: Path
+    _jobs: int | None
+
+    def __init__(
+        self,
+        builder: CMakeBuilder,
+        repetitions: int,
+        outputDir: Path,
+        jobs: int | None = None,
+    ) -> None:
+        super().__init__()
+        if repetitions < 1:
+            raise RuntimeError("at least one repetition is required")
+        self._builder = builder
+        self._repetitions = repetitions
+        self._outputDir = outputDir
+        self._jobs = jobs
+
+    def configure(self) -> None:
+        self._builder.configure()
+
+    def _collectTraces(self, runDir: Path) -> list[Path]:
+        buildDir = self._builder.getBuildDir()
+        traceDir = runDir / "traces"
+        traces: list[Path] = []
+        for trace in _findTimeTraces(buildDir):
+            target = traceDir / trace.relative_to(buildDir)
+            target.parent.mkdir(parents=True, exist_ok=True)
+            shutil.move(trace, target)
+            traces.append(target)
+        return traces
+
+    def build(self) -> None:
+        if self._outputDir.exists():
+            shutil.rmtree(self._outputDir)
+        FileSystemHelper.create_dir(self._outputDir)
+        runs: list[dict[str, Any]] = []
+        for repetition in range(self._repetitions):
+            self.logger.info(
+                "Compile-time repetition %d/%d",
+                repetition + 1,
+                self._repetitions,
+            )
+            runDir = self._outputDir / f"run-{repetition}"
+            self._builder.clean()
+            self._builder.build()
+            traces = self._collectTraces(runDir)
+            if not traces:
+                raise RuntimeError(
+                    f"no time trace found in {self._builder.getBuildDir()}"
+                )
+            summary = aggregateTimeTraces(traces, self._jobs)
+            LitResultFile(runDir, summary.toLitResults()).dump(
+                runDir / "results.json"
+            )
+            runs.append(summary.toJson())
+        with (self._outputDir / "compile_time.json").open("w") as f:
+            json.dump({"runs": runs}, f, indent=2)
+        self.logger.info(
+            "Compile-time results written to '%s'", self._outputDir
+        )
+
+    def install(self) -> None:
+        self._builder.install()
@@ -0,0 +1,212 @@
+import asyncio
+import re
+import time
+from collections.abc import Mapping, Sequence
+from pathlib import Path
+
+from llvm_build.common.executors import AbstractExecutor
+from llvm_build.common.lit_shards import (
+    TIMES_NAME,
+    readTestTimes,
+    recordedTime,
+    splitShards,
+    updateTestTimes,
+)
+from llvm_build.common.utils import FileSystemHelper, LoggerMixin
+from llvm_build.testsuite.lit_results import (
+    LitResultFile,
+    LitTestResult,
+    testExecutable,
+)
+from llvm_build.testsuite.perf_counters import STAT_SUFFIX
+from llvm_build.testsuite.qemu_user import INSN_SUFFIX
+from llvm_build.testsuite.result_cache import referencedFiles
+
+_siteConfigName = "lit.site.cfg"
+_loadConfigPattern = re.compile(r"load_config\(\s*config,\s*['\"]([^'\"]+)")
+# Exit codes of lit for a run that finished, with or without failing tests
+_litFinished = (0, 1)
+# Files that wrappers of the tests write next to their executables
+_counterSuffixes = (STAT_SUFFIX, INSN_SUFFIX)
+
+
+class DistributedLitRun(LoggerMixin):
+    """Run the tests of a test-suite build directory on several machines.
+    Tests are split into one shard per machine, balanced by the times
+    recorded in earlier runs; each machine receives the files its shard
+    needs, and the shards of machines that fail are split again among the
+    others. The reports are merged into one lit JSON report."""
+
+    _buildDir: Path
+    _executors: list[AbstractExecutor]
+    _lit: str
+    _litArgs: list[str]
+    _env: dict[str, str]
+    # Rounds of splitting the tests of failed machines among the others
+    _retries: int
+
+    def __init__(
+        self,
+        buildDir: Path,
+        executors: Sequence[AbstractExecutor],
+        lit: str,
+        litArgs: Sequence[str] = (),
+        env: Mapping[str, str] | None = None,
+        retries: int = 1,
+    ) -> None:
+        super().__init__()
+        if not executors:
+            raise RuntimeError("no executor to run tests on")
+        self._buildDir = buildDir.resolve()
+        self._executors = list(executors)
+        self._lit = lit
+        self._litArgs = list(litArgs)
+        self._env = dict(env or {})
+        self._retries = retries
+
+    def _supportFiles(self) -> list[Path]:
+        """The site configuration, the lit.cfg and litsupport package it
+        loads, and the tools (e.g. timeit) built into the build directory"""
+        files: list[Path] = []
+        siteConfig = self._buildDir / _siteConfigName
+        if not siteConfig.is_file():
+            return files
+        files.append(siteConfig)
+        match = _loadConfigPattern.search(siteConfig.read_text())
+        if match is not None:
+            litConfig = Path(match.group(1))
+            files.append(litConfig)
+            support = litConfig.parent / "litsupport"
+            files.extend(
+                path
+                for path in sorted(support.rglob("*.py"))
+                if "__pycache__" not in path.parts
+            )
+        tools = self._buildDir / "tools"
+        if tools.is_dir():
+            files.extend(p for p in sorted(tools.iterdir()) if p.is_file())
+        return files
+
+    async def _runShard(
+        self,
+        executor: AbstractExecutor,
+        index: int,
+        tests: list[Path],
+        workDir: Path,
+    ) -> LitResultFile:
+        files = self._supportFiles()
+        for test in tests:
+            files.append(test)
+            files.extend(referencedFiles(test))
+        await executor.sync(files)
+        remoteOutput = executor.remotePath(
+            self._buildDir / f".lit-shard{index}.json"
+        )
+        args = [
+            executor.lit or self._lit,
+            *self._litArgs,
+            "-j",
+            str(executor.jobs),
+            "--skip-test-time-recording",
+            "-o",
+            str(remoteOutput),
+            *(str(executor.remotePath(test)) for test in tests),
+        ]
+        if self._env:
+            args = ["env", *(f"{k}={v}" for k, v in self._env.items()), *args]
+        self.logger.info("Run %d tests on %s", len(tests), executor.name)
+        returncode = await executor.run(args, self._buildDir)
+        if returncode not in _litFinished:
+            raise RuntimeError(f"lit exited with {returncode}")
+        output = workDir / f"shard{index}.json"
+        await executor.fetch(remoteOutput, output)
+        results = LitResultFile.load(output)
+        await executor.fetchFiles(
+            Path(f"{testExecutable(self._buildDir, name)}{suffix}")
+            for name in results.tests
+            for suffix in _counterSuffixes
+        )
+        for test in results.tests.values():
+            test.extra["host"] = executor.name
+        return results
+
+    async def run(
+        self, outputPath: Path, testFiles: Sequence[Path]
+    ) -> LitResultFile:
+        """Run the given .test files, write the merged report to outputPath
+        and return it"""
+        timesPath = self._buildDir / TIMES_NAME
+        times = readTestTimes(timesPath)
+        byName = {
+            str(path.resolve().relative_to(self._buildDir)): path.resolve()
+            for path in testFiles
+        }
+        workDir = outputPath.with_suffix(".shards")
+        if not workDir.exists():
+            FileSystemHelper.create_dir(workDir)
+        start = time.monotonic()
+        healthy = list(self._executors)
+        pending = sorted(byName)
+        reports: list[LitResultFile] = []
+        for _ in range(self._retries + 1):
+            shards = splitShards(times, pending, len(healthy))
+            used = healthy[: len(shards)]
+            outcomes = await asyncio.gather(
+                *(
+                    self._runShard(
+                        executor,
+                        index,
+                        [byName[name] for name in shard],
+                        workDir,
+                    )
+                    for index, (executor, shard) in enumerate(
+                        zip(used, shards, strict=True)
+                    )
+                ),
+                return_exceptions=True,
+            )
+            pending = []
+            for executor, shard, outcome in zip(
+                used, shards, outcomes, strict=True
+            ):
+                if isinstance(outcome, LitResultFile):
+                    reports.append(outcome)
+                    continue
+                if not isinstance(outcome, RuntimeError | OSError):
+                    raise outcome
+                self.logger.warning(
+                    "%d tests failed to run on %s: %s",
+                    len(shard),
+                    executor.name,
+                    outcome,
+                )
+                healthy.remove(executor)
+                pending.extend(shard)
+            if not pending or not healthy:
+                break
+        if pending:
+            raise RuntimeError(f"{len(pending)} tests ran on no executor")
+
+        tests: list[LitTestResult] = []
+        for report in reports:
+            tests.extend(report.tests.values())
+        results = LitResultFile(
+            outputPath,
+            tests,
+            {
+                "__version__": reports[0].extra.get("__version__")
+                if reports
+                else None,
+                "elapsed": time.monotonic() - start,
+            },
+        )
+        results.dump(outputPath)
+        updateTestTimes(
+            timesPath,
+            {
+                test.shortName: recordedTime(test.code, test.elapsed)
+                for test in tests
+                if test.elapsed is not None
+            },
+        )
+        return results
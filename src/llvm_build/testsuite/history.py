@@ -0,0 +1,495 @@
+import datetime
+import json
+import math
+import sqlite3
+import sys
+from argparse import ArgumentParser, Namespace
+from collections.abc import Iterable, Iterator, Sequence
+from pathlib import Path
+
+from llvm_build.common.ninja import NinjaLog
+from llvm_build.common.utils import FileSystemHelper, LoggerMixin
+
+# Pseudo test names used for build metrics derived from `.ninja_log`
+BUILD_TEST_NAME = "__build__"
+BUILD_WALL_TIME_METRIC = "build_wall_time"
+BUILD_CPU_TIME_METRIC = "build_cpu_time"
+EDGE_TIME_METRIC = "edge_time"
+
+_schema = """
+CREATE TABLE IF NOT EXISTS tests (
+    id INTEGER PRIMARY KEY, value TEXT NOT NULL UNIQUE);
+CREATE TABLE IF NOT EXISTS metrics (
+    id INTEGER PRIMARY KEY, value TEXT NOT NULL UNIQUE);
+CREATE TABLE IF NOT EXISTS variants (
+    id INTEGER PRIMARY KEY, value TEXT NOT NULL UNIQUE);
+CREATE TABLE IF NOT EXISTS fingerprints (
+    id INTEGER PRIMARY KEY, value TEXT NOT NULL UNIQUE);
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    date TEXT NOT NULL,
+    variant_id INTEGER NOT NULL REFERENCES variants(id),
+    fingerprint_id INTEGER NOT NULL REFERENCES fingerprints(id),
+    source TEXT NOT NULL,
+    UNIQUE (source, variant_id, date));
+CREATE TABLE IF NOT EXISTS samples (
+    run_id INTEGER NOT NULL REFERENCES runs(id),
+    test_id INTEGER NOT NULL REFERENCES tests(id),
+    metric_id INTEGER NOT NULL REFERENCES metrics(id),
+    date TEXT NOT NULL,
+    variant_id INTEGER NOT NULL,
+    fingerprint_id INTEGER NOT NULL,
+    value REAL,
+    text TEXT);
+CREATE INDEX IF NOT EXISTS samples_series
+    ON samples (test_id, metric_id, variant_id, date, fingerprint_id);
+CREATE INDEX IF NOT EXISTS samples_fingerprint
+    ON samples (fingerprint_id, test_id, metric_id);
+CREATE INDEX IF NOT EXISTS samples_run ON samples (run_id);
+"""
+
+
+class SeriesPoint:
+    """Samples of one test and metric of one night, averaged"""
+
+    date: str
+    value: float
+    count: int
+    fingerprints: str
+
+    def __init__(
+        self, date: str, value: float, count: int, fingerprints: str
+    ) -> None:
+        self.date = date
+        self.value = value
+        self.count = count
+        self.fingerprints = fingerprints
+
+
+def detectChangePoints(
+    values: Sequence[float],
+    minSegment: int = 5,
+    threshold: float = 4.0,
+    minRelativeShift: float = 0.02,
+) -> list[int]:
+    """Binary segmentation on mean shifts. Returns the indices at which a new
+    segment starts. A split is accepted when the two-sample t statistic
+    exceeds `threshold` and the means differ by at least `minRelativeShift`.
+    """
+    prefix = [0.0]
+    prefixSquares = [0.0]
+    for value in values:
+        prefix.append(prefix[-1] + value)
+        prefixSquares.append(prefixSquares[-1] + value * value)
+
+    def segmentStats(lo: int, hi: int) -> tuple[float, float]:
+        n = hi - lo
+        mean = (prefix[hi] - prefix[lo]) / n
+        squares = prefixSquares[hi] - prefixSquares[lo]
+        return mean, max(squares - n * mean * mean, 0.0)
+
+    def bestSplit(lo: int, hi: int) -> tuple[int, float]:
+        bestIndex, bestScore = -1, 0.0
+        for i in range(lo + minSegment, hi - minSegment + 1):
+            leftMean, leftSs = segmentStats(lo, i)
+            rightMean, rightSs = segmentStats(i, hi)
+            shift = abs(rightMean - leftMean)
+            scale = max(abs(leftMean), abs(rightMean))
+            if shift == 0 or (scale and shift / scale < minRelativeShift):
+                continue
+            nl, nr = i - lo, hi - i
+            pooled = (leftSs + rightSs) / max(nl + nr - 2, 1)
+            error = math.sqrt(pooled * (1 / nl + 1 / nr))
+            score = math.inf if error == 0 else shift / error
+            if score > bestScore:
+                bestIndex, bestScore = i, score
+        return bestIndex, bestScore
+
+    changes: list[int] = []
+    pending = [(0, len(values))]
+    while pending:
+        lo, hi = pending.pop()
+        if hi - lo < 2 * minSegment:
+            continue
+        index, score = bestSplit(lo, hi)
+        if index < 0 or score < threshold:
+            continue
+        changes.append(index)
+        pending.append((lo, index))
+        pending.append((index, hi))
+    return sorted(changes)
+
+
+class HistoryDatabase(LoggerMixin):
+    """SQLite store of nightly benchmark and build metrics. Every sample
+    carries its test, metric, night, variant and toolchain fingerprint, and
+    series are read through cursors so the whole history never has to fit
+    in memory."""
+
+    _connection: sqlite3.Connection
+    _idCache: dict[tuple[str, str], int]
+
+    def __init__(self, path: Path | str) -> None:
+        if isinstance(path, Path) and not path.parent.exists():
+            FileSystemHelper.create_dir(path.parent)
+        self._connection = sqlite3.connect(str(path))
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.executescript(_schema)
+        self._idCache = dict()
+
+    def close(self) -> None:
+        self._connection.close()
+
+    def __enter__(self) -> "HistoryDatabase":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def _intern(self, table: str, value: str) -> int:
+        key = (table, value)
+        cached = self._idCache.get(key)
+        if cached is not None:
+            return cached
+        cursor = self._connection.execute(
+            f"INSERT INTO {table} (value) VALUES (?) "
+            "ON CONFLICT (value) DO UPDATE SET value = excluded.value "
+            "RETURNING id",
+            (value,),
+        )
+        rowId = cursor.fetchone()[0]
+        self._idCache[key] = rowId
+        return rowId
+
+    def _lookup(self, table: str, value: str) -> int | None:
+        row = self._connection.execute(
+            f"SELECT id FROM {table} WHERE value = ?", (value,)
+        ).fetchone()
+        return None if row is None else row[0]
+
+    def _ingest(
+        self,
+        source: str,
+        date: str,
+        variant: str,
+        fingerprint: str,
+        samples: Iterable[tuple[str, str, float | str]],
+    ) -> int:
+        """Insert the samples of one run, replacing an earlier ingestion of
+        the same source. Returns the number of samples written."""
+        try:
+            with self._connection:
+                variantId = self._intern("variants", variant)
+                fingerprintId = self._intern("fingerprints", fingerprint)
+                old = self._connection.execute(
+                    "SELECT id FROM runs "
+                    "WHERE source = ? AND variant_id = ? AND date = ?",
+                    (source, variantId, date),
+                ).fetchone()
+                if old is not None:
+                    self.logger.warning(
+                        "replacing samples of '%s' from %s", source, date
+                    )
+                    self._connection.execute(
+                        "DELETE FROM samples WHERE run_id = ?", (old[0],)
+                    )
+                    self._connection.execute(
+                        "DELETE FROM runs WHERE id = ?", (old[0],)
+                    )
+                runId = self._connection.execute(
+                    "INSERT INTO runs (date, variant_id, fingerprint_id, source) "
+                    "VALUES (?, ?, ?, ?)",
+                    (date, variantId, fingerprintId, source),
+                ).lastrowid
+
+                def rows() -> Iterator[tuple]:
+                    for test, metric, value in samples:
+                        isText = isinstance(value, str)
+                        yield (
+                            runId,
+                            self._intern("tests", test),
+                            self._intern("metrics", metric),
+                            date,
+                            variantId,
+                            fingerprintId,
+                            None if isText else float(value),
+                            value if isText else None,
+                        )
+
+                cursor = self._connection.executemany(
+                    "INSERT INTO samples (run_id, test_id, metric_id, date, "
+                    "variant_id, fingerprint_id, value, text) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    rows(),
+                )
+                return cursor.rowcount
+        except BaseException:
+            # The rollback dropped the ids interned by this ingestion
+            self._idCache.clear()
+            raise
+
+    def ingestLitResults(
+        self, path: Path, date: str, variant: str, fingerprint: str
+    ) -> int:
+        FileSystemHelper.check_file(path)
+        with path.open() as f:
+            report = json.load(f)
+
+        def samples() -> Iterator[tuple[str, str, float | str]]:
+            for entry in report.get("tests", ()):
+                name = entry["name"]
+                if entry.get("elapsed") is not None:
+                    yield name, "elapsed", entry["elapsed"]
+                for metric, value in entry.get("metrics", dict()).items():
+                    if isinstance(value, int | float | str) and not isinstance(
+                        value, bool
+                    ):
+                        yield name, metric, value
+
+        count = self._ingest(
+            str(path.resolve()), date, variant, fingerprint, samples()
+        )
+        self.logger.info("ingested %d samples from '%s'", count, path)
+        return count
+
+    def ingestNinjaLog(
+        self, path: Path, date: str, variant: str, fingerprint: str
+    ) -> int:
+        log = NinjaLog.load(path)
+
+        def samples() -> Iterator[tuple[str, str, float | str]]:
+            yield (
+                BUILD_TEST_NAME,
+                BUILD_WALL_TIME_METRIC,
+                (log.lastBuildWallTime()),
+            )
+            yield (
+                BUILD_TEST_NAME,
+                BUILD_CPU_TIME_METRIC,
+                (log.lastBuildCpuTime()),
+            )
+            for entry in log.lastBuild:
+                yield entry.output, EDGE_TIME_METRIC, entry.duration
+
+        count = self._ingest(
+            str(path.resolve()), date, variant, fingerprint, samples()
+        )
+        self.logger.info("ingested %d samples from '%s'", count, path)
+        return count
+
+    def _seriesKey(
+        self, test: str, metric: str, variant: str
+    ) -> tuple[int, int, int] | None:
+        testId = self._lookup("tests", test)
+        metricId = self._lookup("metrics", metric)
+        variantId = self._lookup("variants", variant)
+        if testId is None or metricId is None or variantId is None:
+            return None
+        return testId, metricId, variantId
+
+    def trend(
+        self,
+        test: str,
+        metric: str,
+        variant: str,
+        since: str | None = None,
+        until: str | None = None,
+    ) -> Iterator[SeriesPoint]:
+        key = self._seriesKey(test, metric, variant)
+        if key is None:
+            return
+        cursor = self._connection.execute(
+            "SELECT s.date, AVG(s.value), COUNT(s.value), "
+            "GROUP_CONCAT(DISTINCT f.value) "
+            "FROM samples AS s JOIN fingerprints AS f "
+            "ON f.id = s.fingerprint_id "
+            "WHERE s.test_id = ? AND s.metric_id = ? AND s.variant_id = ? "
+            "AND s.date >= ? AND s.date <= ? AND s.value IS NOT NULL "
+            "GROUP BY s.date ORDER BY s.date",
+            (*key, since or "", until or "9999"),
+        )
+        for date, value, count, fingerprints in cursor:
+            yield SeriesPoint(date, value, count, fingerprints)
+
+    def changePoints(
+        self,
+        test: str,
+        metric: str,
+        variant: str,
+        since: str | None = None,
+        until: str | None = None,
+        **kwargs,
+    ) -> list[tuple[SeriesPoint, SeriesPoint]]:
+        """Return pairs of (last point before, first point after) a change"""
+        series = list(self.trend(test, metric, variant, since, until))
+        indices = detectChangePoints([p.value for p in series], **kwargs)
+        return [(series[i - 1], series[i]) for i in indices]
+
+    def _dates(
+        self, key: tuple[int, int, int], since: str, until: str
+    ) -> list[str]:
+        cursor = self._connection.execute(
+            "SELECT DISTINCT date FROM samples "
+            "WHERE test_id = ? AND metric_id = ? AND variant_id = ? "
+            "AND date >= ? AND date <= ? ORDER BY date",
+            (*key, since, until),
+        )
+        return [row[0] for row in cursor]
+
+    def _valueAt(
+        self, key: tuple[int, int, int], date: str
+    ) -> tuple[float | None, str | None]:
+        return self._connection.execute(
+            "SELECT AVG(value), MIN(text) FROM samples "
+            "WHERE test_id = ? AND metric_id = ? AND variant_id = ? "
+            "AND date = ?",
+            (*key, date),
+        ).fetchone()
+
+    def firstBadNight(
+        self,
+        test: str,
+        metric: str,
+        variant: str,
+        goodDate: str | None = None,
+        badDate: str | None = None,
+        threshold: float = 0.05,
+    ) -> str | None:
+        """Bisect the nights between a known good and a known bad night and
+        return the first night whose value exceeds the good value by more
+        than `threshold` (or differs from it for text metrics such as
+        hashes). Only O(log n) nights are read. Returns None if the bad
+        night is not bad."""
+        key = self._seriesKey(test, metric, variant)
+        if key is None:
+            return None
+        dates = self._dates(key, goodDate or "", badDate or "9999")
+        if len(dates) < 2:
+            return None
+        goodValue, goodText = self._valueAt(key, dates[0])
+
+        def isBad(date: str) -> bool:
+            value, text = self._valueAt(key, date)
+            if goodText is not None or text is not None:
+                return text != goodText
+            if value is None or goodValue is None:
+                return False
+            return value > goodValue * (1 + threshold)
+
+        lo, hi = 0, len(dates) - 1
+        if not isBad(dates[hi]):
+            return None
+        while hi - lo > 1:
+            mid = (lo + hi) // 2
+            if isBad(dates[mid]):
+                hi = mid
+            else:
+                lo = mid
+        return dates[hi]
+
+
+def _parseArgs(args: Sequence[str]) -> Namespace:
+    parser = ArgumentParser(
+        prog="llvm-build history",
+        description="Store and query nightly benchmark and build metrics",
+    )
+    parser.add_argument(
+        "--db",
+        type=Path,
+        default=Path("out/history.sqlite"),
+        help="SQLite database file",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    for name, helpText in (
+        ("ingest-lit", "Ingest lit JSON result files"),
+        ("ingest-ninja", "Ingest build times from .ninja_log files"),
+    ):
+        ingest = commands.add_parser(name, help=helpText)
+        ingest.add_argument("files", nargs="+", type=Path)
+        ingest.add_argument(
+            "--date",
+            default=datetime.date.today().isoformat(),
+            help="Night the files belong to (YYYY-MM-DD)",
+        )
+        ingest.add_argument("--variant", required=True)
+        ingest.add_argument(
+            "--fingerprint",
+            default="unknown",
+            help="Fingerprint of the toolchain that produced the results",
+        )
+    for name, helpText in (
+        ("trend", "Print the nightly series of a metric"),
+        ("changes", "Detect change points in the series of a metric"),
+        ("bisect", "Find the first bad night between two nights"),
+    ):
+        query = commands.add_parser(name, help=helpText)
+        query.add_argument("--test", required=True)
+        query.add_argument("--metric", required=True)
+        query.add_argument("--variant", required=True)
+        query.add_argument("--since", default=None)
+        query.add_argument("--until", default=None)
+        if name == "changes":
+            query.add_argument("--threshold", type=float, default=4.0)
+            query.add_argument("--min-segment", type=int, default=5)
+        if name == "bisect":
+            query.add_argument("--threshold", type=float, default=0.05)
+    return parser.parse_args(args)
+
+
+def main(args: Sequence[str] | None = None) -> None:
+    parsedArgs = _parseArgs(sys.argv[1:] if args is None else args)
+    with HistoryDatabase(parsedArgs.db) as db:
+        if parsedArgs.command in ("ingest-lit", "ingest-ninja"):
+            ingest = (
+                db.ingestLitResults
+                if parsedArgs.command == "ingest-lit"
+                else db.ingestNinjaLog
+            )
+            for path in parsedArgs.files:
+                ingest(
+                    path,
+                    parsedArgs.date,
+                    parsedArgs.variant,
+                    parsedArgs.fingerprint,
+                )
+        elif parsedArgs.command == "trend":
+            for point in db.trend(
+                parsedArgs.test,
+                parsedArgs.metric,
+                parsedArgs.variant,
+                parsedArgs.since,
+                parsedArgs.until,
+            ):
+                print(
+                    f"{point.date} {point.value:.6g} "
+                    f"n={point.count} {point.fingerprints}"
+                )
+        elif parsedArgs.command == "changes":
+            for before, after in db.changePoints(
+                parsedArgs.test,
+                parsedArgs.metric,
+                parsedArgs.variant,
+                parsedArgs.since,
+                parsedArgs.until,
+                minSegment=parsedArgs.min_segment,
+                threshold=parsedArgs.threshold,
+            ):
+                print(
+                    f"{before.date} -> {after.date}: "
+                    f"{before.value:.6g} -> {after.value:.6g}"
+                )
+        else:
+            night = db.firstBadNight(
+                parsedArgs.test,
+                parsedArgs.metric,
+                parsedArgs.variant,
+                parsedArgs.since,
+                parsedArgs.until,
+                parsedArgs.threshold,
+            )
+            print(night if night is not None else "no bad night found")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+import json
+from collections.abc import Iterable, Iterator, Sequence
+from pathlib import Path
+from typing import Any
+
+from llvm_build.common.utils import FileSystemHelper, LoggerMixin
+
+MetricValue = float | str
+
+
+class LitTestResult:
+    """A single test entry of a lit JSON report (`lit -o results.json`)"""
+
+    name: str
+    code: str
+    elapsed: float | None
+    metrics: dict[str, MetricValue]
+    # Other fields such as "output", kept to write the entry back unchanged
+    extra: dict[str, Any]
+
+    def __init__(
+        self,
+        name: str,
+        code: str,
+        elapsed: float | None = None,
+        metrics: dict[str, MetricValue] | None = None,
+        extra: dict[str, Any] | None = None,
+    ) -> None:
+        self.name = name
+        self.code = code
+        self.elapsed = elapsed
+        self.metrics = metrics if metrics is not None else dict()
+        self.extra = extra if extra is not None else dict()
+
+    @classmethod
+    def fromJson(cls, entry: dict[str, Any]) -> "LitTestResult":
+        metrics: dict[str, MetricValue] = dict()
+        for key, value in entry.get("metrics", dict()).items():
+            if isinstance(value, bool):
+                continue
+            if isinstance(value, int | float | str):
+                metrics[key] = value
+        return cls(
+            name=entry["name"],
+            code=entry.get("code", "UNKNOWN"),
+            elapsed=entry.get("elapsed"),
+            metrics=metrics,
+            extra={
+                key: value
+                for key, value in entry.items()
+                if key not in ("name", "code", "elapsed", "metrics")
+            },
+        )
+
+    def toJson(self) -> dict[str, Any]:
+        entry: dict[str, Any] = {
+            "name": self.name,
+            "code": self.code,
+            **self.extra,
+        }
+        if self.elapsed is not None:
+            entry["elapsed"] = self.elapsed
+        if self.metrics:
+            entry["metrics"] = dict(self.metrics)
+        return entry
+
+    @property
+    def shortName(self) -> str:
+        """Test name without the leading 'suite :: ' part"""
+        _, sep, tail = self.name.partition(" :: ")
+        return tail if sep else self.name
+
+
+class LitResultFile(LoggerMixin):
+    path: Path
+    tests: dict[str, LitTestResult]
+    # Top-level fields besides "tests", e.g. "__version__" and "elapsed"
+    extra: dict[str, Any]
+
+    def __init__(
+        self,
+        path: Path,
+        tests: Iterable[LitTestResult],
+        extra: dict[str, Any] | None = None,
+    ) -> None:
+        self.path = path
+        self.tests = {test.name: test for test in tests}
+        self.extra = extra if extra is not None else dict()
+
+    @classmethod
+    def load(cls, path: Path) -> "LitResultFile":
+        FileSystemHelper.check_file(path)
+        with path.open() as f:
+            report = json.load(f)
+        if not isinstance(report, dict) or "tests" not in report:
+            raise RuntimeError(f"not a lit JSON report: {path}")
+        return cls(
+            path,
+            (LitTestResult.fromJson(entry) for entry in report["tests"]),
+            {key: value for key, value in report.items() if key != "tests"},
+        )
+
+    def dump(self, path: Path) -> None:
+        with path.open("w") as f:
+            json.dump(
+                {
+                    **self.extra,
+                    "tests": [test.toJson() for test in self.tests.values()],
+                },
+                f,
+                indent=2,
+            )
+
+
+class LitResultSet:
+    """Results of one variant, possibly gathered from several runs. Each run
+    contributes one sample per test and metric."""
+
+    label: str
+    runs: list[LitResultFile]
+
+    def __init__(self, label: str, runs: Sequence[LitResultFile]) -> None:
+        if not runs:
+            raise RuntimeError(f"no result file given for '{label}'")
+        self.label = label
+        self.runs = list(runs)
+
+    @classmethod
+    def load(cls, label: str, paths: Sequence[Path]) -> "LitResultSet":
+        return cls(label, [LitResultFile.load(path) for path in paths])
+
+    def testNames(self) -> set[str]:
+        names: set[str] = set()
+        for run in self.runs:
+            names.update(run.tests)
+        return names
+
+    def _iterTest(self, name: str) -> Iterator[LitTestResult]:
+        for run in self.runs:
+            test = run.tests.get(name)
+            if test is not None:
+                yield test
+
+    def numericSamples(self, name: str, metric: str) -> list[float]:
+        samples: list[float] = []
+        for test in self._iterTest(name):
+            value = test.metrics.get(metric)
+            if isinstance(value, int | float):
+                samples.append(float(value))
+        return samples
+
+    def stringValues(self, name: str, metric: str) -> set[str]:
+        values: set[str] = set()
+        for test in self._iterTest(name):
+            value = test.metrics.get(metric)
+            if value is not None:
+                values.add(str(value))
+        return values
+
+    def codes(self, name: str) -> set[str]:
+        return {test.code for test in self._iterTest(name)}
+
+
+class VariantManifest(LoggerMixin):
+    """Build directories of the variants of a project, in the order they
+    are compared; the first variant is the baseline. Results of a variant
+    are expected at `<buildDir>/results.json`."""
+
+    RESULTS_NAME = "results.json"
+
+    path: Path
+    buildDirs: dict[str, Path]
+
+    def __init__(self, path: Path, buildDirs: dict[str, Path]) -> None:
+        self.path = path
+        self.buildDirs = dict(buildDirs)
+
+    @classmethod
+    def load(cls, path: Path) -> "VariantManifest":
+        FileSystemHelper.check_file(path)
+        with path.open() as f:
+            manifest = json.load(f)
+        return cls(
+            path,
+            {
+                name: Path(entry["buildDir"])
+                for name, entry in manifest["variants"].items()
+            },
+        )
+
+    def dump(self) -> None:
+        variants = {
+            name: {
+                "buildDir": str(buildDir),
+                "results": str(self.resultsPath(name)),
+            }
+            for name, buildDir in self.buildDirs.items()
+        }
+        if not self.path.parent.exists():
+            FileSystemHelper.create_dir(self.path.parent)
+        with self.path.open("w") as f:
+            json.dump({"variants": variants}, f, indent=2)
+
+    def resultsPath(self, name: str) -> Path:
+        return self.buildDirs[name] / self.RESULTS_NAME
+
+    def resultSets(self) -> list[LitResultSet]:
+        """Result sets of the variants that have results so far"""
+        resultSets: list[LitResultSet] = []
+        for name in self.buildDirs:
+            path = self.resultsPath(name)
+            if not path.is_file():
+                self.logger.warning("no results of variant '%s'", name)
+                continue
+            resultSets.append(LitResultSet.load(name, [path]))
+        return resultSets
+
+
+def testExecutable(buildDir: Path, testName: str) -> Path:
+    """Map 'test-suite :: SingleSource/x/y.test' to the executable the test
+    runs, which lives next to the .test file in the build directory"""
+    _, sep, relativePath = testName.partition(" :: ")
+    if not sep:
+        relativePath = testName
+    return (buildDir / relativePath).with_suffix("")
+
+
+def parseResultSetSpec(spec: str) -> tuple[str, list[Path]]:
+    """Parse '[label=]file[,file...]'. Without a label, the stem of the first
+    file is used."""
+    label, sep, files = spec.partition("=")
+    if not sep:
+        files, label = label, ""
+    paths = [Path(p) for p in files.split(",") if p]
+    if not paths:
+        raise RuntimeError(f"no result file in '{spec}'")
+    return (label or paths[0].stem), paths
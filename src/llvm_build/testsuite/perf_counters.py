@@ -0,0 +1,139 @@
+import logging
+import os
+import shlex
+import shutil
+import subprocess
+import sys
+from collections.abc import Sequence
+from pathlib import Path
+
+from llvm_build.common.base_builders import AbstractCMakeDefineProvider
+from llvm_build.testsuite.lit_results import LitResultFile, testExecutable
+
+HARDWARE_EVENTS = ("instructions", "cycles", "branch-misses", "cache-misses")
+SOFTWARE_EVENTS = ("task-clock", "context-switches", "page-faults")
+DEFAULT_EVENTS = HARDWARE_EVENTS + SOFTWARE_EVENTS
+
+# lit separates sub-metrics with "..", like "size..text"
+METRIC_PREFIX = "perf.."
+STAT_SUFFIX = ".perfstat"
+
+
+def parsePerfStatCsv(text: str) -> dict[str, float]:
+    """Parse the output of `perf stat -x,`. Events that are not supported
+    or were not counted are left out."""
+    counters: dict[str, float] = dict()
+    for line in text.splitlines():
+        if not line or line.startswith("#"):
+            continue
+        fields = line.split(",")
+        if len(fields) < 3:
+            continue
+        value, event = fields[0], fields[2]
+        try:
+            number = float(value)
+        except ValueError:
+            # "<not supported>" or "<not counted>"
+            continue
+        counters[event.split(":")[0]] = number
+    return counters
+
+
+def probeEvents(
+    events: Sequence[str] = DEFAULT_EVENTS, perfPath: str | None = None
+) -> list[str]:
+    """Return the subset of `events` this host can count, falling back to
+    software events (task-clock always works) when hardware counters are
+    not exposed, e.g. in containers or on boards without a PMU driver"""
+    logger = logging.getLogger(__file__)
+    perfPath = perfPath or shutil.which("perf")
+    if perfPath is None:
+        logger.warning("perf not found, no counters will be collected")
+        return []
+    proc = subprocess.run(
+        [perfPath, "stat", "-x,", "-e", ",".join(events), "--", "true"],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    supported = list(parsePerfStatCsv(proc.stderr))
+    if proc.returncode != 0 or not supported:
+        logger.warning(
+            "perf stat failed (%s), falling back to software events",
+            proc.stderr.strip().splitlines()[-1:] or proc.returncode,
+        )
+        return [e for e in events if e in SOFTWARE_EVENTS] or ["task-clock"]
+    unsupported = [e for e in events if e not in supported]
+    if unsupported:
+        logger.warning("perf events not supported: %s", ", ".join(unsupported))
+    return [e for e in events if e in supported]
+
+
+class PerfStatDefineProvider(AbstractCMakeDefineProvider):
+    """Run every test-suite benchmark under the perf stat wrapper of this
+    module through TEST_SUITE_RUN_UNDER"""
+
+    _events: list[str]
+
+    def __init__(self, events: Sequence[str]) -> None:
+        super().__init__()
+        self._events = list(events)
+
+    def getDefines(self) -> dict[str, str]:
+        if not self._events:
+            return dict()
+        wrapper = [
+            sys.executable,
+            "-m",
+            __name__,
+            "--events",
+            ",".join(self._events),
+            "--",
+        ]
+        return {"TEST_SUITE_RUN_UNDER": shlex.join(wrapper)}
+
+
+def mergePerfCounters(results: LitResultFile, buildDir: Path) -> int:
+    """Attach the counters written by the wrapper to the tests as
+    'perf..<event>' metrics and remove the stat files. Returns the number
+    of tests that got counters."""
+    merged = 0
+    for test in results.tests.values():
+        statFile = Path(str(testExecutable(buildDir, test.name)) + STAT_SUFFIX)
+        if not statFile.is_file():
+            continue
+        counters = parsePerfStatCsv(statFile.read_text())
+        for event, value in counters.items():
+            test.metrics[METRIC_PREFIX + event] = value
+        statFile.unlink()
+        merged += 1
+    return merged
+
+
+def _wrap(events: str, command: list[str]) -> int:
+    """Run `command` under `perf stat`, writing the counters next to the
+    executable. Without perf the command is run as is."""
+    if not command:
+        raise RuntimeError("no command to run")
+    perfPath = shutil.which("perf")
+    if perfPath is None:
+        os.execvp(command[0], command)
+    executable = Path(shutil.which(command[0]) or command[0]).resolve()
+    statFile = f"{executable}{STAT_SUFFIX}"
+    return subprocess.call(
+        [perfPath, "stat", "-x,", "-o", statFile, "-e", events, "--", *command]
+    )
+
+
+def main(args: Sequence[str] | None = None) -> None:
+    args = list(sys.argv[1:] if args is None else args)
+    if len(args) < 3 or args[0] != "--events" or args[2] != "--":
+        sys.stderr.write(
+            f"usage: {__name__} --events EVENT[,EVENT...] -- COMMAND...\n"
+        )
+        sys.exit(2)
+    sys.exit(_wrap(args[1], args[3:]))
+
+
+if __name__ == "__main__":
+    main()
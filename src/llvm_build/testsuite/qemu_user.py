@@ -0,0 +1,150 @@
+import os
+import re
+import shlex
+import shutil
+import sys
+from argparse import ArgumentParser, Namespace
+from collections.abc import Sequence
+from pathlib import Path
+
+from llvm_build.common.base_builders import AbstractCMakeDefineProvider
+from llvm_build.testsuite.lit_results import LitResultFile, testExecutable
+
+DEFAULT_QEMU = "qemu-riscv64"
+INSTRUCTIONS_METRIC = "qemu..instructions"
+INSN_SUFFIX = ".qemu-insn"
+# Set by the provider; lets the runner tell emulated build directories apart
+_userModeDefine = "TEST_SUITE_USER_MODE_EMULATION"
+# The insn plugin prints "insns: N", recent versions "total insns: N" after
+# per-vCPU counts
+_insnPattern = re.compile(r"^(total )?insns: (\d+)$", re.MULTILINE)
+
+
+def parseInsnLog(text: str) -> int | None:
+    count: int | None = None
+    for match in _insnPattern.finditer(text):
+        if match.group(1):
+            return int(match.group(2))
+        count = int(match.group(2))
+    return count
+
+
+def isUserModeEmulationBuild(buildDir: Path) -> bool:
+    cache = buildDir / "CMakeCache.txt"
+    if not cache.is_file():
+        return False
+    prefix = f"{_userModeDefine}:"
+    for line in cache.read_text().splitlines():
+        if line.startswith(prefix):
+            return line.partition("=")[2].upper() in ("ON", "1", "TRUE")
+    return False
+
+
+class QemuUserDefineProvider(AbstractCMakeDefineProvider):
+    """Run cross-compiled test-suite benchmarks through qemu user mode
+    emulation. With the insn plugin of qemu, each run also reports the number
+    of guest instructions, which unlike wall time does not depend on the
+    host or on how many tests run at once."""
+
+    _qemu: str
+    _sysroot: Path | None
+    _cpu: str | None
+    _plugin: Path | None
+    _libraryPaths: list[Path]
+
+    def __init__(
+        self,
+        qemu: str = DEFAULT_QEMU,
+        sysroot: Path | None = None,
+        cpu: str | None = None,
+        plugin: Path | None = None,
+        libraryPaths: Sequence[Path] = (),
+    ) -> None:
+        super().__init__()
+        self._qemu = qemu
+        self._sysroot = sysroot
+        self._cpu = cpu
+        self._plugin = plugin
+        self._libraryPaths = list(libraryPaths)
+
+    def getDefines(self) -> dict[str, str]:
+        wrapper = [sys.executable, "-m", __name__, "--qemu", self._qemu]
+        if self._sysroot is not None:
+            wrapper.extend(("--sysroot", str(self._sysroot)))
+        if self._cpu is not None:
+            wrapper.extend(("--cpu", self._cpu))
+        if self._plugin is not None:
+            wrapper.extend(("--plugin", str(self._plugin)))
+        for path in self._libraryPaths:
+            wrapper.extend(("--library-path", str(path)))
+        wrapper.append("--")
+        return {
+            "TEST_SUITE_RUN_UNDER": shlex.join(wrapper),
+            # Build helper tools such as fpcmp for the host
+            _userModeDefine: "ON",
+        }
+
+
+def mergeInstructionCounts(results: LitResultFile, buildDir: Path) -> int:
+    """Attach the instruction counts written by the wrapper as
+    'qemu..instructions' and drop the emulated wall time. Returns the
+    number of tests that got a count."""
+    merged = 0
+    for test in results.tests.values():
+        logFile = Path(str(testExecutable(buildDir, test.name)) + INSN_SUFFIX)
+        if not logFile.is_file():
+            continue
+        count = parseInsnLog(logFile.read_text())
+        logFile.unlink()
+        if count is None:
+            continue
+        test.metrics[INSTRUCTIONS_METRIC] = float(count)
+        test.metrics.pop("exec_time", None)
+        merged += 1
+    return merged
+
+
+def _qemuCommand(options: Namespace, command: list[str]) -> list[str]:
+    qemuCommand = [options.qemu]
+    if options.sysroot is not None:
+        qemuCommand.extend(("-L", options.sysroot))
+    if options.cpu is not None:
+        qemuCommand.extend(("-cpu", options.cpu))
+    if options.library_path:
+        qemuCommand.extend(
+            ("-E", "LD_LIBRARY_PATH=" + ":".join(options.library_path))
+        )
+    if options.plugin is not None:
+        executable = Path(shutil.which(command[0]) or command[0]).resolve()
+        qemuCommand.extend(
+            (
+                "-plugin",
+                options.plugin,
+                "-d",
+                "plugin",
+                "-D",
+                f"{executable}{INSN_SUFFIX}",
+            )
+        )
+    return [*qemuCommand, *command]
+
+
+def _parseArgs(args: Sequence[str]) -> Namespace:
+    parser = ArgumentParser(prog=__name__)
+    parser.add_argument("--qemu", default=DEFAULT_QEMU)
+    parser.add_argument("--sysroot", default=None)
+    parser.add_argument("--cpu", default=None)
+    parser.add_argument("--plugin", default=None)
+    parser.add_argument("--library-path", action="append", default=[])
+    parser.add_argument("command", nargs="+")
+    return parser.parse_args(args)
+
+
+def main(args: Sequence[str] | None = None) -> None:
+    parsedArgs = _parseArgs(sys.argv[1:] if args is None else args)
+    command = _qemuCommand(parsedArgs, parsedArgs.command)
+    os.execvp(command[0], command)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+import hashlib
+import json
+import os
+import shlex
+from collections.abc import Iterator, Sequence
+from pathlib import Path
+
+from llvm_build.common.utils import FileSystemHelper, LoggerMixin
+from llvm_build.testsuite.lit_results import LitTestResult, testExecutable
+
+# Metrics that depend on the machine state of a run rather than on the
+# executable; they are never taken from the cache
+_timingMetrics = frozenset(("exec_time", "compile_time", "link_time"))
+_timingMetricPrefixes = ("perf..",)
+# Configuration shared by all tests of a build directory, e.g. the
+# TEST_SUITE_RUN_UNDER wrapper and the remote host
+_siteConfigName = "lit.site.cfg"
+# Shell redirections that may be glued to a file name, as in '<input'
+_redirections = ("<", ">", "2>", "&>")
+
+
+def isTimingMetric(name: str) -> bool:
+    return name in _timingMetrics or name.startswith(_timingMetricPrefixes)
+
+
+def referencedFiles(testFile: Path) -> Iterator[Path]:
+    """Yield files named in the commands of a test-suite .test file, which
+    covers the executable, its inputs, reference outputs and comparison
+    tools"""
+    testDir = testFile.parent
+    seen: set[Path] = set()
+    for line in testFile.read_text().splitlines():
+        _, sep, command = line.partition(":")
+        if not sep:
+            continue
+        try:
+            tokens = shlex.split(command.replace("%S", str(testDir)))
+        except ValueError:
+            tokens = command.split()
+        for token in tokens:
+            for redirection in _redirections:
+                if token.startswith(redirection):
+                    token = token[len(redirection) :]
+                    break
+            token = token.rstrip(";")
+            if not token or token.startswith(("-", "%")):
+                continue
+            path = Path(token)
+            if not path.is_absolute():
+                path = testDir / path
+            if path in seen or not path.is_file():
+                continue
+            seen.add(path)
+            yield path
+
+
+def resultCacheKey(buildDir: Path, testFile: Path) -> str:
+    """Hash the .test file (the run command), every file it refers to and
+    the lit site configuration. Identical keys mean the test would run the
+    same binary on the same inputs in the same way."""
+    digest = hashlib.sha256()
+    siteConfig = buildDir / _siteConfigName
+    if siteConfig.is_file():
+        digest.update(siteConfig.read_bytes())
+    digest.update(testFile.read_bytes())
+    for path in referencedFiles(testFile):
+        with path.open("rb") as f:
+            digest.update(hashlib.file_digest(f, "sha256").digest())
+    return digest.hexdigest()
+
+
+def testFileOf(buildDir: Path, testName: str) -> Path:
+    return testExecutable(buildDir, testName).with_suffix(".test")
+
+
+class ResultCache(LoggerMixin):
+    """Content-addressed store of test results. Each entry holds the code
+    and non-timing metrics (such as the output hash) of a test run, so that
+    a byte-identical test does not have to be run again to know whether it
+    passes."""
+
+    _cacheDir: Path
+
+    def __init__(self, cacheDir: Path) -> None:
+        super().__init__()
+        self._cacheDir = cacheDir
+
+    def _entryPath(self, key: str) -> Path:
+        return self._cacheDir / key[:2] / f"{key}.json"
+
+    def lookup(self, key: str) -> LitTestResult | None:
+        path = self._entryPath(key)
+        try:
+            with path.open() as f:
+                return LitTestResult.fromJson(json.load(f))
+        except FileNotFoundError:
+            return None
+        except (json.JSONDecodeError, KeyError):
+            self.logger.warning("ignoring corrupt cache entry '%s'", path)
+            return None
+
+    def store(self, key: str, test: LitTestResult) -> None:
+        entry = LitTestResult(
+            test.name,
+            test.code,
+            metrics={
+                name: value
+                for name, value in test.metrics.items()
+                if not isTimingMetric(name)
+            },
+            extra={"output": test.extra["output"]}
+            if "output" in test.extra
+            else None,
+        )
+        path = self._entryPath(key)
+        if not path.parent.exists():
+            FileSystemHelper.create_dir(path.parent)
+        # Concurrent runners may store the same key; the last rename wins
+        temporary = path.with_suffix(f".{os.getpid()}.tmp")
+        with temporary.open("w") as f:
+            json.dump(entry.toJson(), f)
+        os.replace(temporary, path)
+
+
+def findTestFiles(roots: Sequence[Path]) -> list[Path]:
+    testFiles: list[Path] = []
+    for root in roots:
+        if root.is_file():
+            testFiles.append(root)
+            continue
+        for directory, _, files in os.walk(root):
+            testFiles.extend(
+                Path(directory) / name
+                for name in files
+                if name.endswith(".test")
+            )
+    return sorted(testFiles)
@@ -0,0 +1,328 @@
+import os
+import shutil
+import subprocess
+import sys
+from argparse import ArgumentParser, Namespace
+from collections.abc import Sequence
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from llvm_build.common.executors import AbstractExecutor, parseExecutor
+from llvm_build.common.process import runSync
+from llvm_build.common.utils import FileSystemHelper, LoggerMixin
+from llvm_build.testsuite.distributed import DistributedLitRun
+from llvm_build.testsuite.lit_results import (
+    LitResultFile,
+    LitTestResult,
+    VariantManifest,
+)
+from llvm_build.testsuite.perf_counters import mergePerfCounters
+from llvm_build.testsuite.qemu_user import (
+    isUserModeEmulationBuild,
+    mergeInstructionCounts,
+)
+from llvm_build.testsuite.result_cache import (
+    ResultCache,
+    findTestFiles,
+    resultCacheKey,
+    testFileOf,
+)
+
+
+class LitRunner(LoggerMixin):
+    """Run lit on a configured and built llvm-test-suite directory"""
+
+    _buildDir: Path
+    _litPath: Path | None
+    _jobs: int
+    _extraArgs: list[str]
+    _env: dict[str, str]
+    _resultCache: ResultCache | None
+    _remeasure: bool
+    # Machines to spread the tests over instead of running them here
+    _executors: list[AbstractExecutor]
+    _retries: int
+
+    def __init__(
+        self,
+        buildDir: Path,
+        jobs: int | None = None,
+        litPath: Path | None = None,
+    ) -> None:
+        """Without `jobs`, tests run one at a time so that timings are not
+        disturbed, except in build directories run under qemu user mode,
+        which count instructions and use every host core"""
+        super().__init__()
+        self._buildDir = buildDir
+        self._litPath = litPath
+        if jobs is None:
+            jobs = (
+                os.cpu_count() or 1 if isUserModeEmulationBuild(buildDir) else 1
+            )
+        self._jobs = jobs
+        self._extraArgs = []
+        self._env = dict()
+        self._resultCache = None
+        self._remeasure = False
+        self._executors = []
+        self._retries = 1
+
+    def getBuildDir(self) -> Path:
+        return self._buildDir
+
+    def addLitArgument(self, arg: str) -> None:
+        self._extraArgs.append(arg)
+
+    def setEnvironment(self, key: str, value: str) -> None:
+        self._env[key] = value
+
+    def setResultCache(
+        self, resultCache: ResultCache, remeasure: bool = False
+    ) -> None:
+        """Skip tests whose executable, inputs and run command match a
+        cached result. With `remeasure`, every test is run to collect fresh
+        timings and the cache is only refreshed."""
+        self._resultCache = resultCache
+        self._remeasure = remeasure
+
+    def setExecutors(
+        self, executors: Sequence[AbstractExecutor], retries: int = 1
+    ) -> None:
+        """Split the tests over these machines, moving the tests of a
+        machine that fails to the others up to `retries` times. The jobs
+        of each executor replace the lit workers."""
+        self._executors = list(executors)
+        self._retries = retries
+
+    def _findLit(self) -> Path:
+        if self._litPath is not None:
+            FileSystemHelper.check_file(self._litPath)
+            return self._litPath
+        for name in ("lit", "llvm-lit"):
+            litPath = shutil.which(name)
+            if litPath is not None:
+                return Path(litPath)
+        raise RuntimeError("cannot find lit or llvm-lit")
+
+    def run(
+        self, outputPath: Path, tests: Sequence[Path | str] = ()
+    ) -> LitResultFile:
+        """Run the given test files or directories (the whole build
+        directory by default) and return the parsed results, including
+        counters of benchmarks run under the perf stat or qemu wrappers and
+        results reused from the result cache. lit failing tests is not an
+        error; a missing report is."""
+        FileSystemHelper.check_dir(self._buildDir)
+        if not outputPath.parent.exists():
+            FileSystemHelper.create_dir(outputPath.parent)
+        if self._resultCache is None:
+            return self._runLit(outputPath, tests)
+        return self._runCached(self._resultCache, outputPath, tests)
+
+    def _runCached(
+        self,
+        resultCache: ResultCache,
+        outputPath: Path,
+        tests: Sequence[Path | str],
+    ) -> LitResultFile:
+        testFiles = findTestFiles(
+            [Path(t) for t in tests] if tests else [self._buildDir]
+        )
+        # Hashing is I/O bound and hashlib releases the GIL
+        with ThreadPoolExecutor(max_workers=self._jobs) as executor:
+            keys = list(
+                executor.map(
+                    lambda t: resultCacheKey(self._buildDir, t), testFiles
+                )
+            )
+        reused: list[LitTestResult] = []
+        pending: dict[Path, str] = dict()
+        for testFile, key in zip(testFiles, keys, strict=True):
+            cached = None if self._remeasure else resultCache.lookup(key)
+            if cached is None:
+                pending[testFile.resolve()] = key
+                continue
+            cached.extra["reused"] = True
+            reused.append(cached)
+        self.logger.info(
+            "%d of %d tests reused from the result cache",
+            len(reused),
+            len(testFiles),
+        )
+        if pending:
+            results = self._runLit(outputPath, list(pending))
+        else:
+            results = LitResultFile(outputPath, ())
+        for test in results.tests.values():
+            key = pending.get(testFileOf(self._buildDir, test.name).resolve())
+            if key is not None:
+                resultCache.store(key, test)
+        for test in reused:
+            results.tests.setdefault(test.name, test)
+        results.dump(outputPath)
+        return results
+
+    def _runDistributed(
+        self, outputPath: Path, tests: Sequence[Path | str]
+    ) -> LitResultFile:
+        run = DistributedLitRun(
+            self._buildDir,
+            self._executors,
+            str(self._findLit()),
+            ["-v", *self._extraArgs],
+            self._env,
+            self._retries,
+        )
+        testFiles = findTestFiles(
+            [Path(t) for t in tests] if tests else [self._buildDir]
+        )
+        return runSync(run.run(outputPath, testFiles))
+
+    def _runLit(
+        self, outputPath: Path, tests: Sequence[Path | str]
+    ) -> LitResultFile:
+        if self._executors:
+            results = self._runDistributed(outputPath, tests)
+        else:
+            results = self._runLocal(outputPath, tests)
+        merged = mergePerfCounters(results, self._buildDir)
+        merged += mergeInstructionCounts(results, self._buildDir)
+        if merged:
+            results.dump(outputPath)
+        return results
+
+    def _runLocal(
+        self, outputPath: Path, tests: Sequence[Path | str]
+    ) -> LitResultFile:
+        args: list[str] = [
+            str(self._findLit()),
+            "-v",
+            "-j",
+            str(self._jobs),
+            "-o",
+            str(outputPath),
+            *self._extraArgs,
+        ]
+        if tests:
+            args.extend(str(t) for t in tests)
+        else:
+            args.append(str(self._buildDir))
+        self.logger.info(
+            "Lit command is: %s%s",
+            os.linesep,
+            FileSystemHelper.convertCommandToStr(*args),
+        )
+        proc = subprocess.run(args, env={**os.environ, **self._env})
+        if not outputPath.exists():
+            raise RuntimeError(
+                f"lit exited with {proc.returncode} without writing "
+                f"{outputPath}"
+            )
+        return LitResultFile.load(outputPath)
+
+
+def _parseArgs(args: Sequence[str]) -> Namespace:
+    parser = ArgumentParser(
+        prog="llvm-build run-tests",
+        description="Run the llvm-test-suite of a build directory with lit",
+    )
+    parser.add_argument(
+        "buildDir",
+        type=Path,
+        nargs="?",
+        default=None,
+        help="Test-suite build dir",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        type=Path,
+        default=None,
+        help="File to write lit JSON results",
+    )
+    parser.add_argument(
+        "--manifest",
+        type=Path,
+        default=None,
+        help="Run every variant of a matrix build instead of one build dir",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=None,
+        help="Number of lit workers, 1 by default or all cores under qemu",
+    )
+    parser.add_argument(
+        "--lit", type=Path, default=None, help="Path to lit or llvm-lit"
+    )
+    parser.add_argument(
+        "--result-cache",
+        type=Path,
+        default=None,
+        help="Directory of results to reuse for unchanged tests",
+    )
+    parser.add_argument(
+        "--remeasure",
+        action="store_true",
+        default=False,
+        help="Run every test for fresh timings, only refreshing the cache",
+    )
+    parser.add_argument(
+        "--host",
+        dest="hosts",
+        action="append",
+        default=[],
+        help="Machine to run a shard of the tests on, may be repeated: "
+        "local, ssh://[user@]host or fake:/root, with an optional "
+        "#jobs suffix",
+    )
+    parser.add_argument(
+        "--retries",
+        type=int,
+        default=1,
+        help="Times the tests of failed hosts are moved to the others",
+    )
+    parsedArgs = parser.parse_args(args)
+    if parsedArgs.manifest is None and (
+        parsedArgs.buildDir is None or parsedArgs.output is None
+    ):
+        parser.error("a build dir and --output, or --manifest is required")
+    return parsedArgs
+
+
+def _runOne(parsedArgs: Namespace, buildDir: Path, output: Path) -> bool:
+    runner = LitRunner(buildDir, parsedArgs.jobs, parsedArgs.lit)
+    if parsedArgs.hosts:
+        runner.setExecutors(
+            [parseExecutor(spec) for spec in parsedArgs.hosts],
+            parsedArgs.retries,
+        )
+    if parsedArgs.result_cache is not None:
+        runner.setResultCache(
+            ResultCache(parsedArgs.result_cache), parsedArgs.remeasure
+        )
+    results = runner.run(output)
+    failures = [t for t in results.tests.values() if t.code != "PASS"]
+    runner.logger.info(
+        "%d tests, %d not passing", len(results.tests), len(failures)
+    )
+    return not failures
+
+
+def main(args: Sequence[str] | None = None) -> None:
+    parsedArgs = _parseArgs(sys.argv[1:] if args is None else args)
+    if parsedArgs.manifest is None:
+        passed = _runOne(parsedArgs, parsedArgs.buildDir, parsedArgs.output)
+    else:
+        # Variants run one after another so that their timings compare
+        manifest = VariantManifest.load(parsedArgs.manifest)
+        passed = True
+        for name, buildDir in manifest.buildDirs.items():
+            passed &= _runOne(parsedArgs, buildDir, manifest.resultsPath(name))
+    if not passed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+import os
+import shutil
+import subprocess
+import tarfile
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+
+from llvm_build.builders.artifacts import (
+    CHECKSUM_MANIFEST_NAME,
+    ArtifactUnpacker,
+    detectCodec,
+    writeChecksumManifest,
+)
+from llvm_build.builders.driver import _packageCommand
+
+
+def _installTree(root: Path) -> Path:
+    installDir = root / "install"
+    for name, content in {
+        "bin/clang": "clang",
+        "bin/opt": "opt",
+        "lib/libLLVM.so": "llvm",
+        "lib/riscv64-unknown-linux-gnu/libc++.so": "libc++",
+    }.items():
+        path = installDir / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(content)
+    (installDir / "bin" / "clang++").symlink_to("clang")
+    return installDir
+
+
+def _package(root: Path, installDir: Path) -> Path:
+    manifestDir = root / "checksums"
+    manifestDir.mkdir(exist_ok=True)
+    writeChecksumManifest(installDir, manifestDir / CHECKSUM_MANIFEST_NAME)
+    packagePath = root / "clang.tar.xz"
+    packagePath.unlink(missing_ok=True)
+    subprocess.check_call(
+        _packageCommand(
+            installDir, packagePath, sorted(os.listdir(installDir)), manifestDir
+        )
+    )
+    return packagePath
+
+
+class ArtifactUnpackerTestCase(TestCase):
+    def setUp(self) -> None:
+        if shutil.which("tar") is None or shutil.which("xz") is None:
+            self.skipTest("tar or xz not found")
+
+    def test_selective_unpack(self) -> None:
+        with tempfile.TemporaryDirectory() as tmpDir:
+            root = Path(tmpDir)
+            packagePath = _package(root, _installTree(root))
+            self.assertEqual(detectCodec(packagePath), "xz")
+            destDir = root / "prebuilt"
+            unpacker = ArtifactUnpacker(
+                destDir,
+                include=["bin/clang*", "lib/riscv64-*"],
+                exclude=["*.a"],
+            )
+            stats = unpacker.unpack(packagePath)
+            self.assertEqual((stats.written, stats.verified), (3, 2))
+            self.assertEqual((destDir / "bin" / "clang").read_text(), "clang")
+            self.assertEqual(os.readlink(destDir / "bin" / "clang++"), "clang")
+            self.assertTrue(
+                (destDir / "lib/riscv64-unknown-linux-gnu/libc++.so").is_file()
+            )
+            self.assertFalse((destDir / "bin" / "opt").exists())
+            self.assertFalse((destDir / "lib" / "libLLVM.so").exists())
+            self.assertFalse((destDir / CHECKSUM_MANIFEST_NAME).exists())
+
+            # Files in place are not written again
+            mtime = (destDir / "bin" / "clang").stat().st_mtime_ns
+            os.utime(
+                destDir / "bin" / "clang", ns=(mtime + 10**9, mtime + 10**9)
+            )
+            stats = unpacker.unpack(packagePath)
+            self.assertEqual((stats.unchanged, stats.verified), (2, 0))
+            self.assertEqual(
+                (destDir / "bin" / "clang").stat().st_mtime_ns, mtime + 10**9
+            )
+
+    def test_checksum_mismatch(self) -> None:
+        with tempfile.TemporaryDirectory() as tmpDir:
+            root = Path(tmpDir)
+            installDir = _installTree(root)
+            packagePath = _package(root, installDir)
+            # Recorded checksums no longer match the packed opt
+            (installDir / "bin" / "opt").write_text("changed")
+            subprocess.check_call(
+                _packageCommand(
+                    installDir,
+                    root / "stale.tar.xz",
+                    sorted(os.listdir(installDir)),
+                    root / "checksums",
+                )
+            )
+            destDir = root / "prebuilt"
+            (destDir / "bin").mkdir(parents=True)
+            (destDir / "bin" / "opt").write_text("installed")
+            with self.assertRaisesRegex(RuntimeError, "bin/opt"):
+                ArtifactUnpacker(destDir).unpack(root / "stale.tar.xz")
+            # A file that fails verification does not replace the one there
+            self.assertEqual((destDir / "bin" / "opt").read_text(), "installed")
+            self.assertEqual(list((destDir / "bin").glob(".opt.*")), [])
+            stats = ArtifactUnpacker(destDir, verify=False).unpack(
+                root / "stale.tar.xz"
+            )
+            self.assertEqual(stats.verified, 0)
+            self.assertEqual((destDir / "bin" / "opt").read_text(), "changed")
+            self.assertTrue(packagePath.is_file())
+
+    def test_plain_tar_without_manifest(self) -> None:
+        with tempfile.TemporaryDirectory() as tmpDir:
+            root = Path(tmpDir)
+            installDir = _installTree(root)
+            with tarfile.open(root / "plain.tar", "w") as tar:
+                tar.add(installDir, arcname="clang-riscv64")
+            destDir = root / "prebuilt"
+            stats = ArtifactUnpacker(destDir, stripComponents=1).unpack(
+                root / "plain.tar"
+            )
+            self.assertIsNone(detectCodec(root / "plain.tar"))
+            self.assertEqual((stats.written, stats.verified), (5, 0))
+            self.assertEqual((destDir / "bin" / "opt").read_text(), "opt")
@@ -0,0 +1,116 @@
+import os
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+
+from llvm_build.builders.build_dirs import (
+    BuildDirRegistry,
+    diskUsage,
+    parseSize,
+)
+
+
+def _makeBuildDir(path: Path, objectSize: int) -> None:
+    (path / "CMakeFiles").mkdir(parents=True)
+    (path / "CMakeCache.txt").write_text("CMAKE_BUILD_TYPE:STRING=Release\n")
+    (path / "CMakeFiles" / "foo.o").write_bytes(os.urandom(objectSize))
+    (path / "bin").mkdir()
+    (path / "bin" / "foo").write_bytes(os.urandom(4096))
+
+
+class BuildDirRegistryTestCase(TestCase):
+    def test_parse_size(self) -> None:
+        self.assertEqual(parseSize("300G"), 300 << 30)
+        self.assertEqual(parseSize("1.5k"), 1536)
+        self.assertEqual(parseSize("42"), 42)
+
+    def test_collect_least_recently_used(self) -> None:
+        with tempfile.TemporaryDirectory() as tmpDir:
+            root = Path(tmpDir)
+            registry = BuildDirRegistry(root / "registry.json")
+            old, pinned, recent = (root / n for n in ("old", "pinned", "new"))
+            for path in (old, pinned, recent):
+                _makeBuildDir(path, 1 << 20)
+            # The install tree of old lives inside its build directory
+            (old / "install").mkdir()
+            (old / "install" / "bin").write_text("")
+            registry.use(old, old / "install", pinned=False)
+            registry.use(pinned, None, pinned=True)
+            registry.use(recent, None, pinned=False)
+            registry.measure((old, pinned, recent))
+            total = sum(diskUsage(path) for path in (old, pinned, recent))
+
+            # Dropping the object files of the oldest directory is enough
+            registry.collect(total - (1 << 19))
+            self.assertFalse((old / "CMakeFiles" / "foo.o").exists())
+            self.assertTrue((old / "bin" / "foo").exists())
+            self.assertTrue((recent / "CMakeFiles" / "foo.o").exists())
+
+            # The pinned directory and the one in use are never touched
+            acted = registry.collect(0, keep=[recent])
+            self.assertIn(str(old), acted)
+            self.assertFalse((old / "CMakeCache.txt").exists())
+            self.assertTrue((old / "install" / "bin").exists())
+            self.assertTrue((pinned / "CMakeFiles" / "foo.o").exists())
+            self.assertTrue((recent / "CMakeFiles" / "foo.o").exists())
+            self.assertEqual(
+                [path for path, _ in registry.report()],
+                [str(recent), str(pinned)],
+            )
+
+    def test_collect_counts_kept_install_tree(self) -> None:
+        with tempfile.TemporaryDirectory() as tmpDir:
+            root = Path(tmpDir)
+            registry = BuildDirRegistry(root / "registry.json")
+            first, second, recent = (root / n for n in ("a", "b", "new"))
+            for path in (first, second, recent):
+                _makeBuildDir(path, 1 << 20)
+            (first / "install").mkdir()
+            (first / "install" / "libLLVM.so").write_bytes(os.urandom(1 << 21))
+            registry.use(first, first / "install", pinned=False)
+            registry.use(second, None, pinned=False)
+            registry.use(recent, None, pinned=False)
+            registry.measure((first, second, recent))
+            usage = {path: diskUsage(path) for path in (first, second, recent)}
+            objects = {
+                path: diskUsage(path / "CMakeFiles") for path in (first, second)
+            }
+            # Met by removing the first directory if its install tree went
+            # with it, but that stays
+            budget = (
+                sum(usage.values())
+                - sum(objects.values())
+                - (usage[first] - objects[first])
+            )
+            acted = registry.collect(budget, keep=[recent])
+            self.assertTrue((first / "install" / "libLLVM.so").exists())
+            self.assertFalse((second / "CMakeCache.txt").exists())
+            self.assertIn(str(second), acted)
+
+    def test_dry_run_counts_trimming(self) -> None:
+        with tempfile.TemporaryDirectory() as tmpDir:
+            root = Path(tmpDir)
+            registry = BuildDirRegistry(root / "registry.json")
+            old, recent = root / "old", root / "new"
+            for path in (old, recent):
+                _makeBuildDir(path, 1 << 20)
+                registry.use(path, None, pinned=False)
+            registry.measure((old, recent))
+            total = diskUsage(old) + diskUsage(recent)
+
+            # Trimming the oldest directory would be enough, so nothing is
+            # reported as removed
+            acted = registry.collect(total - (1 << 19), dryRun=True)
+            self.assertEqual(acted, [str(old)])
+            self.assertTrue((old / "CMakeFiles" / "foo.o").exists())
+            self.assertFalse(
+                any(entry.trimmed for _, entry in registry.report())
+            )
+
+            # Removing the trimmed oldest directory would not be enough, as
+            # its trimmed bytes are not counted twice
+            acted = registry.collect(diskUsage(recent) - (3 << 19), dryRun=True)
+            self.assertEqual(
+                acted, [str(old), str(recent), str(old), str(recent)]
+            )
+            self.assertTrue((old / "CMakeCache.txt").exists())
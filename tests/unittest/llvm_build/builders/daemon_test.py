@@ -0,0 +1,47 @@
+import io
+import tempfile
+import threading
+from pathlib import Path
+from unittest import TestCase, mock
+
+from llvm_build.builders.daemon import BuildDaemon, request
+
+
+class BuildDaemonTestCase(TestCase):
+    def test_queue_and_stream(self) -> None:
+        with tempfile.TemporaryDirectory() as tmpDir:
+            socketPath = Path(tmpDir) / "daemon.sock"
+            daemon = BuildDaemon(socketPath, jobs=4)
+            server = threading.Thread(target=daemon.serve)
+            with mock.patch("sys.stdout", io.StringIO()):
+                server.start()
+                while not socketPath.exists():
+                    threading.Event().wait(0.01)
+                status = request(socketPath, {"command": "status"})
+                self.assertEqual(status[0]["jobs"], 4)
+                self.assertEqual(status[0]["queued"], [])
+                events = request(
+                    socketPath,
+                    {
+                        "command": "build",
+                        "args": ["--config", str(Path(tmpDir) / "none.yaml")],
+                    },
+                )
+                self.assertEqual(
+                    [e["event"] for e in events if e["event"] != "log"],
+                    ["queued", "started", "failed"],
+                )
+                request(socketPath, {"command": "shutdown"})
+                server.join(5)
+            self.assertFalse(server.is_alive())
+            self.assertFalse(socketPath.exists())
+
+    def test_requested_jobs_are_kept(self) -> None:
+        daemon = BuildDaemon(Path("unused.sock"), jobs=8, workers=2)
+        for args, expected in (
+            (["--config", "a.yaml"], ["--config", "a.yaml", "--jobs", "4"]),
+            (["--jobs", "2"], ["--jobs", "2"]),
+            (["--jobs=2"], ["--jobs=2"]),
+        ):
+            buildRequest = daemon.submit(args, 0, mock.Mock())
+            self.assertEqual(buildRequest.args, expected)
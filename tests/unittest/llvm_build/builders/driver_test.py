@@ -0,0 +1,179 @@
+import io
+import json
+import os
+import tempfile
+from pathlib import Path
+from unittest import TestCase, mock
+
+from project_fixtures import cmakeProjectConfig, fakeCMake, fakeLlvmToolchain
+
+from llvm_build.builders.config import ProjectConfig
+from llvm_build.builders.driver import (
+    _assembleCMakeBuilder,
+    _expandMatrix,
+    runBuild,
+)
+
+_config = {
+    "name": "test-suite",
+    "srcDir": "/src",
+    "buildDir": "/build",
+    "buildTool": {"name": "cmake"},
+    "toolchain": {"name": "llvm"},
+    "compilerOption": {"cflags": ["-O3"]},
+    "matrix": {
+        "isel": {
+            "sdag": {"compilerOption": {"cflags": ["-fno-global-isel"]}},
+            "gisel": {"compilerOption": {"cflags": ["-fglobal-isel"]}},
+        },
+        "march": {
+            "rv64gc": {"compilerOption": {"cflags": ["-march=rv64gc"]}},
+            "rv64gcv": {"compilerOption": {"cflags": ["-march=rv64gcv"]}},
+        },
+    },
+}
+
+
+class MatrixTestCase(TestCase):
+    def test_expand(self) -> None:
+        variants = _expandMatrix(_config)
+        self.assertEqual(
+            list(variants),
+            ["sdag-rv64gc", "sdag-rv64gcv", "gisel-rv64gc", "gisel-rv64gcv"],
+        )
+        config = ProjectConfig(**variants["gisel-rv64gcv"])
+        self.assertEqual(config.buildDir, Path("/build/gisel-rv64gcv"))
+        self.assertIsNone(config.matrix)
+        assert config.compilerOption is not None
+        self.assertEqual(
+            config.compilerOption.cflags,
+            ["-O3", "-fglobal-isel", "-march=rv64gcv"],
+        )
+        # The base config is left untouched
+        self.assertEqual(_config["compilerOption"], {"cflags": ["-O3"]})
+
+    def test_no_matrix(self) -> None:
+        config = {k: v for k, v in _config.items() if k != "matrix"}
+        self.assertEqual(_expandMatrix(config), {"": config})
+
+
+class DistributionTestCase(TestCase):
+    def test_distribution_targets(self) -> None:
+        with tempfile.TemporaryDirectory() as tmpDir:
+            root = Path(tmpDir)
+            (root / "src").mkdir()
+            toolchain = fakeLlvmToolchain(root / "llvm")
+            cmake, log = fakeCMake(root)
+            config = cmakeProjectConfig(
+                root,
+                buildTool={
+                    "name": "cmake",
+                    "distributionComponents": ["clang", "lld", "llvm-ar"],
+                },
+            )
+            builder = _assembleCMakeBuilder(config, toolchain, None)
+            builder.setCustomCMakePath(cmake)
+            builder.configure()
+            builder.build()
+            builder.install()
+            configure, build, install = log.read_text().splitlines()
+            self.assertIn(
+                f"-DCMAKE_INSTALL_PREFIX={root / 'install'}", configure
+            )
+            self.assertIn(
+                "-DLLVM_DISTRIBUTION_COMPONENTS=clang;lld;llvm-ar", configure
+            )
+            self.assertTrue(build.endswith("--target distribution"))
+            self.assertTrue(install.endswith("--target install-distribution"))
+
+    def test_initial_cache(self) -> None:
+        with tempfile.TemporaryDirectory() as tmpDir:
+            root = Path(tmpDir)
+            toolchain = fakeLlvmToolchain(root / "llvm")
+            initialCache = root / "caches" / "Release.cmake"
+            initialCache.parent.mkdir()
+            initialCache.touch()
+            config = cmakeProjectConfig(
+                root,
+                buildTool={
+                    "name": "cmake",
+                    "customConfigureOptions": {
+                        "initialCache": str(initialCache),
+                        "LLVM_ENABLE_ASSERTIONS": "ON",
+                    },
+                },
+            )
+            # Builders of the same config, e.g. by a daemon, read it alike
+            for _ in range(2):
+                configure = _assembleCMakeBuilder(
+                    config, toolchain, None
+                ).commands()["configure"]
+                self.assertEqual(
+                    configure[configure.index("-C") + 1], str(initialCache)
+                )
+                self.assertIn("-DLLVM_ENABLE_ASSERTIONS=ON", configure)
+                self.assertFalse(
+                    any(arg.startswith("-DinitialCache") for arg in configure)
+                )
+
+
+class RunBuildTestCase(TestCase):
+    def _run(self, root: Path, *args: str) -> str:
+        fakeLlvmToolchain(root / "llvm")
+        fakeCMake(root)
+        (root / "src").mkdir(exist_ok=True)
+        configPath = root / "llvm.yaml"
+        configPath.write_text(
+            f"name: llvm\nsrcDir: {root / 'src'}\nbuildDir: {root / 'build'}\n"
+            "buildTool:\n  name: cmake\ntoolchain:\n  name: llvm\n"
+        )
+        # Build tools write to the buffer of stdout
+        output = io.BytesIO()
+        stdout = io.TextIOWrapper(output)
+        with (
+            mock.patch.dict(
+                os.environ,
+                {
+                    "PATH": f"{root}{os.pathsep}{os.environ['PATH']}",
+                    "XDG_CACHE_HOME": str(root / "cache"),
+                    "LLVM_BUILD_NO_CONFIG_CACHE": "1",
+                },
+            ),
+            mock.patch("sys.stdout", stdout),
+        ):
+            runBuild(
+                [
+                    "--config",
+                    str(configPath),
+                    "--toolchain-install-dir",
+                    str(root / "llvm"),
+                    "--no-install",
+                    *args,
+                ]
+            )
+        stdout.flush()
+        return output.getvalue().decode()
+
+    def test_build(self) -> None:
+        with tempfile.TemporaryDirectory() as tmpDir:
+            root = Path(tmpDir)
+            self._run(root)
+            configure, build = (root / "cmake.log").read_text().splitlines()
+            self.assertIn(f"-B {root / 'build'}", configure)
+            self.assertTrue(build.startswith(f"--build {root / 'build'}"))
+
+    def test_plan(self) -> None:
+        with tempfile.TemporaryDirectory() as tmpDir:
+            root = Path(tmpDir)
+            history = root / "ninja_log"
+            history.write_text("# ninja log v5\n0\t3000\t1\tbin/opt\t1a\n")
+            plan = json.loads(
+                self._run(root, "--plan", "--plan-history", str(history))
+            )
+            commands = plan["variants"][""]["commands"]
+            self.assertIn(str(root / "build"), commands["configure"])
+            self.assertIsNone(commands["install"])
+            self.assertEqual(plan["wallSeconds"], 3.0)
+            # Nothing ran
+            self.assertFalse((root / "cmake.log").exists())
+            self.assertFalse((root / "build").exists())
@@ -0,0 +1,109 @@
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+
+from llvm_build.builders.impact import (
+    BuildGraph,
+    ImpactAnalyzer,
+    OutputKind,
+    main,
+    parseDeps,
+    parseGraph,
+    parseNinjaLog,
+)
+
+# Trimmed output of `ninja -t graph` for a static library, a shared library
+# and an executable linking both
+_graph = """digraph ninja {
+"0x10" [label="all"]
+"0x11" [label="phony", shape=ellipse]
+"0x11" -> "0x10"
+"0x20" -> "0x11" [arrowhead=none]
+"0x40" -> "0x11" [arrowhead=none]
+"0x20" [label="liba.a"]
+"0x21" -> "0x20" [label=" CXX_STATIC_LIBRARY_LINKER__a_"]
+"0x21" [label="CMakeFiles/a.dir/a.cpp.o"]
+"0x22" [label="CXX_COMPILER__a_", shape=ellipse]
+"0x22" -> "0x21"
+"0x23" -> "0x22" [arrowhead=none]
+"0x24" -> "0x22" [arrowhead=none style=dotted]
+"0x23" [label="/src/a.cpp"]
+"0x24" [label="cmake_object_order_depends_target_a"]
+"0x30" [label="libb.so"]
+"0x31" -> "0x30" [label=" CXX_SHARED_LIBRARY_LINKER__b_"]
+"0x31" [label="CMakeFiles/b.dir/b.cpp.o"]
+"0x32" [label="CXX_COMPILER__b_", shape=ellipse]
+"0x32" -> "0x31"
+"0x33" -> "0x32" [arrowhead=none]
+"0x33" [label="/src/b.cpp"]
+"0x40" [label="app"]
+"0x41" [label="CXX_EXECUTABLE_LINKER__app_", shape=ellipse]
+"0x41" -> "0x40"
+"0x42" -> "0x41" [arrowhead=none]
+"0x20" -> "0x41" [arrowhead=none]
+"0x30" -> "0x41" [arrowhead=none]
+"0x42" [label="CMakeFiles/app.dir/main.cpp.o"]
+"0x43" [label="CXX_COMPILER__app_", shape=ellipse]
+"0x43" -> "0x42"
+"0x44" -> "0x43" [arrowhead=none]
+"0x44" [label="/src/main.cpp"]
+}
+"""
+
+_deps = """CMakeFiles/a.dir/a.cpp.o: #deps 2, deps mtime 1 (VALID)
+    /src/a.cpp
+    /src/a.h
+
+CMakeFiles/app.dir/main.cpp.o: #deps 2, deps mtime 1 (VALID)
+    /src/main.cpp
+    /src/a.h
+"""
+
+_log = """# ninja log v7
+0\t10000\t1\tCMakeFiles/a.dir/a.cpp.o\t0
+0\t30000\t1\tCMakeFiles/app.dir/main.cpp.o\t0
+10000\t11000\t1\tliba.a\t0
+30000\t32000\t1\tapp\t0
+"""
+
+
+class ImpactAnalyzerTestCase(TestCase):
+    def setUp(self) -> None:
+        buildDir = Path("/build")
+        graph = BuildGraph()
+        parseGraph(_graph, buildDir, graph)
+        parseDeps(_deps, buildDir, graph)
+        self.analyzer = ImpactAnalyzer(
+            buildDir, graph, parseNinjaLog(_log, buildDir)
+        )
+
+    def test_header_change(self) -> None:
+        report = self.analyzer.analyze([Path("/src/a.h")])
+        self.assertEqual(
+            report.affected[OutputKind.OBJECT],
+            ["CMakeFiles/a.dir/a.cpp.o", "CMakeFiles/app.dir/main.cpp.o"],
+        )
+        self.assertEqual(report.affected[OutputKind.LIBRARY], ["liba.a"])
+        # liba.a is linked into app, so building app covers everything
+        self.assertEqual(report.targets, ["app"])
+        self.assertEqual(report.serialSeconds, 43.0)
+        # main.cpp.o is compiled alongside a.cpp.o and liba.a
+        self.assertEqual(report.criticalPathSeconds, 32.0)
+        self.assertFalse(report.reconfigure)
+
+    def test_unlogged_output(self) -> None:
+        report = self.analyzer.analyze([Path("/src/b.cpp")])
+        self.assertEqual(report.targets, ["app"])
+        # b.cpp.o and libb.so have no history
+        self.assertEqual(report.estimated, 2)
+        self.assertEqual(
+            self.analyzer.analyze([Path("/src/unrelated.cpp")]).targets, []
+        )
+
+    def test_build_without_source_dir(self) -> None:
+        # No CMakeCache.txt to read the source directory from
+        with (
+            tempfile.TemporaryDirectory() as tmpDir,
+            self.assertRaises(RuntimeError),
+        ):
+            main(["--build-dir", tmpDir, "--files", "a.cpp", "--build"])
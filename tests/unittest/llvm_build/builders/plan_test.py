@@ -0,0 +1,91 @@
+import os
+import shutil
+import subprocess
+import tempfile
+from argparse import Namespace
+from pathlib import Path
+from unittest import TestCase
+
+from project_fixtures import cmakeProjectConfig, fakeLlvmToolchain
+
+from llvm_build.builders.driver import _planProject
+from llvm_build.builders.plan import parseDryRun, predictBuild
+
+_dryRun = """ninja: Entering directory `build'
+ninja explain: output a.o doesn't exist
+ninja explain: a.o is dirty
+[1/2] Building CXX object a.o
+[2/2] Linking CXX executable app
+"""
+
+# app and app.map come from one edge
+_log = """# ninja log v5
+0\t4000\t1\ta.o\t1a
+0\t2000\t1\tb.o\t2b
+4000\t10000\t1\tapp\t3c
+4000\t10000\t1\tapp.map\t3c
+"""
+
+_buildNinja = """rule touch
+  command = touch $out
+build a.o: touch a.cpp
+build b.o: touch b.cpp
+build app: touch a.o b.o
+"""
+
+
+class BuildPlanTestCase(TestCase):
+    def test_parse_dry_run(self) -> None:
+        self.assertEqual(parseDryRun(_dryRun), (2, ["a.o"]))
+
+    def test_fresh_build_dir_from_history(self) -> None:
+        with tempfile.TemporaryDirectory() as tmpDir:
+            history = Path(tmpDir) / "ninja_log"
+            history.write_text(_log)
+            prediction = predictBuild(Path(tmpDir) / "build", 2, (), history)
+            self.assertEqual(prediction.edges, 3)
+            self.assertEqual(prediction.cpuSeconds, 12.0)
+            # Linking app alone takes longer than the work split in two
+            self.assertEqual(prediction.wallSeconds, 6.0)
+            self.assertIsNone(
+                predictBuild(Path(tmpDir) / "build", 2).source,
+            )
+
+    def test_configured_build_dir(self) -> None:
+        ninja = shutil.which("ninja")
+        if ninja is None:
+            self.skipTest("ninja not found")
+        with tempfile.TemporaryDirectory() as tmpDir:
+            buildDir = Path(tmpDir)
+            (buildDir / "build.ninja").write_text(_buildNinja)
+            for source in ("a.cpp", "b.cpp"):
+                (buildDir / source).touch()
+            subprocess.run([ninja, "-C", tmpDir], check=True)
+            os.utime(buildDir / "a.cpp", ns=(1 << 62, 1 << 62))
+            prediction = predictBuild(buildDir, 1)
+            self.assertEqual(prediction.source, "ninja -n")
+            # b.o is up to date, a.o and app are rebuilt
+            self.assertEqual(prediction.edges, 2)
+            self.assertEqual(prediction.estimated, 0)
+            # The build graph index is not cached by a prediction
+            self.assertFalse((buildDir / ".llvm-build-impact.pickle").exists())
+
+    def test_plan_commands(self) -> None:
+        with tempfile.TemporaryDirectory() as tmpDir:
+            root = Path(tmpDir)
+            toolchain = fakeLlvmToolchain(root / "llvm")
+            config = cmakeProjectConfig(
+                root, packagePathPrefix=root / "llvm-riscv64"
+            )
+            args = Namespace(no_install=False, package=True, plan_history=None)
+            plan = _planProject(config, 4, toolchain, args)
+            self.assertIn("--parallel", plan["commands"]["build"])
+            packageCommand = plan["commands"]["package"]
+            self.assertEqual(
+                packageCommand[packageCommand.index("-f") + 1],
+                f"{root / 'llvm-riscv64'}.tar.xz",
+            )
+            self.assertEqual(packageCommand[-1], ".")
+            self.assertIsNone(plan["package"]["bytes"])
+            # Nothing was created
+            self.assertFalse((root / "build").exists())
@@ -0,0 +1,39 @@
+from pathlib import Path
+from typing import Any
+
+from llvm_build.builders.config import ProjectConfig
+from llvm_build.toolchain.llvm import LlvmToolchain
+
+
+def fakeLlvmToolchain(installDir: Path) -> LlvmToolchain:
+    """An LLVM toolchain of empty files, enough to assemble builders"""
+    (installDir / "bin").mkdir(parents=True, exist_ok=True)
+    for tool in ("clang", "clang++", "ld.lld", "llvm-strip"):
+        (installDir / "bin" / tool).touch()
+    return LlvmToolchain(installDir)
+
+
+def fakeCMake(root: Path) -> tuple[Path, Path]:
+    """A cmake script appending its arguments to a log, one line per run,
+    and the log"""
+    log = root / "cmake.log"
+    cmake = root / "cmake"
+    cmake.write_text(f'#!/bin/sh\necho "$@" >> {log}\n')
+    cmake.chmod(0o755)
+    return cmake, log
+
+
+def cmakeProjectConfig(root: Path, **fields: Any) -> ProjectConfig:
+    """An LLVM project built with CMake in root; fields replace the
+    defaults"""
+    return ProjectConfig.model_validate(
+        {
+            "name": "llvm",
+            "srcDir": root / "src",
+            "buildDir": root / "build",
+            "installDir": root / "install",
+            "buildTool": {"name": "cmake"},
+            "toolchain": {"name": "llvm"},
+            **fields,
+        }
+    )
@@ -0,0 +1,174 @@
+import json
+import subprocess
+import tempfile
+import threading
+import time
+from pathlib import Path
+from unittest import TestCase
+
+from llvm_build.builders.config import ProjectConfig
+from llvm_build.builders.driver import _assembleRuntimeBuilders, _planRuntimes
+from llvm_build.builders.runtimes import RuntimesStage
+from llvm_build.common.base_builders import AbstractBuilder
+
+_fakeClang = """#!/bin/sh
+echo {root}/install/lib/clang/20
+"""
+
+
+class _FakeBuilder(AbstractBuilder):
+    _failingStep: str | None
+    _installs: list[int]
+    _lock: threading.Lock
+
+    def __init__(
+        self,
+        failingStep: str | None,
+        installs: list[int],
+        lock: threading.Lock,
+    ) -> None:
+        super().__init__()
+        self._failingStep = failingStep
+        self._installs = installs
+        self._lock = lock
+
+    def _step(self, step: str) -> None:
+        if step == self._failingStep:
+            raise subprocess.CalledProcessError(1, [step])
+
+    def configure(self) -> None:
+        self._step("configure")
+
+    def build(self) -> None:
+        self._step("build")
+
+    def install(self) -> None:
+        with self._lock:
+            self._installs.append(1)
+            running = len(self._installs)
+        time.sleep(0.05)
+        with self._lock:
+            self._installs.pop()
+        self._step("install")
+        if running > 1:
+            raise RuntimeError("installations overlap")
+
+
+class RuntimesStageTestCase(TestCase):
+    def test_failing_triple_does_not_stop_others(self) -> None:
+        installs: list[int] = []
+        lock = threading.Lock()
+        with tempfile.TemporaryDirectory() as tmpDir:
+            reportPath = Path(tmpDir) / "runtimes-report.json"
+            stage = RuntimesStage(
+                {
+                    "x86_64-unknown-linux-gnu": _FakeBuilder(
+                        None, installs, lock
+                    ),
+                    "riscv64-unknown-linux-gnu": _FakeBuilder(
+                        "build", installs, lock
+                    ),
+                    "aarch64-unknown-linux-gnu": _FakeBuilder(
+                        None, installs, lock
+                    ),
+                },
+                reportPath,
+            )
+            with self.assertRaisesRegex(RuntimeError, "riscv64"):
+                stage.run()
+            report = json.loads(reportPath.read_text())
+            self.assertIsNone(report["x86_64-unknown-linux-gnu"]["error"])
+            self.assertEqual(
+                sorted(report["aarch64-unknown-linux-gnu"]["seconds"]),
+                ["build", "configure", "install"],
+            )
+            self.assertTrue(
+                report["riscv64-unknown-linux-gnu"]["error"].startswith(
+                    "build: "
+                )
+            )
+
+    def test_builder_per_triple(self) -> None:
+        with tempfile.TemporaryDirectory() as tmpDir:
+            root = Path(tmpDir)
+            (root / "install" / "bin").mkdir(parents=True)
+            clang = root / "install" / "bin" / "clang"
+            clang.write_text(_fakeClang.format(root=root))
+            clang.chmod(0o755)
+            for tool in ("clang++", "ld.lld", "llvm-strip"):
+                (root / "install" / "bin" / tool).touch()
+            config = ProjectConfig.model_validate(
+                {
+                    "name": "llvm",
+                    "srcDir": root / "llvm-project" / "llvm",
+                    "buildDir": root / "build",
+                    "installDir": root / "install",
+                    "buildTool": {"name": "cmake"},
+                    "toolchain": {"name": "llvm"},
+                    "runtimes": {
+                        "runtimes": ["compiler-rt", "libunwind"],
+                        "customConfigureOptions": {
+                            "CMAKE_BUILD_TYPE": "MinSizeRel"
+                        },
+                        "targets": [
+                            {"triple": "x86_64-unknown-linux-gnu"},
+                            {
+                                "triple": "riscv64-unknown-linux-gnu",
+                                "sysroot": root / "sysroot",
+                                "compilerOption": {"cflags": ["-march=rv64gc"]},
+                                "customConfigureOptions": {
+                                    "CMAKE_BUILD_TYPE": "Release"
+                                },
+                            },
+                        ],
+                    },
+                }
+            )
+            assert config.runtimes is not None
+            commands = {
+                triple: builder.commands()
+                for triple, builder in _assembleRuntimeBuilders(
+                    config, config.runtimes, 8
+                ).items()
+            }
+            riscv = commands["riscv64-unknown-linux-gnu"]["configure"]
+            self.assertEqual(
+                riscv[riscv.index("-S") + 1],
+                str(root / "llvm-project" / "runtimes"),
+            )
+            self.assertEqual(
+                riscv[riscv.index("-B") + 1],
+                str(root / "build-runtimes" / "riscv64-unknown-linux-gnu"),
+            )
+            for define in (
+                "-DCMAKE_BUILD_TYPE=Release",
+                f"-DCMAKE_SYSROOT={root / 'sysroot'}",
+                "-DCMAKE_C_FLAGS=-march=rv64gc",
+                "-DCMAKE_SYSTEM_PROCESSOR=riscv64",
+                "-DCOMPILER_RT_INSTALL_PATH=lib/clang/20",
+                "-DLLVM_ENABLE_RUNTIMES=compiler-rt;libunwind",
+            ):
+                self.assertIn(define, riscv)
+            x86 = commands["x86_64-unknown-linux-gnu"]
+            self.assertIn("-DCMAKE_BUILD_TYPE=MinSizeRel", x86["configure"])
+            # The jobs are split between the triples
+            self.assertEqual(
+                x86["build"][x86["build"].index("--parallel") + 1], "4"
+            )
+            self.assertIn(str(root / "install"), x86["install"])
+
+            plans = _planRuntimes(config, config.runtimes, 8)
+            riscvPlan = plans["riscv64-unknown-linux-gnu"]
+            assert riscvPlan is not None
+            self.assertEqual(
+                riscvPlan["commands"],
+                commands["riscv64-unknown-linux-gnu"],
+            )
+            self.assertIsNone(riscvPlan["prediction"]["source"])
+            self.assertFalse((root / "build-runtimes").exists())
+            # Nothing is planned before the compiler is installed
+            clang.unlink()
+            self.assertEqual(
+                _planRuntimes(config, config.runtimes, 8),
+                dict.fromkeys(commands),
+            )
@@ -0,0 +1,77 @@
+import os
+import subprocess
+import sys
+import tempfile
+from argparse import Namespace
+from pathlib import Path
+from unittest import TestCase, mock
+
+from llvm_build.builders import driver
+
+_projectsDir = Path(__file__).parents[4] / "projects"
+# Modules that must stay out of the driver's import path; they are only
+# needed to validate a config that is not in the config cache
+_heavyModules = ("pydantic", "pydantic_core", "yaml", "numpy")
+
+
+def _importTimes(module: str) -> dict[str, int]:
+    """Cumulative import time in microseconds of every module imported by
+    `module`, from `python -X importtime`"""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        env={**os.environ, "PYTHONPATH": os.pathsep.join(sys.path)},
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times: dict[str, int] = dict()
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative)
+    return times
+
+
+class StartupTestCase(TestCase):
+    def test_driver_import_is_light(self) -> None:
+        times = _importTimes("llvm_build.builders.driver")
+        self.assertIn("llvm_build.builders.driver", times)
+        for module in _heavyModules:
+            self.assertNotIn(module, times)
+
+    def test_config_cache(self) -> None:
+        args = Namespace(
+            src_dir=None,
+            build_dir=None,
+            install_dir=None,
+            toolchain_install_dir=None,
+            revision=None,
+            offline=False,
+        )
+        configPath = _projectsDir / "llvm-test-suite-O3.yaml"
+        with (
+            tempfile.TemporaryDirectory() as tmpDir,
+            mock.patch.dict(os.environ, {"XDG_CACHE_HOME": tmpDir}),
+        ):
+            os.environ.pop("LLVM_BUILD_NO_CONFIG_CACHE", None)
+            first = driver._loadProjectConfigs(configPath, args)
+            cached = list((Path(tmpDir) / "llvm-build" / "configs").iterdir())
+            self.assertEqual(len(cached), 1)
+            with mock.patch.object(
+                driver, "_validateProjectConfigs"
+            ) as validate:
+                second = driver._loadProjectConfigs(configPath, args)
+                validate.assert_not_called()
+            self.assertEqual(first, second)
+            # A different override is a different cache entry
+            args.build_dir = Path(tmpDir) / "build"
+            driver._loadProjectConfigs(configPath, args)
+            self.assertEqual(len(list(cached[0].parent.iterdir())), 2)
+            # An entry that no longer unpickles is validated again
+            args.build_dir = None
+            cached[0].write_bytes(b"cllvm_build.removed\nProjectConfig\n.")
+            self.assertEqual(
+                driver._loadProjectConfigs(configPath, args), first
+            )
@@ -0,0 +1,109 @@
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+
+from llvm_build.builders.impact import BuildGraph
+from llvm_build.builders.test_selection import (
+    ChangeTestSelector,
+    runLineTools,
+)
+
+_test = """; RUN: llc -mtriple=riscv64 < %s \\
+; RUN:   | FileCheck %s
+; RUN: not %clang_cc1 -verify %s 2>&1 | count 0
+; RUN: env FOO=1 opt -passes=instcombine %s -S
+; CHECK: add
+"""
+
+
+def _makeTree(root: Path, files: dict[str, str]) -> None:
+    for name, content in files.items():
+        (root / name).parent.mkdir(parents=True, exist_ok=True)
+        (root / name).write_text(content)
+
+
+class ChangeTestSelectorTestCase(TestCase):
+    def test_run_line_tools(self) -> None:
+        self.assertEqual(
+            runLineTools(_test),
+            {"llc", "FileCheck", "clang", "count", "opt"},
+        )
+
+    def test_static_rules(self) -> None:
+        with tempfile.TemporaryDirectory() as tmpDir:
+            root = Path(tmpDir).resolve()
+            _makeTree(
+                root,
+                {
+                    "llvm/test/CodeGen/RISCV/add.ll": _test,
+                    "llvm/test/MC/RISCV/add.s": "# RUN: llvm-mc %s\n",
+                    "llvm/test/Transforms/InstCombine/a.ll": _test,
+                    "llvm/test/Transforms/InstCombine/lit.local.cfg": "",
+                },
+            )
+            selector = ChangeTestSelector(
+                root,
+                [
+                    root / "llvm/lib/Target/RISCV/RISCVISelLowering.cpp",
+                    root / "llvm/test/Transforms/InstCombine/lit.local.cfg",
+                    root / "llvm/test/MC/RISCV/add.s",
+                    root / "llvm/lib/Custom/Pass.cpp",
+                ],
+                rules={"llvm/lib/Custom/": ["llvm/test/MC/RISCV/add.s"]},
+            )
+            self.assertEqual(
+                selector.select(root / "build"),
+                [
+                    root / "llvm/test/CodeGen/RISCV",
+                    root / "llvm/test/MC/RISCV",
+                    root / "llvm/test/MC/RISCV/add.s",
+                    root / "llvm/test/Transforms/InstCombine",
+                ],
+            )
+
+    def test_tools_linking_change(self) -> None:
+        with tempfile.TemporaryDirectory() as tmpDir:
+            root = Path(tmpDir).resolve()
+            buildDir = root / "build"
+            buildDir.mkdir()
+            _makeTree(
+                root,
+                {
+                    "llvm/test/CodeGen/RISCV/add.ll": _test,
+                    "llvm/test/MC/RISCV/add.s": "# RUN: llvm-mc %s\n",
+                },
+            )
+            header = str(root / "llvm/include/llvm/CodeGen/ISDOpcodes.h")
+            graph = BuildGraph()
+            graph.addEdge([header], ["a.o"], "CXX_COMPILER__LLVMCodeGen")
+            graph.addEdge(
+                ["a.o"],
+                ["lib/libLLVMCodeGen.a"],
+                "CXX_STATIC_LIBRARY_LINKER__LLVMCodeGen",
+            )
+            graph.addEdge(
+                ["lib/libLLVMCodeGen.a"],
+                ["bin/llc"],
+                "CXX_EXECUTABLE_LINKER__llc",
+            )
+            selector = ChangeTestSelector(root, [Path(header)], graph=graph)
+            self.assertEqual(
+                selector.select(buildDir),
+                [root / "llvm/test/CodeGen/RISCV/add.ll"],
+            )
+            # The RUN lines are indexed in the build directory
+            self.assertTrue(
+                (buildDir / ".llvm-build-test-index.pickle").is_file()
+            )
+
+            # Nothing links an unknown file, unless the full suite runs
+            unknown = [root / "llvm/docs/index.rst"]
+            self.assertEqual(
+                ChangeTestSelector(root, unknown, graph=graph).select(buildDir),
+                [],
+            )
+            self.assertIsNone(
+                ChangeTestSelector(
+                    root, unknown, fallbackToFull=True, graph=graph
+                ).select(buildDir)
+            )
@@ -0,0 +1,99 @@
+import shutil
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+
+from llvm_build.common.base_builders import CMakeBuilder, CMakeGenerator
+from llvm_build.common.check_cache import CheckCache, parseCheckResults
+from llvm_build.common.define_providers import CustomCMakeDefineProvider
+
+_cmakeCache = """//Test C_SUPPORTS_WALL
+C_SUPPORTS_WALL:INTERNAL=1
+CMAKE_C_FLAGS-ADVANCED:INTERNAL=1
+CMAKE_CTEST_COMMAND:INTERNAL=/usr/bin/ctest
+HAVE_NONEXISTENT_H:INTERNAL=
+LLVM_ENABLE_PROJECTS:STRING=clang
+"""
+
+_project = """cmake_minimum_required(VERSION 3.20)
+project(p C)
+include(CheckIncludeFile)
+check_include_file(stdio.h HAVE_STDIO_H)
+check_include_file(nonexistent.h HAVE_NONEXISTENT_H)
+"""
+
+
+class CheckCacheTestCase(TestCase):
+    def test_parse_check_results(self) -> None:
+        self.assertEqual(
+            parseCheckResults(_cmakeCache),
+            {"C_SUPPORTS_WALL": "1", "HAVE_NONEXISTENT_H": ""},
+        )
+
+    def test_key(self) -> None:
+        cache = CheckCache(Path("/nonexistent"))
+        key = cache.key(
+            {"CMAKE_C_FLAGS": "-O2", "LLVM_ENABLE_ASSERTIONS": "ON"}
+        )
+        self.assertEqual(key, cache.key({"CMAKE_C_FLAGS": "-O2"}))
+        self.assertNotEqual(key, cache.key({"CMAKE_C_FLAGS": "-O3"}))
+        for define in (
+            "CMAKE_SYSTEM_NAME",
+            "CMAKE_CROSSCOMPILING",
+            "LLVM_ENABLE_LIBCXX",
+        ):
+            self.assertNotEqual(
+                key, cache.key({"CMAKE_C_FLAGS": "-O2", define: "ON"})
+            )
+
+    def test_key_of_initial_cache(self) -> None:
+        cache = CheckCache(Path("/nonexistent"))
+        with tempfile.TemporaryDirectory() as tmpDir:
+            userCache = Path(tmpDir) / "user.cmake"
+            userCache.write_text('set(CMAKE_C_FLAGS "-O2" CACHE STRING "")\n')
+            key = cache.key(dict(), userCache)
+            self.assertNotEqual(key, cache.key(dict()))
+            userCache.write_text('set(CMAKE_C_FLAGS "-O3" CACHE STRING "")\n')
+            self.assertNotEqual(key, cache.key(dict(), userCache))
+
+    def test_fresh_configure_skips_checks(self) -> None:
+        compiler = shutil.which("cc")
+        if shutil.which("cmake") is None or compiler is None:
+            self.skipTest("cmake or cc not found")
+        with tempfile.TemporaryDirectory() as tmpDir:
+            root = Path(tmpDir)
+            (root / "src").mkdir()
+            (root / "src" / "CMakeLists.txt").write_text(_project)
+            userCache = root / "user.cmake"
+            userCache.write_text('set(USER_OPTION "on" CACHE STRING "")\n')
+            checkCache = CheckCache(root / "checks")
+            defines = CustomCMakeDefineProvider()
+            defines.addDefine("CMAKE_C_COMPILER", compiler)
+
+            def configure(buildDir: Path) -> str:
+                builder = CMakeBuilder(root / "src", buildDir)
+                builder.setGenerator(CMakeGenerator.DDEFAULT)
+                builder.setDefineProvider(defines)
+                builder.setInitialCache(userCache)
+                builder.setCheckCache(checkCache)
+                builder.configure()
+                return (buildDir / "CMakeCache.txt").read_text()
+
+            first = configure(root / "build1")
+            self.assertIn("HAVE_STDIO_H:INTERNAL=1", first)
+            second = configure(root / "build2")
+            self.assertIn("HAVE_STDIO_H:INTERNAL=1", second)
+            self.assertIn("HAVE_NONEXISTENT_H:INTERNAL=\n", second)
+            self.assertIn("USER_OPTION:STRING=on", second)
+            self.assertTrue(
+                (root / "build2" / "llvm-build-initial-cache.cmake").is_file()
+            )
+            # CMake logs the checks it runs; none ran in the second build
+            logs = [
+                root / build / "CMakeFiles" / "CMakeOutput.log"
+                for build in ("build1", "build2")
+            ]
+            self.assertIn("stdio.h", logs[0].read_text())
+            self.assertNotIn(
+                "stdio.h", logs[1].read_text() if logs[1].exists() else ""
+            )
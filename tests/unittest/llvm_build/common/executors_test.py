@@ -0,0 +1,40 @@
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+
+from llvm_build.common.executors import (
+    FakeSSHExecutor,
+    SSHExecutor,
+    parseExecutor,
+)
+from llvm_build.common.process import runSync
+
+
+class ExecutorsTestCase(TestCase):
+    def test_parse(self) -> None:
+        executor = parseExecutor("ssh://user@board#4")
+        self.assertIsInstance(executor, SSHExecutor)
+        self.assertEqual((executor.name, executor.jobs), ("user@board", 4))
+        self.assertEqual(
+            executor.remotePath(Path("/build/x")), Path("/build/x")
+        )
+        # Build directories only work at the paths they were configured at
+        with self.assertRaises(RuntimeError):
+            parseExecutor("ssh://user@board/srv/mirror")
+
+    def test_fetch_files(self) -> None:
+        with tempfile.TemporaryDirectory() as tmpDir:
+            root = Path(tmpDir).resolve()
+            executor = FakeSSHExecutor(root / "board")
+            stat = root / "build" / "foo.perfstat"
+            remoteStat = executor.remotePath(stat)
+            remoteStat.parent.mkdir(parents=True)
+            remoteStat.write_text("1,,instructions:u\n")
+            runSync(
+                executor.fetchFiles([stat, root / "build" / "bar.perfstat"])
+            )
+            self.assertEqual(stat.read_text(), "1,,instructions:u\n")
+            self.assertFalse(remoteStat.exists())
+            self.assertFalse((root / "build" / "bar.perfstat").exists())
+            # Nothing left to fetch
+            runSync(executor.fetchFiles([stat]))
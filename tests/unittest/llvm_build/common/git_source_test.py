@@ -0,0 +1,93 @@
+import os
+import subprocess
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+
+from llvm_build.common.git_source import GitSourceProvider
+from llvm_build.common.llvm import llvmSourceDirs
+
+_gitEnv = {
+    **os.environ,
+    "GIT_AUTHOR_NAME": "test",
+    "GIT_AUTHOR_EMAIL": "test@example.com",
+    "GIT_COMMITTER_NAME": "test",
+    "GIT_COMMITTER_EMAIL": "test@example.com",
+}
+
+
+def _commit(repo: Path, files: dict[str, str]) -> str:
+    for name, content in files.items():
+        path = repo / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(content)
+    subprocess.check_call(["git", "-C", str(repo), "add", "-A"], env=_gitEnv)
+    subprocess.check_call(
+        ["git", "-C", str(repo), "commit", "-q", "-m", "update"], env=_gitEnv
+    )
+    return subprocess.check_output(
+        ["git", "-C", str(repo), "rev-parse", "HEAD"], text=True
+    ).strip()
+
+
+class GitSourceProviderTestCase(TestCase):
+    def test_llvm_source_dirs(self) -> None:
+        self.assertEqual(
+            llvmSourceDirs(
+                {
+                    "LLVM_ENABLE_PROJECTS": "clang;lld",
+                    "LLVM_ENABLE_RUNTIMES": "compiler-rt;libunwind",
+                }
+            ),
+            [
+                "clang",
+                "cmake",
+                "compiler-rt",
+                "libcxx",
+                "libunwind",
+                "lld",
+                "llvm",
+                "runtimes",
+                "third-party",
+            ],
+        )
+        self.assertIsNone(llvmSourceDirs({"LLVM_ENABLE_PROJECTS": "all"}))
+
+    def test_sparse_worktree_from_local_mirror(self) -> None:
+        with tempfile.TemporaryDirectory() as tmpDir:
+            upstream = Path(tmpDir) / "upstream"
+            subprocess.check_call(["git", "init", "-q", str(upstream)])
+            first = _commit(
+                upstream,
+                {
+                    "README": "",
+                    "llvm/CMakeLists.txt": "1",
+                    "clang/CMakeLists.txt": "",
+                    "bolt/CMakeLists.txt": "",
+                },
+            )
+            provider = GitSourceProvider(
+                Path(tmpDir) / "mirror.git", str(upstream)
+            )
+            provider.update()
+            checkoutDir = Path(tmpDir) / "src"
+            self.assertEqual(
+                provider.checkout(first, checkoutDir, ["llvm", "clang"]),
+                first,
+            )
+            self.assertTrue((checkoutDir / "README").exists())
+            self.assertTrue((checkoutDir / "clang/CMakeLists.txt").exists())
+            self.assertFalse((checkoutDir / "bolt").exists())
+
+            second = _commit(upstream, {"llvm/CMakeLists.txt": "2"})
+            provider.update()
+            provider.checkout(second, checkoutDir, ["llvm"])
+            self.assertEqual(
+                (checkoutDir / "llvm/CMakeLists.txt").read_text(), "2"
+            )
+            self.assertFalse((checkoutDir / "clang").exists())
+
+            # The mirror alone is enough once it exists
+            offline = GitSourceProvider(Path(tmpDir) / "mirror.git")
+            offline.checkout(first, Path(tmpDir) / "old", None)
+            self.assertTrue((Path(tmpDir) / "old/bolt").exists())
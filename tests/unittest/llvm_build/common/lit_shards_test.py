@@ -0,0 +1,69 @@
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+
+from llvm_build.common.lit_shards import (
+    LitCommand,
+    parseDiscovery,
+    parseQueryInputs,
+    splitShards,
+)
+
+_discovery = """-- Test Suites --
+  LLVM - 2 tests
+    Source Root: /llvm/test
+    Exec Root  : /build/test
+    Available Features: asserts
+    Available Substitutions: %S => /llvm/test
+                             %t => /build/test/Output
+-- Available Tests --
+  LLVM :: CodeGen/X86/add.ll
+  LLVM :: CodeGen/X86/sub.ll
+"""
+
+_query = """CMakeFiles/check-llvm:
+  input: CUSTOM_COMMAND
+    bin/FileCheck
+    bin/llc
+    | test/lit.site.cfg.py
+  outputs:
+    check-llvm
+"""
+
+
+class LitShardsTestCase(TestCase):
+    def test_parse_check_command(self) -> None:
+        with tempfile.TemporaryDirectory() as tmpDir:
+            command = LitCommand.parse(
+                f"cd {tmpDir} && /usr/bin/python3 {tmpDir}/bin/llvm-lit -sv "
+                f"--param x=1 {tmpDir}"
+            )
+            self.assertEqual(command.cwd, Path(tmpDir))
+            self.assertEqual(
+                command.lit, ["/usr/bin/python3", f"{tmpDir}/bin/llvm-lit"]
+            )
+            self.assertEqual(command.args, ["-sv", "--param", "x=1"])
+            self.assertEqual(command.paths, [tmpDir])
+        with self.assertRaises(RuntimeError):
+            LitCommand.parse("cd /build && ninja")
+
+    def test_parse_ninja_and_lit_output(self) -> None:
+        self.assertEqual(
+            parseQueryInputs(_query),
+            ["bin/FileCheck", "bin/llc", "test/lit.site.cfg.py"],
+        )
+        suites, tests = parseDiscovery(_discovery)
+        self.assertEqual(
+            suites, {"LLVM": (Path("/llvm/test"), Path("/build/test"))}
+        )
+        self.assertEqual(
+            tests, ["LLVM :: CodeGen/X86/add.ll", "LLVM :: CodeGen/X86/sub.ll"]
+        )
+
+    def test_longest_first(self) -> None:
+        times = {"a": 8.0, "b": 5.0, "c": 4.0, "d": -3.0}
+        shards = splitShards(times, ["a", "b", "c", "d", "new"], 2)
+        # "new" is assumed to take the median, 4.5 seconds
+        self.assertEqual(shards, [["a", "c"], ["b", "new", "d"]])
+        # More shards than tests
+        self.assertEqual(splitShards({}, ["a"], 4), [["a"]])
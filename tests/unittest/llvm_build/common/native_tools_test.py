@@ -0,0 +1,97 @@
+import os
+import shutil
+import subprocess
+import tempfile
+from pathlib import Path
+from unittest import TestCase, mock
+
+from llvm_build.common.native_tools import (
+    NativeToolsCache,
+    NativeToolsDefineProvider,
+)
+
+_gitEnv = {
+    **os.environ,
+    "GIT_AUTHOR_NAME": "test",
+    "GIT_AUTHOR_EMAIL": "test@example.com",
+    "GIT_COMMITTER_NAME": "test",
+    "GIT_COMMITTER_EMAIL": "test@example.com",
+}
+
+# Makes the host tools of the enabled projects, like llvm/CMakeLists.txt
+_project = """cmake_minimum_required(VERSION 3.20)
+project(fake-llvm C)
+set(CMAKE_RUNTIME_OUTPUT_DIRECTORY ${CMAKE_BINARY_DIR}/bin)
+add_executable(llvm-tblgen tool.c)
+if("clang" IN_LIST LLVM_ENABLE_PROJECTS)
+  add_executable(clang-tblgen tool.c)
+endif()
+"""
+
+
+class NativeToolsTestCase(TestCase):
+    def test_tools_built_once(self) -> None:
+        for tool in ("cmake", "ninja", "cc", "c++", "git"):
+            if shutil.which(tool) is None:
+                self.skipTest(f"{tool} not found")
+        with tempfile.TemporaryDirectory() as tmpDir:
+            root = Path(tmpDir)
+            srcDir = root / "llvm"
+            srcDir.mkdir()
+            (srcDir / "CMakeLists.txt").write_text(_project)
+            (srcDir / "tool.c").write_text("int main(void) { return 0; }\n")
+            subprocess.check_call(["git", "init", "-q", str(srcDir)])
+            subprocess.check_call(
+                ["git", "-C", str(srcDir), "add", "-A"], env=_gitEnv
+            )
+            subprocess.check_call(
+                ["git", "-C", str(srcDir), "commit", "-q", "-m", "init"],
+                env=_gitEnv,
+            )
+            crossDefines = {
+                "LLVM_ENABLE_PROJECTS": "clang;lld",
+                "CMAKE_SYSTEM_PROCESSOR": "riscv64",
+            }
+            cache = NativeToolsCache(root / "cache", srcDir, crossDefines)
+            provider = NativeToolsDefineProvider(cache)
+            # Nothing is defined before the tools are built
+            self.assertEqual(provider.getDefines(), {})
+
+            toolsDir = cache.prepare(2)
+            assert toolsDir is not None
+            defines = provider.getDefines()
+            self.assertEqual(defines["LLVM_NATIVE_TOOL_DIR"], str(toolsDir))
+            self.assertEqual(
+                defines["CLANG_TABLEGEN"], str(toolsDir / "clang-tblgen")
+            )
+            self.assertTrue(Path(defines["LLVM_TABLEGEN"]).is_file())
+            self.assertNotIn("LLVM_CONFIG_PATH", defines)
+            # The revision is looked up by the first configure only
+            with mock.patch.object(cache, "key") as key:
+                self.assertEqual(provider.getDefines(), defines)
+                key.assert_not_called()
+
+            # Another cross build of the revision reuses the tools
+            built = (toolsDir / "llvm-tblgen").stat().st_mtime_ns
+            other = NativeToolsCache(
+                root / "cache",
+                srcDir,
+                {**crossDefines, "CMAKE_SYSTEM_PROCESSOR": "aarch64"},
+            )
+            self.assertEqual(other.prepare(2), toolsDir)
+            self.assertEqual(
+                (toolsDir / "llvm-tblgen").stat().st_mtime_ns, built
+            )
+
+            # A local change is a new revision
+            (srcDir / "tool.c").write_text("int main(void) { return 1; }\n")
+            self.assertIsNone(cache.tools())
+            self.assertNotEqual(cache.prepare(2), toolsDir)
+
+    def test_not_a_checkout(self) -> None:
+        with tempfile.TemporaryDirectory() as tmpDir:
+            cache = NativeToolsCache(
+                Path(tmpDir) / "cache", Path(tmpDir) / "llvm", {}
+            )
+            self.assertIsNone(cache.prepare())
+            self.assertEqual(NativeToolsDefineProvider(cache).getDefines(), {})
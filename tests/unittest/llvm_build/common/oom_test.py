@@ -0,0 +1,83 @@
+import json
+import subprocess
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+
+from llvm_build.common.base_builders import BUILD_REPORT_NAME, CMakeBuilder
+from llvm_build.common.oom import oomCause, readOomKills
+
+# Gets OOM-killed building with more than 2 jobs, counting the kill in a
+# fake memory.events
+_fakeCMake = """#!/bin/sh
+echo "$@" >> {log}
+case "$*" in
+*"--parallel 8"*|*"--parallel 4"*)
+    kills=$(sed -n 's/^oom_kill //p' {events})
+    printf 'oom %s\\noom_kill %s\\n' 1 $((kills + 1)) > {events}
+    echo "clang++: error: unable to execute command: Killed"
+    exit 1;;
+*"--parallel 1"*)
+    echo "error: undefined symbol"
+    exit 1;;
+esac
+"""
+
+
+class OomRetryTestCase(TestCase):
+    def test_oom_cause(self) -> None:
+        self.assertIsNotNone(oomCause(1, "ld: Killed\n", 0, 1))
+        # A kill by someone else than the OOM killer
+        self.assertIsNone(oomCause(137, "", 1, 1))
+        self.assertIsNone(oomCause(1, "error: expected ';'", 0, 1))
+        self.assertIsNotNone(oomCause(137, "", None, None))
+
+    def _builder(self, root: Path, jobs: int) -> CMakeBuilder:
+        events = root / "memory.events"
+        events.write_text("low 0\noom 0\noom_kill 0\n")
+        cmake = root / "cmake"
+        cmake.write_text(
+            _fakeCMake.format(log=root / "cmake.log", events=events)
+        )
+        cmake.chmod(0o755)
+        buildDir = root / "build"
+        buildDir.mkdir()
+        (buildDir / "CMakeCache.txt").write_text(
+            "LLVM_PARALLEL_LINK_JOBS:STRING=\n"
+        )
+        builder = CMakeBuilder(root, buildDir)
+        builder.setCustomCMakePath(cmake)
+        builder.setBuildJobs(jobs)
+        builder.setOomRetries(3, events)
+        return builder
+
+    def test_resume_with_fewer_jobs(self) -> None:
+        with tempfile.TemporaryDirectory() as tmpDir:
+            root = Path(tmpDir)
+            builder = self._builder(root, 8)
+            builder.build()
+            self.assertEqual(readOomKills(root / "memory.events"), 2)
+            report = json.loads(
+                (root / "build" / BUILD_REPORT_NAME).read_text()
+            )
+            self.assertEqual(
+                [(a["jobs"], a["linkJobs"]) for a in report["attempts"]],
+                [(8, None), (4, 4), (2, 2)],
+            )
+            self.assertIsNotNone(report["attempts"][0]["oom"])
+            self.assertIn(
+                "-DLLVM_PARALLEL_LINK_JOBS=2",
+                (root / "cmake.log").read_text(),
+            )
+
+    def test_other_failures_are_not_retried(self) -> None:
+        with tempfile.TemporaryDirectory() as tmpDir:
+            root = Path(tmpDir)
+            builder = self._builder(root, 1)
+            with self.assertRaises(subprocess.CalledProcessError):
+                builder.build()
+            report = json.loads(
+                (root / "build" / BUILD_REPORT_NAME).read_text()
+            )
+            self.assertEqual(len(report["attempts"]), 1)
+            self.assertIsNone(report["attempts"][0]["oom"])
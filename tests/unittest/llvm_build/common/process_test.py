@@ -0,0 +1,127 @@
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from unittest import TestCase
+
+from llvm_build.common.process import (
+    ProcessRunner,
+    ProcessTimeoutError,
+    runSync,
+)
+
+# Writes the pid of a child it leaves running, then sleeps
+_spawnChild = (
+    "import subprocess, sys, time\n"
+    "child = subprocess.Popen([sys.executable, '-c', "
+    "'import time; time.sleep(60)'])\n"
+    "open(sys.argv[1], 'w').write(str(child.pid))\n"
+    "print('started', flush=True)\n"
+    "time.sleep(60)\n"
+)
+
+
+def _isRunning(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    # A killed child of an exited parent may linger until it is reaped
+    status = Path(f"/proc/{pid}/status")
+    return not status.exists() or "zombie" not in status.read_text()
+
+
+def _exits(pid: int) -> bool:
+    # Only the direct child is waited for; the rest of the group exits on
+    # its own after the signal
+    deadline = time.monotonic() + 5.0
+    while _isRunning(pid):
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.05)
+    return True
+
+
+class ProcessRunnerTestCase(TestCase):
+    def test_output_and_returncode(self) -> None:
+        chunks: list[bytes] = []
+        returncode = runSync(
+            ProcessRunner(
+                [sys.executable, "-c", "print('hello'); raise SystemExit(3)"],
+                stdoutSink=chunks.append,
+            ).run()
+        )
+        self.assertEqual(returncode, 3)
+        self.assertEqual(b"".join(chunks).strip(), b"hello")
+        with self.assertRaises(subprocess.CalledProcessError):
+            runSync(ProcessRunner([sys.executable, "-c", "exit(1)"]).check())
+
+    def test_inactivity_timeout_kills_group(self) -> None:
+        with tempfile.TemporaryDirectory() as tmpDir:
+            pidFile = Path(tmpDir) / "pid"
+            runner = ProcessRunner(
+                [sys.executable, "-c", _spawnChild, str(pidFile)],
+                inactivityTimeout=1.0,
+                stdoutSink=lambda _: None,
+            )
+            with self.assertRaises(ProcessTimeoutError) as context:
+                runSync(runner.run())
+            self.assertTrue(context.exception.inactivity)
+            self.assertTrue(_exits(int(pidFile.read_text())))
+
+    def test_exit_with_child_holding_pipes(self) -> None:
+        with tempfile.TemporaryDirectory() as tmpDir:
+            pidFile = Path(tmpDir) / "pid"
+            # The child inherits the pipes and outlives the command
+            script = _spawnChild.removesuffix("time.sleep(60)\n")
+            chunks: list[bytes] = []
+            start = time.monotonic()
+            returncode = runSync(
+                ProcessRunner(
+                    [sys.executable, "-c", script, str(pidFile)],
+                    inactivityTimeout=1.0,
+                    stdoutSink=chunks.append,
+                ).run()
+            )
+            self.assertEqual(returncode, 0)
+            self.assertEqual(b"".join(chunks), b"started\n")
+            self.assertLess(time.monotonic() - start, 10.0)
+            self.assertTrue(_exits(int(pidFile.read_text())))
+
+    def test_wall_timeout(self) -> None:
+        # Output keeps the inactivity timeout from firing
+        script = (
+            "import time\nwhile True: print(1, flush=True); time.sleep(0.1)"
+        )
+        runner = ProcessRunner(
+            [sys.executable, "-c", script],
+            timeout=0.5,
+            inactivityTimeout=5.0,
+            stdoutSink=lambda _: None,
+        )
+        with self.assertRaises(ProcessTimeoutError) as context:
+            runSync(runner.run())
+        self.assertFalse(context.exception.inactivity)
+
+    def test_cancellation_kills_group(self) -> None:
+        with tempfile.TemporaryDirectory() as tmpDir:
+            pidFile = Path(tmpDir) / "pid"
+
+            async def cancelWhenStarted() -> None:
+                task = asyncio.create_task(
+                    ProcessRunner(
+                        [sys.executable, "-c", _spawnChild, str(pidFile)],
+                        stdoutSink=lambda _: None,
+                    ).run()
+                )
+                while not pidFile.exists() or not pidFile.read_text():
+                    await asyncio.sleep(0.05)
+                task.cancel()
+                with self.assertRaises(asyncio.CancelledError):
+                    await task
+
+            runSync(cancelWhenStarted())
+            self.assertTrue(_exits(int(pidFile.read_text())))
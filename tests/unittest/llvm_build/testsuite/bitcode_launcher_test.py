@@ -0,0 +1,98 @@
+import sys
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+
+from llvm_build.testsuite.bitcode_launcher import (
+    DEFAULT_CODEGEN_FLAGS,
+    CompileCommand,
+    _compileFrontend,
+    _dependencies,
+)
+
+
+class CompileCommandTestCase(TestCase):
+    def test_split_arguments(self) -> None:
+        command = CompileCommand.parse(
+            [
+                "clang",
+                "-O3",
+                "-fglobal-isel",
+                "-Iinclude",
+                "-DNDEBUG",
+                "-MD",
+                "-MT",
+                "foo.o",
+                "-MF",
+                "foo.o.d",
+                "-o",
+                "foo.o",
+                "-c",
+                "foo.c",
+            ],
+            DEFAULT_CODEGEN_FLAGS,
+        )
+        assert command is not None
+        self.assertEqual(command.source, "foo.c")
+        self.assertEqual(command.output, "foo.o")
+        self.assertEqual(command.codegenArgs, ["-fglobal-isel"])
+        self.assertEqual(command.frontendArgs, ["-O3", "-Iinclude", "-DNDEBUG"])
+        self.assertEqual(command.backendArgs, ["-O3"])
+        self.assertEqual(command.depFile, "foo.o.d")
+        self.assertEqual(command.depTarget, "foo.o")
+
+    def test_passthrough(self) -> None:
+        for args in (
+            ["clang", "foo.o", "-o", "foo"],
+            ["clang", "-c", "foo.c", "bar.c"],
+            ["clang", "-E", "foo.c", "-o", "foo.i"],
+            ["clang", "-flto=thin", "-c", "foo.c", "-o", "foo.o"],
+        ):
+            self.assertIsNone(
+                CompileCommand.parse(args, DEFAULT_CODEGEN_FLAGS), args
+            )
+
+
+# Writes the arguments as the output and foo.h as the only header
+_fakeCompiler = """#!{python}
+import sys
+args = sys.argv[1:]
+with open(args[args.index("-o") + 1], "w") as f:
+    f.write(" ".join(args))
+with open(args[args.index("-MF") + 1], "w") as f:
+    f.write("foo.o: foo.c \\\\\\n  {root}/foo.h\\n")
+"""
+
+
+class FrontendCacheTestCase(TestCase):
+    def test_header_change_invalidates_bitcode(self) -> None:
+        with tempfile.TemporaryDirectory() as tmpDir:
+            root = Path(tmpDir)
+            compiler = root / "cc"
+            compiler.write_text(
+                _fakeCompiler.format(python=sys.executable, root=root)
+            )
+            compiler.chmod(0o755)
+            (root / "foo.c").write_text("int foo(void);\n")
+            (root / "foo.h").write_text("#define FOO 1\n")
+            command = CompileCommand.parse(
+                [str(compiler), "-c", str(root / "foo.c"), "-o", "foo.o"],
+                DEFAULT_CODEGEN_FLAGS,
+            )
+            assert command is not None
+            key = command.cacheKey(None)
+            cacheDir = root / "cache"
+            cacheDir.mkdir()
+            bitcode = _compileFrontend(command, cacheDir, key)
+            self.assertEqual(
+                _dependencies(cacheDir / f"{key}.d"),
+                ["foo.c", str(root / "foo.h")],
+            )
+            bitcode.write_text("cached")
+            self.assertEqual(
+                _compileFrontend(command, cacheDir, key).read_text(), "cached"
+            )
+            (root / "foo.h").write_text("#define FOO 2 /* changed */\n")
+            self.assertNotEqual(
+                _compileFrontend(command, cacheDir, key).read_text(), "cached"
+            )
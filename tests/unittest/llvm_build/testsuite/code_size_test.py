@@ -0,0 +1,55 @@
+import shutil
+import subprocess
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+
+from llvm_build.testsuite.code_size import (
+    BinaryKind,
+    CodeSizeDiff,
+    CodeSizeReport,
+    readElfSectionSizes,
+    sectionCategory,
+)
+
+
+class CodeSizeTestCase(TestCase):
+    def test_section_category(self) -> None:
+        self.assertEqual(sectionCategory(".text.main"), "text")
+        self.assertEqual(sectionCategory(".srodata.cst8"), "rodata")
+        self.assertEqual(sectionCategory(".sbss"), "bss")
+        self.assertIsNone(sectionCategory(".textual"))
+        self.assertIsNone(sectionCategory(".comment"))
+
+    def test_not_elf(self) -> None:
+        with tempfile.TemporaryDirectory() as tmpDir:
+            path = Path(tmpDir) / "script.sh"
+            path.write_text("#!/bin/sh\n")
+            self.assertIsNone(readElfSectionSizes(path))
+
+    def test_collect_and_diff(self) -> None:
+        cc = shutil.which("cc") or shutil.which("gcc")
+        if cc is None:
+            self.skipTest("C compiler not found")
+        with tempfile.TemporaryDirectory() as tmpDir:
+            root = Path(tmpDir)
+            source = root / "main.c"
+            source.write_text("int x = 1; int main(void) { return x; }\n")
+            for variant, flag in (("a", "-O0"), ("b", "-O2")):
+                buildDir = root / variant / "bench"
+                buildDir.mkdir(parents=True)
+                subprocess.check_call(
+                    [cc, flag, "-c", str(source), "-o", buildDir / "main.o"]
+                )
+                subprocess.check_call(
+                    [cc, buildDir / "main.o", "-o", buildDir / "main"]
+                )
+            baseline = CodeSizeReport.collect(root / "a", jobs=2)
+            candidate = CodeSizeReport.collect(root / "b", jobs=2)
+        kinds = {b.path: b.kind for b in baseline.binaries.values()}
+        self.assertEqual(kinds["bench/main"], BinaryKind.EXECUTABLE)
+        self.assertEqual(kinds["bench/main.o"], BinaryKind.OBJECT)
+        self.assertGreater(baseline.binaries["bench/main.o"].sizes["text"], 0)
+        self.assertEqual(baseline.binaries["bench/main.o"].sizes["data"], 4)
+        diff = CodeSizeDiff(baseline, candidate).toJson()
+        self.assertEqual(diff["executables"][0]["path"], "bench/main")
@@ -0,0 +1,93 @@
+import math
+from pathlib import Path
+from unittest import TestCase
+
+import numpy as np
+
+from llvm_build.testsuite.compare import (
+    ResultComparator,
+    compareResultSets,
+    mannWhitneyPValues,
+)
+from llvm_build.testsuite.lit_results import (
+    LitResultFile,
+    LitResultSet,
+    LitTestResult,
+)
+
+
+def _makeRun(
+    times: dict[str, float], hashes: dict[str, str] | None = None
+) -> LitResultFile:
+    tests = []
+    for name, value in times.items():
+        metrics: dict[str, float | str] = {
+            "exec_time": value,
+            "size..text": 100.0,
+        }
+        if hashes is not None:
+            metrics["hash"] = hashes[name]
+        tests.append(LitTestResult(name, "PASS", value, metrics))
+    return LitResultFile(Path("."), tests)
+
+
+class CompareTestCase(TestCase):
+    def test_mann_whitney_separated_samples(self) -> None:
+        x = np.array([[1.0, 2.0, 3.0, 4.0, 5.0], [1.0, 2.0, 3.0, 4.0, 5.0]])
+        y = np.array([[6.0, 7.0, 8.0, 9.0, 10.0], [1.0, 2.0, 3.0, 4.0, 5.0]])
+        pValues = mannWhitneyPValues(x, y)
+        self.assertLess(pValues[0], 0.05)
+        self.assertAlmostEqual(pValues[1], 1.0)
+
+    def test_mann_whitney_single_sample(self) -> None:
+        pValues = mannWhitneyPValues(
+            np.array([[1.0, np.nan]]), np.array([[2.0, 3.0]])
+        )
+        self.assertTrue(math.isnan(pValues[0]))
+
+    def test_geomean_and_hash_mismatch(self) -> None:
+        baseline = LitResultSet(
+            "sdag",
+            [
+                _makeRun({"a": 1.0, "b": 4.0}, {"a": "x", "b": "y"}),
+                _makeRun({"a": 1.0, "b": 4.0}, {"a": "x", "b": "y"}),
+            ],
+        )
+        candidate = LitResultSet(
+            "globalisel",
+            [
+                _makeRun({"a": 2.0, "b": 2.0}, {"a": "x", "b": "z"}),
+                _makeRun({"a": 2.0, "b": 2.0}, {"a": "x", "b": "z"}),
+            ],
+        )
+        report = compareResultSets(
+            [baseline, candidate], ResultComparator(seed=0)
+        )
+        result = report.candidates[0]
+        self.assertAlmostEqual(result.metrics["exec_time"].geomean, 1.0)
+        self.assertAlmostEqual(result.metrics["size..text"].geomean, 1.0)
+        self.assertEqual(result.hashMismatches, ["b"])
+        self.assertIn("globalisel vs sdag", report.formatTable())
+        self.assertEqual(
+            report.toJson()["candidates"]["globalisel"]["hashMismatches"],
+            ["b"],
+        )
+
+    def test_many_tests(self) -> None:
+        rng = np.random.default_rng(0)
+        names = [f"test-{i}" for i in range(3000)]
+        baseRuns = [
+            _makeRun(dict(zip(names, rng.random(3000) + 1, strict=True)))
+            for _ in range(5)
+        ]
+        candRuns = [
+            _makeRun(dict(zip(names, rng.random(3000) + 1, strict=True)))
+            for _ in range(5)
+        ]
+        report = compareResultSets(
+            [LitResultSet("a", baseRuns), LitResultSet("b", candRuns)],
+            ResultComparator(seed=0),
+        )
+        self.assertTrue(report.candidates[0].metrics)
+        for comparison in report.candidates[0].metrics.values():
+            self.assertEqual(comparison.pValues.shape, (3000,))
@@ -0,0 +1,47 @@
+import json
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+
+from llvm_build.testsuite.compile_time import (
+    aggregateTimeTraces,
+    parseTimeTrace,
+)
+
+
+def _event(name: str, dur: int, detail: str | None = None) -> dict:
+    event: dict = {"ph": "X", "name": name, "dur": dur, "ts": 0}
+    if detail is not None:
+        event["args"] = {"detail": detail}
+    return event
+
+
+class TimeTraceTestCase(TestCase):
+    def test_phases_passes_and_isel(self) -> None:
+        trace = {
+            "traceEvents": [
+                _event("Total Frontend", 2_000_000),
+                _event("Total Backend", 1_000_000),
+                _event("Total RunPass", 900_000),
+                _event("RunPass", 300_000, "IRTranslator"),
+                _event("RunPass", 200_000, "InstructionSelect"),
+                _event("RunPass", 100_000, "Machine Instruction Scheduler"),
+                _event("InstCombinePass", 50_000, "main"),
+                _event("Source", 10_000, "a.h"),
+            ]
+        }
+        with tempfile.TemporaryDirectory() as tmpDir:
+            paths = []
+            for i in range(2):
+                path = Path(tmpDir) / f"t{i}.json"
+                path.write_text(json.dumps(trace))
+                paths.append(path)
+            single = parseTimeTrace(paths[0])
+            total = aggregateTimeTraces(paths, jobs=2)
+        self.assertEqual(single.phases, {"Frontend": 2.0, "Backend": 1.0})
+        self.assertAlmostEqual(single.instructionSelection, 0.5)
+        self.assertNotIn("Source", single.passes)
+        self.assertAlmostEqual(total.passes["InstCombinePass"], 0.1)
+        self.assertEqual(total.traces, 2)
+        names = {r.name for r in total.toLitResults()}
+        self.assertIn("compile-time :: InstructionSelection", names)
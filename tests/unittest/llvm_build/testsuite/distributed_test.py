@@ -0,0 +1,114 @@
+import shutil
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+
+from llvm_build.common.executors import FakeSSHExecutor
+from llvm_build.common.lit_shards import TIMES_NAME, readTestTimes
+from llvm_build.common.process import runSync
+from llvm_build.testsuite.distributed import DistributedLitRun
+from llvm_build.testsuite.runner import LitRunner
+
+# Like those CMake writes, the site configuration hardcodes absolute paths
+_siteConfig = """config.test_source_root = "{buildDir}"
+config.test_exec_root = "{buildDir}"
+lit_config.load_config(config, "{litConfig}")
+"""
+_litConfig = """import lit.formats
+config.name = "test-suite"
+config.test_format = lit.formats.ShTest()
+config.suffixes = [".test"]
+"""
+
+
+class _UnreachableExecutor(FakeSSHExecutor):
+    def _shell(self) -> list[str]:
+        return ["false"]
+
+
+def _makeBuildDir(buildDir: Path, srcDir: Path) -> None:
+    buildDir.mkdir()
+    srcDir.mkdir()
+    litConfig = srcDir / "lit.cfg"
+    litConfig.write_text(_litConfig)
+    (buildDir / "lit.site.cfg").write_text(
+        _siteConfig.format(buildDir=buildDir, litConfig=litConfig)
+    )
+    for name, status in (("pass1", 0), ("pass2", 0), ("fail", 1)):
+        testDir = buildDir / "SingleSource" / name
+        testDir.mkdir(parents=True)
+        program = testDir / name
+        program.write_text(f"#!/bin/sh\nexit {status}\n")
+        program.chmod(0o755)
+        (testDir / f"{name}.test").write_text(f"RUN: %S/{name}\n")
+        (testDir / f"{name}.o").write_text("")
+
+
+class DistributedLitRunTestCase(TestCase):
+    def test_shards_on_fake_hosts(self) -> None:
+        lit = shutil.which("lit")
+        if lit is None:
+            self.skipTest("lit not found")
+        with tempfile.TemporaryDirectory() as tmpDir:
+            root = Path(tmpDir).resolve()
+            buildDir = root / "build"
+            _makeBuildDir(buildDir, root / "src")
+            hosts = [
+                FakeSSHExecutor(root / "board0"),
+                _UnreachableExecutor(root / "board1"),
+                FakeSSHExecutor(root / "board2"),
+            ]
+            run = DistributedLitRun(buildDir, hosts, lit, ["-v"])
+            results = runSync(
+                run.run(
+                    root / "results.json",
+                    sorted(buildDir.rglob("*.test")),
+                )
+            )
+            self.assertEqual(
+                {name: test.code for name, test in results.tests.items()},
+                {
+                    "test-suite :: SingleSource/fail/fail.test": "FAIL",
+                    "test-suite :: SingleSource/pass1/pass1.test": "PASS",
+                    "test-suite :: SingleSource/pass2/pass2.test": "PASS",
+                },
+            )
+            # The shard of the unreachable board ran on the others
+            self.assertEqual(
+                {test.extra["host"] for test in results.tests.values()},
+                {hosts[0].name, hosts[2].name},
+            )
+            # Boards only receive the files their tests refer to
+            mirrored = hosts[0].remotePath(buildDir)
+            self.assertTrue((mirrored / "lit.site.cfg").is_file())
+            self.assertTrue(hosts[0].remotePath(root / "src/lit.cfg").is_file())
+            self.assertFalse(any(mirrored.rglob("*.o")))
+            self.assertLess(
+                readTestTimes(buildDir / TIMES_NAME)[
+                    "SingleSource/fail/fail.test"
+                ],
+                0,
+            )
+
+    def test_runner_merges_counters(self) -> None:
+        lit = shutil.which("lit")
+        if lit is None:
+            self.skipTest("lit not found")
+        with tempfile.TemporaryDirectory() as tmpDir:
+            root = Path(tmpDir).resolve()
+            buildDir = root / "build"
+            _makeBuildDir(buildDir, root / "src")
+            program = buildDir / "SingleSource" / "pass1" / "pass1"
+            program.write_text(
+                "#!/bin/sh\nprintf '5,,instructions:u\\n' > \"$0.perfstat\"\n"
+            )
+            runner = LitRunner(buildDir, litPath=Path(lit))
+            runner.setExecutors([FakeSSHExecutor(root / "board0")])
+            results = runner.run(root / "results.json")
+            self.assertEqual(
+                results.tests[
+                    "test-suite :: SingleSource/pass1/pass1.test"
+                ].metrics["perf..instructions"],
+                5.0,
+            )
+            self.assertFalse(any(buildDir.rglob("*.perfstat")))
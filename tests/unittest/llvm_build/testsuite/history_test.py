@@ -0,0 +1,96 @@
+import json
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+
+from llvm_build.testsuite.history import HistoryDatabase, detectChangePoints
+
+
+class HistoryDatabaseTestCase(TestCase):
+    _tmpDir: tempfile.TemporaryDirectory
+    _db: HistoryDatabase
+
+    def setUp(self) -> None:
+        self._tmpDir = tempfile.TemporaryDirectory()
+        self._db = HistoryDatabase(":memory:")
+
+    def tearDown(self) -> None:
+        self._db.close()
+        self._tmpDir.cleanup()
+
+    def _ingestNight(self, day: int, execTime: float, hash: str) -> None:
+        path = Path(self._tmpDir.name) / f"results-{day}.json"
+        report = {
+            "tests": [
+                {
+                    "name": "test-suite :: a.test",
+                    "code": "PASS",
+                    "metrics": {"exec_time": execTime, "hash": hash},
+                }
+            ]
+        }
+        path.write_text(json.dumps(report))
+        self._db.ingestLitResults(
+            path, f"2026-01-{day:02d}", "sdag", f"clang-{day}"
+        )
+
+    def test_trend_and_bisect(self) -> None:
+        for day in range(1, 21):
+            self._ingestNight(day, 1.0 if day < 13 else 1.5, "x")
+        series = list(
+            self._db.trend("test-suite :: a.test", "exec_time", "sdag")
+        )
+        self.assertEqual(len(series), 20)
+        self.assertEqual(series[0].fingerprints, "clang-1")
+        self.assertEqual(
+            self._db.firstBadNight("test-suite :: a.test", "exec_time", "sdag"),
+            "2026-01-13",
+        )
+        changes = self._db.changePoints(
+            "test-suite :: a.test", "exec_time", "sdag"
+        )
+        self.assertEqual([after.date for _, after in changes], ["2026-01-13"])
+
+    def test_bisect_hash(self) -> None:
+        for day in range(1, 10):
+            self._ingestNight(day, 1.0, "x" if day < 4 else "y")
+        self.assertEqual(
+            self._db.firstBadNight("test-suite :: a.test", "hash", "sdag"),
+            "2026-01-04",
+        )
+
+    def test_reingest_replaces_samples(self) -> None:
+        self._ingestNight(1, 1.0, "x")
+        self._ingestNight(1, 2.0, "x")
+        series = list(
+            self._db.trend("test-suite :: a.test", "exec_time", "sdag")
+        )
+        self.assertEqual([(p.value, p.count) for p in series], [(2.0, 1)])
+
+    def test_failed_ingestion_forgets_its_ids(self) -> None:
+        path = Path(self._tmpDir.name) / "broken.json"
+        path.write_text(
+            json.dumps(
+                {
+                    "tests": [
+                        {"name": "test-suite :: b.test", "elapsed": 1.0},
+                        {"elapsed": 2.0},
+                    ]
+                }
+            )
+        )
+        with self.assertRaises(KeyError):
+            self._db.ingestLitResults(path, "2026-01-01", "sdag", "clang-1")
+        # Takes the id b.test had in the rolled back transaction
+        self._ingestNight(2, 1.0, "x")
+        path.write_text(
+            json.dumps(
+                {"tests": [{"name": "test-suite :: b.test", "elapsed": 3.0}]}
+            )
+        )
+        self._db.ingestLitResults(path, "2026-01-03", "sdag", "clang-3")
+        series = list(self._db.trend("test-suite :: b.test", "elapsed", "sdag"))
+        self.assertEqual([p.value for p in series], [3.0])
+
+    def test_change_points_of_flat_series(self) -> None:
+        self.assertEqual(detectChangePoints([1.0, 1.01, 0.99] * 10), [])
@@ -0,0 +1,47 @@
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+
+from llvm_build.testsuite.lit_results import LitResultFile, LitTestResult
+from llvm_build.testsuite.perf_counters import (
+    mergePerfCounters,
+    parsePerfStatCsv,
+)
+
+_perfOutput = """# started on Mon Oct 19 10:00:00 2026
+
+1234.56,msec,task-clock:u,1234560000,100.00,0.999,CPUs utilized
+<not supported>,,cycles:u,0,100.00,,
+5000000,,instructions:u,1234560000,100.00,,
+<not counted>,,cache-misses:u,0,0.00,,
+"""
+
+
+class PerfCountersTestCase(TestCase):
+    def test_parse_csv(self) -> None:
+        self.assertEqual(
+            parsePerfStatCsv(_perfOutput),
+            {"task-clock": 1234.56, "instructions": 5000000.0},
+        )
+
+    def test_merge_into_results(self) -> None:
+        with tempfile.TemporaryDirectory() as tmpDir:
+            buildDir = Path(tmpDir)
+            (buildDir / "SingleSource").mkdir()
+            statFile = buildDir / "SingleSource" / "foo.perfstat"
+            statFile.write_text(_perfOutput)
+            results = LitResultFile(
+                buildDir,
+                [
+                    LitTestResult(
+                        "test-suite :: SingleSource/foo.test", "PASS"
+                    ),
+                    LitTestResult(
+                        "test-suite :: SingleSource/bar.test", "PASS"
+                    ),
+                ],
+            )
+            self.assertEqual(mergePerfCounters(results, buildDir), 1)
+            self.assertFalse(statFile.exists())
+        metrics = results.tests["test-suite :: SingleSource/foo.test"].metrics
+        self.assertEqual(metrics["perf..instructions"], 5000000.0)
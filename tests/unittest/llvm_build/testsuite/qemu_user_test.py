@@ -0,0 +1,50 @@
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+
+from llvm_build.testsuite.lit_results import LitResultFile, LitTestResult
+from llvm_build.testsuite.qemu_user import (
+    INSTRUCTIONS_METRIC,
+    isUserModeEmulationBuild,
+    mergeInstructionCounts,
+    parseInsnLog,
+)
+
+
+class QemuUserTestCase(TestCase):
+    def test_parse_insn_log(self) -> None:
+        self.assertEqual(parseInsnLog("insns: 1234\n"), 1234)
+        self.assertEqual(
+            parseInsnLog("cpu 0 insns: 10\ncpu 1 insns: 20\ntotal insns: 30\n"),
+            30,
+        )
+        self.assertIsNone(parseInsnLog(""))
+
+    def test_merge_into_results(self) -> None:
+        with tempfile.TemporaryDirectory() as tmpDir:
+            buildDir = Path(tmpDir)
+            (buildDir / "SingleSource").mkdir()
+            (buildDir / "SingleSource" / "foo.qemu-insn").write_text(
+                "insns: 42\n"
+            )
+            name = "test-suite :: SingleSource/foo.test"
+            results = LitResultFile(
+                buildDir,
+                [LitTestResult(name, "PASS", metrics={"exec_time": 9.0})],
+            )
+            self.assertEqual(mergeInstructionCounts(results, buildDir), 1)
+            self.assertEqual(
+                results.tests[name].metrics, {INSTRUCTIONS_METRIC: 42.0}
+            )
+            self.assertFalse(
+                (buildDir / "SingleSource" / "foo.qemu-insn").exists()
+            )
+
+    def test_detect_build(self) -> None:
+        with tempfile.TemporaryDirectory() as tmpDir:
+            buildDir = Path(tmpDir)
+            self.assertFalse(isUserModeEmulationBuild(buildDir))
+            (buildDir / "CMakeCache.txt").write_text(
+                "TEST_SUITE_USER_MODE_EMULATION:BOOL=ON\n"
+            )
+            self.assertTrue(isUserModeEmulationBuild(buildDir))
@@ -0,0 +1,72 @@
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+
+from llvm_build.testsuite.lit_results import LitTestResult
+from llvm_build.testsuite.result_cache import ResultCache, resultCacheKey
+from llvm_build.testsuite.runner import LitRunner
+
+
+def _writeTest(buildDir: Path) -> Path:
+    testDir = buildDir / "SingleSource"
+    testDir.mkdir()
+    (testDir / "foo").write_bytes(b"\x7fELF v1")
+    (testDir / "foo.reference_output").write_text("42\n")
+    testFile = testDir / "foo.test"
+    testFile.write_text(
+        f"RUN: cd {testDir} ; {testDir}/foo < %S/foo.reference_output\n"
+        f"VERIFY: diff foo.out foo.reference_output\n"
+    )
+    return testFile
+
+
+class ResultCacheTestCase(TestCase):
+    def test_key_follows_referenced_files(self) -> None:
+        with tempfile.TemporaryDirectory() as tmpDir:
+            buildDir = Path(tmpDir)
+            testFile = _writeTest(buildDir)
+            key = resultCacheKey(buildDir, testFile)
+            self.assertEqual(key, resultCacheKey(buildDir, testFile))
+            (buildDir / "SingleSource" / "foo").write_bytes(b"\x7fELF v2")
+            changed = resultCacheKey(buildDir, testFile)
+            self.assertNotEqual(key, changed)
+            (buildDir / "SingleSource" / "foo.reference_output").write_text(
+                "43\n"
+            )
+            self.assertNotEqual(changed, resultCacheKey(buildDir, testFile))
+
+    def test_store_drops_timings(self) -> None:
+        with tempfile.TemporaryDirectory() as tmpDir:
+            cache = ResultCache(Path(tmpDir))
+            self.assertIsNone(cache.lookup("ab" * 32))
+            cache.store(
+                "ab" * 32,
+                LitTestResult(
+                    "test-suite :: SingleSource/foo.test",
+                    "PASS",
+                    1.5,
+                    {"exec_time": 1.0, "perf..cycles": 3.0, "hash": "f00"},
+                ),
+            )
+            cached = cache.lookup("ab" * 32)
+            assert cached is not None
+            self.assertEqual(cached.code, "PASS")
+            self.assertIsNone(cached.elapsed)
+            self.assertEqual(cached.metrics, {"hash": "f00"})
+
+    def test_runner_reuses_results(self) -> None:
+        with tempfile.TemporaryDirectory() as tmpDir:
+            buildDir = Path(tmpDir) / "build"
+            buildDir.mkdir()
+            testFile = _writeTest(buildDir)
+            cache = ResultCache(Path(tmpDir) / "cache")
+            name = "test-suite :: SingleSource/foo.test"
+            cache.store(
+                resultCacheKey(buildDir, testFile), LitTestResult(name, "FAIL")
+            )
+            # Every test is cached, so lit is never looked up
+            runner = LitRunner(buildDir, litPath=Path(tmpDir) / "no-lit")
+            runner.setResultCache(cache)
+            results = runner.run(Path(tmpDir) / "results.json")
+            self.assertEqual(results.tests[name].code, "FAIL")
+            self.assertTrue(results.tests[name].extra["reused"])